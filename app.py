@@ -1,16 +1,48 @@
 # app.py - Application Flask principale mise à jour
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
 from config import Config
-from models import db, User, Competition, Voie, Circle, Level, Categorie
+from models import db, migrate, User, Competition, Voie, Circle, Level, Categorie, CompetitionCategorie, NIVEAUX_DEFAUT, CATEGORIES_DEFAUT
 from routes import register_routes
+from classement import reconstruire_scores, recalculer_categories, publier_versions_en_attente
+from codes_connexion import cache_codes
+from catalogue import catalogue_voies
+from instantane import instantanes
+from instrumentation import instrumentation_sql
+from statistiques import statistiques
+from base_donnees import profil_base
+from lecture import routage_lecture
+from images import traiter_image_voie
+from taches import file_taches
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from flask_migrate import stamp
+from generateur import generer_competition
+from plans_requetes import verifier_plans
+from moteur_classement import charger_matrice, classer, ecarts_sql
+from datetime import date
+import click
 import os
+import time
 
-def create_app():
+DOSSIER_MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+REVISION_INITIALE = '0001'  # Schéma des bases créées par db.create_all avant les migrations
+
+def create_app(config=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config:
+        app.config.update(config)
     
-    # Initialiser la base de données
+    # Initialiser la base de données (options du moteur et base de lecture fixées avant leur création)
+    profil_base.init_app(app)
+    routage_lecture.init_app(app)
     db.init_app(app)
+    migrate.init_app(app, db, directory=DOSSIER_MIGRATIONS, render_as_batch=True)
+    cache_codes.init_app(app)
+    catalogue_voies.init_app(app)
+    instantanes.init_app(app)
+    instrumentation_sql.init_app(app)
+    statistiques.init_app(app)
+    file_taches.init_app(app)
     
     # Enregistrer les routes
     register_routes(app)
@@ -41,7 +73,9 @@ def create_app():
     @app.route('/classement/<int:competition_id>')
     def classement_public(competition_id):
         competition = Competition.query.get_or_404(competition_id)
-        return render_template('public/classement-display.html', competition=competition)
+        # Le jeton d'affichage (?jeton=) est transmis tel quel au flux, qui le vérifie
+        return render_template('public/classement-display.html', competition=competition,
+                               jeton=request.args.get('jeton'))
     
     # Pages pour grimpeurs
     @app.route('/grimpeur/dashboard')
@@ -88,10 +122,17 @@ def create_app():
             return redirect(url_for('login'))
         return render_template('admin/users.html')
     
-    # Créer les tables et données initiales
-    @app.before_first_request
+    # Créer les tables et données initiales (before_first_request n'existe plus depuis Flask 2.3)
     def create_tables():
-        db.create_all()
+        # Base vide : schéma complet, marqué à jour ; base créée avant les migrations : marquée au
+        # schéma initial, le reste passe par flask db upgrade
+        tables = set(db.inspect(db.engine).get_table_names())
+        if not tables:
+            db.create_all(bind_key=None)  # Base principale seulement : la base de lecture en est une copie
+            stamp(directory=DOSSIER_MIGRATIONS)
+        elif 'alembic_version' not in tables:
+            stamp(directory=DOSSIER_MIGRATIONS, revision=REVISION_INITIALE)
+            print("Base antérieure aux migrations : lancer flask db upgrade")
         
         # Créer un admin par défaut si aucun n'existe
         if not User.query.filter_by(role='admin').first():
@@ -108,46 +149,108 @@ def create_app():
             db.session.add(admin)
             
             # Créer des niveaux par défaut
-            niveaux = [
-                ('3a', 100), ('3b', 120), ('3c', 140),
-                ('4a', 160), ('4b', 180), ('4c', 200),
-                ('5a', 250), ('5b', 300), ('5c', 350),
-                ('6a', 400), ('6b', 450), ('6c', 500),
-                ('7a', 600), ('7b', 700), ('7c', 800)
-            ]
-            
-            for nom, score in niveaux:
+            for nom, score in NIVEAUX_DEFAUT:
                 level = Level(nom=nom, score=score)
                 db.session.add(level)
             
             # Créer des catégories par défaut
-            categories = [
-                ('Microbe M', 6, 8, 'masculin'),
-                ('Microbe F', 6, 8, 'feminin'),
-                ('Poussin M', 9, 10, 'masculin'),
-                ('Poussin F', 9, 10, 'feminin'),
-                ('Benjamin M', 11, 12, 'masculin'),
-                ('Benjamin F', 11, 12, 'feminin'),
-                ('Minime M', 13, 14, 'masculin'),
-                ('Minime F', 13, 14, 'feminin'),
-                ('Cadet M', 15, 16, 'masculin'),
-                ('Cadet F', 15, 16, 'feminin'),
-                ('Junior M', 17, 19, 'masculin'),
-                ('Junior F', 17, 19, 'feminin'),
-                ('Senior M', 20, 39, 'masculin'),
-                ('Senior F', 20, 39, 'feminin'),
-                ('Vétéran M', 40, 99, 'masculin'),
-                ('Vétéran F', 40, 99, 'feminin'),
-                ('Mixte', 6, 99, 'mixte')
-            ]
-            
-            for nom, annee_min, annee_max, genre in categories:
+            for nom, annee_min, annee_max, genre in CATEGORIES_DEFAUT:
                 cat = Categorie(nom=nom, annee_min=annee_min, annee_max=annee_max, genre=genre)
                 db.session.add(cat)
             
             db.session.commit()
             print(f"Admin créé avec le code: {admin.code_connexion}")
     
+    with app.app_context():
+        create_tables()
+    
+    # Commandes CLI
+    @app.cli.command('rebuild-scores')
+    @click.option('--competition', 'competition_id', type=int, default=None,
+                  help='Compétition à régénérer (toutes par défaut)')
+    def rebuild_scores(competition_id):
+        """Régénère le classement matérialisé à partir des validations"""
+        nb_lignes = reconstruire_scores(competition_id)
+        print(f"{nb_lignes} lignes de classement régénérées")
+    
+    @app.cli.command('recompute-categories')
+    @click.option('--competition', 'competition_id', type=int, default=None,
+                  help='Compétition à recalculer (toutes par défaut)')
+    def recompute_categories(competition_id):
+        """Réassigne les catégories des inscrits après modification des catégories"""
+        nb_inscriptions = recalculer_categories(competition_id)
+        print(f"Catégories recalculées pour {nb_inscriptions} inscriptions")
+    
+    @app.cli.command('process-images')
+    def process_images():
+        """Génère les variantes des images de voies uploadées avant le traitement automatique"""
+        nb_voies = 0
+        for voie in Voie.query.filter(Voie.image_path.isnot(None), Voie.image_hash.is_(None)).all():
+            chemin = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(voie.image_path))
+            if not os.path.exists(chemin):
+                print(f"Image introuvable pour la voie {voie.id}: {voie.image_path}")
+                continue
+            traiter_image_voie(voie.id, os.path.basename(voie.image_path))
+            nb_voies += 1
+        print(f"Images traitées pour {nb_voies} voies")
+    
+    @app.cli.command('generate-competition')
+    @click.option('--grimpeurs', 'nb_grimpeurs', type=int, default=300, help='Nombre de grimpeurs inscrits')
+    @click.option('--voies', 'nb_voies', type=int, default=40, help='Nombre de voies')
+    @click.option('--seed', 'graine', type=int, default=None, help='Graine du générateur (jeu reproductible)')
+    def generate_competition(nb_grimpeurs, nb_voies, graine):
+        """Crée une compétition synthétique (grimpeurs, voies, inscriptions, validations)"""
+        resume = generer_competition(nb_grimpeurs, nb_voies, graine=graine)
+        print(f"Compétition {resume['competition_id']} : {resume['nb_grimpeurs']} grimpeurs, "
+              f"{resume['nb_voies']} voies, {resume['nb_validations']} validations ({resume['duree_s']} s)")
+    
+    @app.cli.command('check-ranking')
+    @click.option('--competition', 'competition_id', type=int, required=True)
+    @click.option('--repetitions', type=int, default=20, help='Calculs chronométrés')
+    def check_ranking(competition_id, repetitions):
+        """Compare le moteur de classement au calcul SQL des scores et le chronomètre (code de sortie 1 si écart)"""
+        debut = time.perf_counter()
+        matrice = charger_matrice(competition_id)
+        chargement = time.perf_counter() - debut
+        
+        durees = []
+        for _ in range(repetitions):
+            debut = time.perf_counter()
+            resultat = classer(matrice, app.config['CLASSEMENT_DEPARTAGES'])
+            durees.append(time.perf_counter() - debut)
+        durees.sort()
+        
+        print(f"{len(matrice.grimpeurs_ids)} grimpeurs x {len(matrice.voies_ids)} voies : "
+              f"chargement {chargement * 1000:.1f} ms, classement médian {durees[len(durees) // 2] * 1000:.2f} ms "
+              f"(max {durees[-1] * 1000:.2f} ms)")
+        
+        ecarts = ecarts_sql(competition_id, resultat)
+        for grimpeur_id, total_sql, total, nb_sql, nb in ecarts[:20]:
+            print(f"ÉCART grimpeur {grimpeur_id} : SQL {total_sql} ({nb_sql} voies), moteur {total} ({nb} voies)")
+        if ecarts:
+            raise SystemExit(1)
+        print("Totaux identiques au calcul SQL")
+    
+    @app.cli.command('check-query-plans')
+    def check_query_plans():
+        """Vérifie que les requêtes fréquentes passent par leurs index (code de sortie 1 sinon)"""
+        resultats = verifier_plans()
+        for nom, index_attendus, plan, conforme in resultats:
+            print(f"{'OK' if conforme else 'ÉCHEC'} {nom} (attendu: {', '.join(index_attendus)})")
+            if not conforme:
+                print('    ' + plan.replace('\n', '\n    '))
+        if not all(conforme for _, _, _, conforme in resultats):
+            raise SystemExit(1)
+    
+    # Reprendre les tâches de fond interrompues par un arrêt du serveur, et publier les versions
+    # de classement restées en attente (arrêt entre le commit d'une écriture et sa publication)
+    with app.app_context():
+        try:
+            file_taches.reprendre()
+            publier_versions_en_attente()
+        except (OperationalError, ProgrammingError):
+            db.session.rollback()  # Tables pas encore créées
+    
     return app
 
 if __name__ == '__main__':
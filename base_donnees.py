@@ -0,0 +1,131 @@
+# base_donnees.py - Profils du moteur SQLAlchemy (SQLite WAL, PostgreSQL en pool) et reprise des écritures
+import logging
+import random
+import sqlite3
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError, DBAPIError
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# Codes PostgreSQL d'une transaction à rejouer : sérialisation, interblocage, lock_timeout
+CODES_PG_REPRISE = {'40001', '40P01', '55P03'}
+
+def profil_uri(uri):
+    """Profil déduit du schéma de l'URI : 'sqlite', 'postgresql' ou None"""
+    schema = uri.split(':', 1)[0].split('+', 1)[0].lower()
+    if schema == 'sqlite':
+        return 'sqlite'
+    if schema in ('postgresql', 'postgres'):
+        return 'postgresql'
+    return None
+
+def base_occupee(erreur):
+    """Vrai si l'erreur signale une base momentanément occupée (transaction à rejouer)"""
+    if not isinstance(erreur, DBAPIError):
+        return False
+    if getattr(erreur.orig, 'pgcode', None) in CODES_PG_REPRISE:
+        return True
+    message = str(erreur.orig).lower()
+    return 'database is locked' in message or 'database table is locked' in message
+
+class ProfilBase:
+    """Options du moteur selon la base, et reprise bornée des transactions d'écriture
+    
+    - SQLite : WAL (lecteurs et écrivain ne se bloquent plus), busy_timeout, synchronous=NORMAL
+      (sûr en WAL, fsync au checkpoint seulement), mmap et cache de pages, appliqués à chaque connexion
+    - PostgreSQL : pool dimensionné par worker, pre-ping, recyclage, statement_timeout et lock_timeout
+    
+    Le profil est choisi par BASE_PROFIL ('sqlite', 'postgresql', 'aucun') ou déduit de l'URI.
+    Les options explicites de SQLALCHEMY_ENGINE_OPTIONS restent prioritaires.
+    """
+    
+    def __init__(self):
+        self.profil = None
+        self.busy_timeout = 5000
+        self.mmap = 256 * 1024 * 1024
+        self.cache_ko = 64000
+        self.reprises = 5
+        self.delai_reprise = 0.02
+        self._ecoute = False
+    
+    def init_app(self, app):
+        """À appeler avant db.init_app : les moteurs sont créés avec ces options"""
+        profil = app.config.get('BASE_PROFIL') or profil_uri(app.config['SQLALCHEMY_DATABASE_URI'])
+        self.profil = None if profil == 'aucun' else profil
+        self.busy_timeout = app.config.get('SQLITE_BUSY_TIMEOUT_MS', self.busy_timeout)
+        self.mmap = app.config.get('SQLITE_MMAP_OCTETS', self.mmap)
+        self.cache_ko = app.config.get('SQLITE_CACHE_KO', self.cache_ko)
+        self.reprises = app.config.get('BASE_REPRISES', self.reprises)
+        self.delai_reprise = app.config.get('BASE_REPRISE_DELAI', self.delai_reprise)
+        
+        options = self.options(app.config)
+        options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+        
+        if self.profil == 'sqlite' and not self._ecoute:
+            event.listen(Engine, 'connect', self._pragmas_sqlite)
+            self._ecoute = True
+    
+    def options(self, config):
+        if self.profil == 'sqlite':
+            # Le délai du pilote sqlite3 (secondes) arme aussi son busy handler
+            return {'connect_args': {'timeout': self.busy_timeout / 1000}}
+        
+        if self.profil == 'postgresql':
+            parametres = [
+                f"-c statement_timeout={config.get('PG_STATEMENT_TIMEOUT_MS', 10000)}",
+                f"-c lock_timeout={config.get('PG_LOCK_TIMEOUT_MS', 3000)}",
+                f"-c idle_in_transaction_session_timeout={config.get('PG_IDLE_TRANSACTION_TIMEOUT_MS', 60000)}"
+            ]
+            return {
+                'pool_size': config.get('PG_POOL_TAILLE', 10),
+                'max_overflow': config.get('PG_POOL_DEBORDEMENT', 20),
+                'pool_timeout': config.get('PG_POOL_ATTENTE', 10),
+                'pool_recycle': config.get('PG_POOL_RECYCLAGE', 1800),
+                'pool_pre_ping': True,
+                'connect_args': {
+                    'options': ' '.join(parametres),
+                    'application_name': config.get('PG_APPLICATION', 'escalade')
+                }
+            }
+        
+        return {}
+    
+    def _pragmas_sqlite(self, dbapi_connection, connection_record):
+        if self.profil != 'sqlite' or not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        curseur = dbapi_connection.cursor()
+        try:
+            try:
+                curseur.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.OperationalError:
+                pass  # Connexion en lecture seule (lecture.py) : le mode est fixé par l'écrivain
+            curseur.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+            curseur.execute("PRAGMA synchronous=NORMAL")
+            curseur.execute(f"PRAGMA mmap_size={int(self.mmap)}")
+            curseur.execute(f"PRAGMA cache_size=-{int(self.cache_ko)}")
+            curseur.execute("PRAGMA temp_store=MEMORY")
+        finally:
+            curseur.close()
+    
+    def ecrire(self, transaction, *args, **kwargs):
+        """Exécute une transaction d'écriture (fonction qui se termine par un commit)
+        
+        Si la base est occupée, la transaction est annulée puis rejouée, au plus `reprises` fois,
+        après une attente exponentielle avec gigue. En WAL, une transaction ouverte par des lectures
+        reçoit cette erreur sans attendre le busy_timeout quand un autre écrivain a commité entre-temps.
+        """
+        for tentative in range(self.reprises + 1):
+            try:
+                return transaction(*args, **kwargs)
+            except OperationalError as e:
+                db.session.rollback()
+                if not base_occupee(e) or tentative == self.reprises:
+                    raise
+                logger.info("Base occupée, nouvelle tentative (%d/%d)", tentative + 1, self.reprises)
+                time.sleep(self.delai_reprise * 2 ** tentative * (0.5 + random.random()))
+
+profil_base = ProfilBase()
@@ -0,0 +1,330 @@
+# benchmark.py - Mesure des endpoints critiques sur des compétitions synthétiques
+#
+# Lancement :
+#   python benchmark.py --tailles 100,1000,5000 --voies 40 --requetes 300
+#   python benchmark.py --mode http --threads 16 --sortie resultats.json
+#   python benchmark.py --stress-ecritures --processus 4 --threads 8 --requetes 200
+#
+# Pour chaque taille, une base SQLite temporaire est remplie par generateur.py, puis chaque
+# endpoint est appelé --requetes fois : via le client de test Flask (mode "client", un seul
+# thread, mesure le coût applicatif) ou via un serveur HTTP local interrogé par --threads
+# clients concurrents (mode "http", inclut la contention entre requêtes).
+# --stress-ecritures lance plusieurs processus qui valident en parallèle sur la même base, pour
+# comparer les profils de moteur (base_donnees.py) : erreurs "database is locked", latences, débit.
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.cookiejar import CookieJar
+
+from werkzeug.serving import make_server
+
+from app import create_app
+from catalogue import catalogue_voies
+from codes_connexion import cache_codes
+from generateur import generer_competition
+from instantane import instantanes
+from models import db, Circle, CompetitionVoie
+
+ENDPOINTS = ['login', 'validate', 'voies_list', 'classement']
+
+def percentile(valeurs, p):
+    """Percentile par interpolation linéaire (valeurs triées)"""
+    if not valeurs:
+        return None
+    rang = (len(valeurs) - 1) * p / 100
+    bas = int(rang)
+    haut = min(bas + 1, len(valeurs) - 1)
+    return valeurs[bas] + (valeurs[haut] - valeurs[bas]) * (rang - bas)
+
+def resume(endpoint, durees, erreurs, duree_totale):
+    durees = sorted(durees)
+    return {
+        'endpoint': endpoint,
+        'requetes': len(durees) + erreurs,
+        'erreurs': erreurs,
+        'p50_ms': round(percentile(durees, 50) * 1000, 2) if durees else None,
+        'p95_ms': round(percentile(durees, 95) * 1000, 2) if durees else None,
+        'p99_ms': round(percentile(durees, 99) * 1000, 2) if durees else None,
+        'moyenne_ms': round(statistics.mean(durees) * 1000, 2) if durees else None,
+        'debit_rps': round((len(durees) + erreurs) / duree_totale, 1) if duree_totale else None
+    }
+
+class Scenario:
+    """Requêtes d'un grimpeur type : connexion, validation, liste des voies, classement"""
+    
+    def __init__(self, jeu, circles, graine):
+        self.jeu = jeu
+        self.circles = circles  # [(voie_id, circle_id)]
+        self.rnd = random.Random(graine)
+        self._lock = threading.Lock()
+    
+    def tirage(self):
+        with self._lock:
+            index = self.rnd.randrange(len(self.jeu['codes']))
+            voie_id, circle_id = self.rnd.choice(self.circles)
+        return self.jeu['codes'][index], voie_id, circle_id
+    
+    def requete(self, endpoint, code, voie_id, circle_id):
+        """(méthode, url, corps JSON) d'un appel ; client déjà connecté sauf pour login"""
+        competition_id = self.jeu['competition_id']
+        if endpoint == 'login':
+            return 'POST', '/api/login', {'code': code}
+        if endpoint == 'validate':
+            return 'POST', '/api/validate', {
+                'voie_id': voie_id, 'circle_id': circle_id, 'competition_id': competition_id
+            }
+        if endpoint == 'voies_list':
+            return 'GET', f'/api/voies/list?competition_id={competition_id}', None
+        return 'GET', f'/api/competition/{competition_id}/classement', None
+
+def mesurer_client(app, scenario, endpoint, nb_requetes):
+    """Mode client : client de test Flask, séquentiel"""
+    durees, erreurs = [], 0
+    client = app.test_client()
+    debut_total = time.perf_counter()
+    for _ in range(nb_requetes):
+        code, voie_id, circle_id = scenario.tirage()
+        if endpoint != 'login':
+            client.post('/api/login', json={'code': code})
+        methode, url, corps = scenario.requete(endpoint, code, voie_id, circle_id)
+        
+        debut = time.perf_counter()
+        reponse = client.open(url, method=methode, json=corps)
+        duree = time.perf_counter() - debut
+        
+        if reponse.status_code >= 400:
+            erreurs += 1
+        else:
+            durees.append(duree)
+    return resume(endpoint, durees, erreurs, time.perf_counter() - debut_total)
+
+def mesurer_http(base_url, scenario, endpoint, nb_requetes, nb_threads):
+    """Mode HTTP : nb_threads clients concurrents, une session (cookie) par thread"""
+    durees, erreurs = [], [0]
+    lock = threading.Lock()
+    local = threading.local()
+    
+    def envoyer(methode, url, corps):
+        donnees = json.dumps(corps).encode() if corps is not None else None
+        requete = urllib.request.Request(base_url + url, data=donnees, method=methode,
+                                         headers={'Content-Type': 'application/json'})
+        with local.opener.open(requete) as reponse:
+            reponse.read()
+    
+    def appel(_):
+        if not hasattr(local, 'opener'):
+            local.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        code, voie_id, circle_id = scenario.tirage()
+        if endpoint != 'login':
+            envoyer('POST', '/api/login', {'code': code})
+        methode, url, corps = scenario.requete(endpoint, code, voie_id, circle_id)
+        
+        debut = time.perf_counter()
+        try:
+            envoyer(methode, url, corps)
+            ok = True
+        except (urllib.error.URLError, OSError):
+            ok = False
+        duree = time.perf_counter() - debut
+        
+        with lock:
+            if ok:
+                durees.append(duree)
+            else:
+                erreurs[0] += 1
+    
+    debut_total = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=nb_threads) as executor:
+        list(executor.map(appel, range(nb_requetes)))
+    return resume(endpoint, durees, erreurs[0], time.perf_counter() - debut_total)
+
+def preparer_base(chemin, nb_grimpeurs, args, **config):
+    """Application sur une base SQLite neuve remplie par generateur.py ; (app, jeu, cercles)"""
+    # Caches du processus : ils portent sur la base précédente
+    cache_codes.vider()
+    catalogue_voies.vider()
+    instantanes.vider()
+    
+    # create_app affiche le code admin : garder la sortie standard pour le JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        app = create_app(dict({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{chemin}',
+            'SQL_INSTRUMENTATION': False
+        }, **config))
+    
+    with app.app_context():
+        jeu = generer_competition(nb_grimpeurs, args.voies, graine=args.graine)
+        circles = db.session.query(Circle.voie_id, Circle.id)\
+            .join(CompetitionVoie, CompetitionVoie.voie_id == Circle.voie_id)\
+            .filter(CompetitionVoie.competition_id == jeu['competition_id']).all()
+        db.session.remove()
+    
+    print(f"  {nb_grimpeurs} grimpeurs, {args.voies} voies, {jeu['nb_validations']} validations "
+          f"(génération {jeu['duree_s']} s)", file=sys.stderr)
+    return app, jeu, [tuple(circle) for circle in circles]
+
+def benchmark_taille(nb_grimpeurs, args, dossier):
+    chemin = os.path.join(dossier, f'bench-{nb_grimpeurs}.db')
+    app, jeu, circles = preparer_base(chemin, nb_grimpeurs, args)
+    
+    scenario = Scenario(jeu, circles, args.graine)
+    serveur = None
+    if args.mode == 'http':
+        serveur = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=serveur.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{serveur.server_port}'
+    
+    resultats = []
+    try:
+        for endpoint in args.endpoints:
+            if args.mode == 'http':
+                mesure = mesurer_http(base_url, scenario, endpoint, args.requetes, args.threads)
+            else:
+                mesure = mesurer_client(app, scenario, endpoint, args.requetes)
+            mesure.update(grimpeurs=nb_grimpeurs, voies=args.voies, validations=jeu['nb_validations'])
+            resultats.append(mesure)
+            print(f"    {endpoint:<11} p50 {mesure['p50_ms']} ms  p95 {mesure['p95_ms']} ms  "
+                  f"p99 {mesure['p99_ms']} ms  {mesure['debit_rps']} req/s  ({mesure['erreurs']} erreurs)",
+                  file=sys.stderr)
+    finally:
+        if serveur is not None:
+            serveur.shutdown()
+    
+    return resultats
+
+def _processus_ecrivain(uri, profil, jeu, circles, nb_requetes, nb_threads, graine, file_resultats):
+    """Un worker (processus) : nb_threads grimpeurs connectés enchaînent leurs validations"""
+    with contextlib.redirect_stdout(sys.stderr):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'SQL_INSTRUMENTATION': False, 'BASE_PROFIL': profil})
+    
+    scenario = Scenario(jeu, circles, graine)
+    durees, erreurs = [], []
+    lock = threading.Lock()
+    local = threading.local()
+    
+    def appel(_):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+            code, _, _ = scenario.tirage()
+            local.client.post('/api/login', json={'code': code})
+        _, voie_id, circle_id = scenario.tirage()
+        methode, url, corps = scenario.requete('validate', None, voie_id, circle_id)
+        
+        debut = time.perf_counter()
+        reponse = local.client.open(url, method=methode, json=corps)
+        duree = time.perf_counter() - debut
+        
+        with lock:
+            if reponse.status_code >= 400:
+                erreurs.append((reponse.get_json(silent=True) or {}).get('message', str(reponse.status_code)))
+            else:
+                durees.append(duree)
+    
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=nb_threads) as executor:
+        list(executor.map(appel, range(nb_requetes)))
+    file_resultats.put((durees, erreurs, time.perf_counter() - debut))
+
+def stress_ecritures(args, dossier):
+    """Écrivains concurrents sur une même base : --processus workers de --threads clients chacun
+    
+    Chaque profil de moteur (--profils) est mesuré sur sa propre base ; 'aucun' reproduit la
+    configuration d'origine (journal classique, pas de reprise des transactions).
+    """
+    nb_grimpeurs = int(args.tailles.split(',')[0])
+    contexte = multiprocessing.get_context('spawn')
+    resultats = []
+    
+    for profil in args.profils.split(','):
+        print(f"Écritures concurrentes, profil {profil} ({args.processus} processus x {args.threads} threads)",
+              file=sys.stderr)
+        chemin = os.path.join(dossier, f'stress-{profil}.db')
+        app, jeu, circles = preparer_base(chemin, nb_grimpeurs, args, BASE_PROFIL=profil)
+        with app.app_context():
+            db.engine.dispose()
+        
+        file_resultats = contexte.Queue()
+        processus = [
+            contexte.Process(target=_processus_ecrivain, args=(
+                f'sqlite:///{chemin}', profil, jeu, circles, args.requetes, args.threads,
+                args.graine + numero, file_resultats
+            ))
+            for numero in range(args.processus)
+        ]
+        for p in processus:
+            p.start()
+        bilans = [file_resultats.get() for _ in processus]
+        for p in processus:
+            p.join()
+        
+        durees = [duree for bilan in bilans for duree in bilan[0]]
+        erreurs = [erreur for bilan in bilans for erreur in bilan[1]]
+        mesure = resume('validate', durees, len(erreurs), max(bilan[2] for bilan in bilans))
+        mesure.update(profil=profil, processus=args.processus, threads=args.threads, grimpeurs=nb_grimpeurs,
+                      messages_erreurs=sorted(set(erreurs))[:5])
+        resultats.append(mesure)
+        print(f"    validate    p50 {mesure['p50_ms']} ms  p95 {mesure['p95_ms']} ms  "
+              f"p99 {mesure['p99_ms']} ms  {mesure['debit_rps']} req/s  ({mesure['erreurs']} erreurs)",
+              file=sys.stderr)
+    
+    return resultats
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark des endpoints sur des compétitions synthétiques')
+    parser.add_argument('--tailles', default='100,1000', help='Nombres de grimpeurs, séparés par des virgules')
+    parser.add_argument('--voies', type=int, default=40, help='Nombre de voies par compétition')
+    parser.add_argument('--requetes', type=int, default=200, help='Appels par endpoint et par taille')
+    parser.add_argument('--mode', choices=['client', 'http'], default='client')
+    parser.add_argument('--threads', type=int, default=8, help='Clients concurrents (mode http)')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='Sous-ensemble de ' + ','.join(ENDPOINTS))
+    parser.add_argument('--graine', type=int, default=1)
+    parser.add_argument('--stress-ecritures', action='store_true',
+                        help='Validations concurrentes de --processus workers sur une même base')
+    parser.add_argument('--processus', type=int, default=4, help='Workers simulés (--stress-ecritures)')
+    parser.add_argument('--profils', default='sqlite,aucun', help='Profils de moteur comparés (--stress-ecritures)')
+    parser.add_argument('--sortie', help='Fichier JSON des résultats (sortie standard par défaut)')
+    args = parser.parse_args()
+    args.endpoints = [endpoint for endpoint in args.endpoints.split(',') if endpoint in ENDPOINTS]
+    
+    resultats = []
+    with tempfile.TemporaryDirectory() as dossier:
+        if args.stress_ecritures:
+            resultats.extend(stress_ecritures(args, dossier))
+        else:
+            for taille in args.tailles.split(','):
+                print(f"Taille {taille} ({args.mode})", file=sys.stderr)
+                resultats.extend(benchmark_taille(int(taille), args, dossier))
+    
+    rapport = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plateforme': platform.platform(),
+        'mode': 'stress-ecritures' if args.stress_ecritures else args.mode,
+        'threads': args.threads if args.mode == 'http' or args.stress_ecritures else 1,
+        'requetes_par_endpoint': args.requetes,
+        'graine': args.graine,
+        'resultats': resultats
+    }
+    
+    sortie = json.dumps(rapport, indent=2, ensure_ascii=False)
+    if args.sortie:
+        with open(args.sortie, 'w') as fichier:
+            fichier.write(sortie + '\n')
+    else:
+        print(sortie)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# catalogue.py - Cache du catalogue des voies d'une compétition
+import threading
+import time
+from sqlalchemy import event
+from models import db, Voie, Level, CompetitionVoie
+from images import url_variante, images_voie
+from lecture import sur_principale
+
+class CatalogueVoies:
+    """Cache par compétition des voies (nom, niveau, images), communes à tous les grimpeurs
+    
+    Vidé localement à chaque écriture d'une voie, d'un niveau ou d'une association
+    compétition/voie ; la durée de vie des entrées borne le retard des autres workers.
+    """
+    
+    def __init__(self, duree_vie=60):
+        self.duree_vie = duree_vie
+        self._entrees = {}  # competition_id -> (expiration, voies)
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        self.duree_vie = app.config.get('CATALOGUE_DUREE_VIE', self.duree_vie)
+    
+    def voies(self, competition_id):
+        """Voies d'une compétition (liste de dictionnaires, à ne pas modifier)"""
+        maintenant = time.monotonic()
+        with self._lock:
+            entree = self._entrees.get(competition_id)
+            if entree and entree[0] > maintenant:
+                return entree[1]
+        
+        # Une seule requête : voies de la compétition avec leur niveau (base principale : mis en cache)
+        with sur_principale():
+            query = db.session.query(Voie, Level.nom, Level.score)\
+                .join(CompetitionVoie, CompetitionVoie.voie_id == Voie.id)\
+                .outerjoin(Level, Voie.level_id == Level.id)\
+                .filter(CompetitionVoie.competition_id == competition_id)\
+                .order_by(Voie.id)
+            
+            voies = [{
+                'id': voie.id,
+                'nom': voie.nom,
+                'level_name': level_nom or 'N/A',
+                'level_score': level_score or 0,
+                'image_path': url_variante(voie.image_hash, 'thumb', 'jpg') if voie.image_hash else (voie.image_path or '/static/default-climb.jpg'),
+                'images': images_voie(voie)
+            } for voie, level_nom, level_score in query]
+        
+        with self._lock:
+            self._entrees[competition_id] = (maintenant + self.duree_vie, voies)
+        return voies
+    
+    def invalider(self, competition_id):
+        with self._lock:
+            self._entrees.pop(competition_id, None)
+    
+    def vider(self):
+        with self._lock:
+            self._entrees.clear()
+
+catalogue_voies = CatalogueVoies()
+
+# Une voie ou un niveau peut appartenir à plusieurs compétitions : tout vider
+@event.listens_for(Voie, 'after_update')
+@event.listens_for(Voie, 'after_delete')
+@event.listens_for(Level, 'after_update')
+@event.listens_for(Level, 'after_delete')
+def _vider_catalogue(mapper, connection, target):
+    catalogue_voies.vider()
+
+@event.listens_for(CompetitionVoie, 'after_insert')
+@event.listens_for(CompetitionVoie, 'after_delete')
+def _invalider_competition(mapper, connection, target):
+    catalogue_voies.invalider(target.competition_id)
@@ -0,0 +1,345 @@
+# classement.py - Maintenance du classement matérialisé (ScoreGrimpeur)
+import logging
+import threading
+from sqlalchemy import event
+from models import db, User, Competition, Categorie, ValidationGrimpeur, InscriptionCompetition, InscriptionCategorie, CompetitionCategorie, CompetitionVoie, ScoreGrimpeur
+from scores import query_totaux, totaux_competition, detail_competition
+from instantane import instantanes
+from moteur_classement import matrices_classement, par_categories
+from taches import traitement
+
+logger = logging.getLogger(__name__)
+
+# Version des lignes ScoreGrimpeur écrites dont la nouvelle version n'est pas encore publiée
+VERSION_EN_ATTENTE = 0
+
+def incrementer_version(competition_id):
+    """Version à donner aux lignes modifiées dans la transaction courante : VERSION_EN_ATTENTE
+    
+    La version de la compétition n'est incrémentée qu'après le commit (publier_version), dans une
+    transaction courte : le verrou de la ligne Competition n'est plus tenu pendant toute l'écriture,
+    qui sérialisait les validations concurrentes sous PostgreSQL.
+    """
+    db.session.info.setdefault('versions_a_publier', set()).add(competition_id)
+    return VERSION_EN_ATTENTE
+
+def publier_version(competition_id):
+    """Incrémente la version du classement et l'attribue aux lignes en attente, en une transaction courte
+    
+    Les lignes en attente d'une publication interrompue (arrêt entre les deux commits) sont
+    publiées avec la suivante, ou au démarrage (publier_versions_en_attente).
+    """
+    with db.engine.begin() as connexion:
+        connexion.execute(
+            db.update(Competition)
+            .where(Competition.id == competition_id)
+            .values(classement_version=Competition.classement_version + 1)
+        )
+        version = connexion.execute(
+            db.select(Competition.classement_version).where(Competition.id == competition_id)
+        ).scalar()
+        connexion.execute(
+            db.update(ScoreGrimpeur)
+            .where(ScoreGrimpeur.competition_id == competition_id)
+            .where(ScoreGrimpeur.version == VERSION_EN_ATTENTE)
+            .values(version=version)
+        )
+    return version
+
+def publier_versions_en_attente():
+    """Publie les versions restées en attente (worker arrêté entre le commit et la publication)"""
+    competitions_ids = [row[0] for row in db.session.query(ScoreGrimpeur.competition_id)
+                        .filter(ScoreGrimpeur.version == VERSION_EN_ATTENTE).distinct()]
+    db.session.commit()
+    for competition_id in competitions_ids:
+        publier_version(competition_id)
+    return len(competitions_ids)
+
+def version_classement(competition_id):
+    """Version courante du classement d'une compétition"""
+    return db.session.query(Competition.classement_version)\
+        .filter(Competition.id == competition_id)\
+        .scalar()
+
+def maj_score_grimpeur(competition_id, grimpeur_id):
+    """Recalcule la ligne de classement d'un grimpeur dans la transaction courante"""
+    db.session.flush()
+    
+    agregat = query_totaux()\
+        .filter(ValidationGrimpeur.competition_id == competition_id)\
+        .filter(ValidationGrimpeur.grimpeur_id == grimpeur_id)\
+        .first()
+    
+    score = ScoreGrimpeur.query.filter_by(
+        competition_id=competition_id,
+        grimpeur_id=grimpeur_id
+    ).first()
+    
+    if not score:
+        score = ScoreGrimpeur(competition_id=competition_id, grimpeur_id=grimpeur_id)
+        db.session.add(score)
+    
+    if agregat:
+        _, score.score_total, score.nb_voies, score.derniere_validation = agregat
+    else:
+        score.score_total = 0
+        score.nb_voies = 0
+        score.derniere_validation = None
+    
+    score.version = incrementer_version(competition_id)
+    return score
+
+def reconstruire_scores(competition_id=None):
+    """Régénère entièrement ScoreGrimpeur à partir de ValidationGrimpeur"""
+    if competition_id is None:
+        competitions_ids = [row[0] for row in db.session.query(InscriptionCompetition.competition_id).distinct()]
+    else:
+        competitions_ids = [competition_id]
+    
+    nb_lignes = 0
+    for comp_id in competitions_ids:
+        ScoreGrimpeur.query.filter_by(competition_id=comp_id).delete()
+        
+        totaux = totaux_competition(comp_id)
+        version = incrementer_version(comp_id)
+        
+        # Une ligne par inscrit, même sans validation
+        inscrits = db.session.query(InscriptionCompetition.grimpeur_id)\
+            .filter(InscriptionCompetition.competition_id == comp_id)
+        
+        for (grimpeur_id,) in inscrits:
+            total = totaux.get(grimpeur_id, {})
+            db.session.add(ScoreGrimpeur(
+                competition_id=comp_id,
+                grimpeur_id=grimpeur_id,
+                score_total=total.get('score_total', 0),
+                nb_voies=total.get('nb_voies', 0),
+                derniere_validation=total.get('derniere_validation'),
+                version=version
+            ))
+            nb_lignes += 1
+    
+    db.session.commit()
+    return nb_lignes
+
+@traitement('reconstruire_scores')
+def tache_reconstruire_scores(competition_id):
+    """Tâche de fond : régénère le classement d'une compétition"""
+    return {'competition_id': competition_id, 'nb_lignes': reconstruire_scores(competition_id)}
+
+def competitions_de_voie(voie_id):
+    """Identifiants des compétitions utilisant une voie"""
+    return [row[0] for row in db.session.query(CompetitionVoie.competition_id)
+            .filter(CompetitionVoie.voie_id == voie_id)]
+
+def categories_competition(competition_id):
+    """Catégories ouvertes dans une compétition"""
+    return db.session.query(Categorie).join(CompetitionCategorie)\
+        .filter(CompetitionCategorie.competition_id == competition_id).all()
+
+def assigner_categories(inscription, user, categories):
+    """Enregistre sur l'inscription les catégories auxquelles correspond le grimpeur"""
+    correspondantes = [cat for cat in categories if cat.matches_user(user)]
+    for categorie in correspondantes:
+        db.session.add(InscriptionCategorie(inscription=inscription, categorie_id=categorie.id))
+    return correspondantes
+
+def reassigner_categories_grimpeur(user):
+    """Réassigne les catégories des inscriptions d'un grimpeur (sexe ou date de naissance modifiés)
+    
+    Dans la transaction courante ; retourne les compétitions concernées, dont les instantanés
+    doivent oublier le grimpeur une fois la transaction validée.
+    """
+    inscriptions = InscriptionCompetition.query.filter_by(grimpeur_id=user.id).all()
+    for inscription in inscriptions:
+        InscriptionCategorie.query.filter_by(inscription_id=inscription.id).delete(synchronize_session=False)
+        assigner_categories(inscription, user, categories_competition(inscription.competition_id))
+        
+        # La ligne du grimpeur change de catégorie : les clients la resynchronisent
+        version = incrementer_version(inscription.competition_id)
+        ScoreGrimpeur.query.filter_by(competition_id=inscription.competition_id, grimpeur_id=user.id)\
+            .update({'version': version}, synchronize_session=False)
+    return [inscription.competition_id for inscription in inscriptions]
+
+def recalculer_categories(competition_id=None):
+    """Réassigne les catégories de tous les inscrits (après modification des catégories)"""
+    if competition_id is None:
+        competitions_ids = [row[0] for row in db.session.query(InscriptionCompetition.competition_id).distinct()]
+    else:
+        competitions_ids = [competition_id]
+    
+    nb_inscriptions = 0
+    for comp_id in competitions_ids:
+        inscriptions_ids = db.session.query(InscriptionCompetition.id)\
+            .filter(InscriptionCompetition.competition_id == comp_id)
+        InscriptionCategorie.query\
+            .filter(InscriptionCategorie.inscription_id.in_(inscriptions_ids.scalar_subquery()))\
+            .delete(synchronize_session=False)
+        
+        categories = categories_competition(comp_id)
+        inscriptions = db.session.query(InscriptionCompetition, User)\
+            .join(User, InscriptionCompetition.grimpeur_id == User.id)\
+            .filter(InscriptionCompetition.competition_id == comp_id)
+        
+        for inscription, user in inscriptions:
+            assigner_categories(inscription, user, categories)
+            nb_inscriptions += 1
+        
+        # Toutes les lignes changent potentiellement de catégorie : les clients doivent tout resynchroniser
+        version = incrementer_version(comp_id)
+        ScoreGrimpeur.query.filter_by(competition_id=comp_id)\
+            .update({'version': version}, synchronize_session=False)
+    
+    db.session.commit()
+    return nb_inscriptions
+
+def query_classement(competition_id):
+    """Lignes (score, grimpeur, catégorie) du classement matérialisé, une par catégorie du grimpeur"""
+    return db.session.query(ScoreGrimpeur, User, InscriptionCategorie.categorie_id)\
+        .join(User, ScoreGrimpeur.grimpeur_id == User.id)\
+        .join(InscriptionCompetition, db.and_(
+            InscriptionCompetition.competition_id == ScoreGrimpeur.competition_id,
+            InscriptionCompetition.grimpeur_id == ScoreGrimpeur.grimpeur_id
+        ))\
+        .outerjoin(InscriptionCategorie, InscriptionCategorie.inscription_id == InscriptionCompetition.id)\
+        .filter(ScoreGrimpeur.competition_id == competition_id)
+
+def categories_classement(competition_id):
+    """Catégories (id, nom) du classement, lues dans l'instantané si la compétition est ouverte"""
+    instantane = instantanes.obtenir(competition_id)
+    if instantane is not None:
+        return instantane.categories
+    return categories_competition(competition_id)
+
+def detail_classement(competition_id):
+    """Détail des voies validées par grimpeur, lu via l'instantané si la compétition est ouverte"""
+    instantane = instantanes.obtenir(competition_id)
+    if instantane is not None:
+        return instantane.detail_validations()
+    return detail_competition(competition_id)
+
+def lignes_classement(competition_id, depuis_version=None):
+    """Lignes du classement matérialisé par score décroissant, limitées aux lignes modifiées après depuis_version"""
+    instantane = instantanes.obtenir(competition_id)
+    if instantane is not None:
+        return _lignes_instantane(instantane, depuis_version)
+    
+    query = query_classement(competition_id).order_by(ScoreGrimpeur.score_total.desc())
+    
+    if depuis_version is not None:
+        query = query.filter(ScoreGrimpeur.version > depuis_version)
+    
+    lignes = {}
+    for score, grimpeur, categorie_id in query:
+        ligne = lignes.get(grimpeur.id)
+        if ligne is None:
+            ligne = lignes[grimpeur.id] = {
+                'id': grimpeur.id,
+                'prenom': grimpeur.prenom,
+                'nom': grimpeur.nom,
+                'sexe': grimpeur.sexe,
+                'categories': [],
+                'score_total': score.score_total,
+                'nb_voies': score.nb_voies
+            }
+        if categorie_id is not None:
+            ligne['categories'].append(categorie_id)
+    
+    return list(lignes.values())
+
+def _lignes_instantane(instantane, depuis_version):
+    """Scores lus en base, identité et catégories des grimpeurs lues dans l'instantané"""
+    query = db.session.query(ScoreGrimpeur.grimpeur_id, ScoreGrimpeur.score_total, ScoreGrimpeur.nb_voies)\
+        .filter(ScoreGrimpeur.competition_id == instantane.competition_id)\
+        .order_by(ScoreGrimpeur.score_total.desc())
+    
+    if depuis_version is not None:
+        query = query.filter(ScoreGrimpeur.version > depuis_version)
+    
+    scores = query.all()
+    grimpeurs = instantane.completer([grimpeur_id for grimpeur_id, _, _ in scores])
+    
+    lignes = []
+    for grimpeur_id, score_total, nb_voies in scores:
+        grimpeur = grimpeurs.get(grimpeur_id)
+        if grimpeur is None:
+            continue
+        lignes.append({
+            'id': grimpeur.id,
+            'prenom': grimpeur.prenom,
+            'nom': grimpeur.nom,
+            'sexe': grimpeur.sexe,
+            'categories': list(grimpeur.categories),
+            'score_total': score_total,
+            'nb_voies': nb_voies
+        })
+    
+    return lignes
+
+def membres_categories(competition_id, grimpeurs_ids):
+    """Couples (grimpeur_id, categorie_id) des inscrits, lus dans l'instantané si la compétition est ouverte"""
+    instantane = instantanes.obtenir(competition_id)
+    if instantane is not None:
+        grimpeurs = instantane.completer(grimpeurs_ids)
+        return [(grimpeur_id, categorie_id) for grimpeur_id in grimpeurs_ids if grimpeur_id in grimpeurs
+                for categorie_id in grimpeurs[grimpeur_id].categories]
+    return db.session.query(InscriptionCompetition.grimpeur_id, InscriptionCategorie.categorie_id)\
+        .join(InscriptionCategorie, InscriptionCategorie.inscription_id == InscriptionCompetition.id)\
+        .filter(InscriptionCompetition.competition_id == competition_id).all()
+
+# Derniers rangs calculés par compétition : (version, départages, rangs), partagés par les flux
+_rangs = {}
+_rangs_lock = threading.Lock()
+
+def rangs_categories(competition_id, version, departages):
+    """Rangs du moteur à une version : {'general': {grimpeur_id: rang}, categorie_id: {grimpeur_id: rang}}
+    
+    Mêmes rangs (ex aequo partagés, départages) que le classement complet ; calculés une fois
+    par version et partagés par les flux et la synchronisation différentielle.
+    """
+    departages = tuple(departages)
+    en_cache = _rangs.get(competition_id)
+    if en_cache is not None and en_cache[:2] == (version, departages):
+        return en_cache[2]
+    
+    resultat = matrices_classement.classement(competition_id, version, departages)
+    grimpeurs_ids = resultat.matrice.grimpeurs_ids
+    categories_ids = [categorie.id for categorie in categories_classement(competition_id)]
+    
+    rangs = {'general': dict(zip(grimpeurs_ids.tolist(), resultat.rangs.tolist()))}
+    for categorie_id, (indices, rangs_categorie) in zip(
+            categories_ids, par_categories(resultat, categories_ids, membres_categories(competition_id, grimpeurs_ids.tolist()))):
+        rangs[categorie_id] = dict(zip(grimpeurs_ids[indices].tolist(), rangs_categorie.tolist()))
+    
+    with _rangs_lock:
+        courant = _rangs.get(competition_id)
+        if courant is None or courant[0] <= version:
+            _rangs[competition_id] = (version, departages, rangs)
+    return rangs
+
+def positions_json(rangs, precedents=None):
+    """Rangs à envoyer aux clients : {"general"|"<categorie_id>": [[grimpeur_id, rang], ...]}
+    
+    Avec `precedents` (rangs déjà envoyés), seulement les rangs qui ont changé.
+    """
+    positions = {}
+    for cle, rangs_cle in rangs.items():
+        anciens = (precedents or {}).get(cle, {})
+        positions[str(cle)] = [[grimpeur_id, rang] for grimpeur_id, rang in rangs_cle.items()
+                               if anciens.get(grimpeur_id) != rang]
+    return positions
+
+# Versions publiées après le commit de l'écriture, abandonnées avec elle en cas de rollback
+@event.listens_for(db.session, 'after_commit')
+def _publier_versions(session):
+    competitions_ids = session.info.pop('versions_a_publier', None)
+    for competition_id in sorted(competitions_ids or ()):
+        try:
+            publier_version(competition_id)
+        except Exception:
+            # Lignes écrites, restées en attente : publiées avec la prochaine version
+            logger.exception("Publication de la version du classement %s impossible", competition_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def _abandonner_versions(session):
+    session.info.pop('versions_a_publier', None)
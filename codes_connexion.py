@@ -0,0 +1,91 @@
+# codes_connexion.py - Cache des codes de connexion
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from models import db, User
+
+class CacheCodes:
+    """Cache borné code de connexion -> identité (id, rôle, nom, prénom)
+    
+    Invalidé localement à chaque écriture d'un utilisateur ; la durée de vie des entrées
+    borne le retard des autres workers (rôle modifié, utilisateur supprimé) : gardée courte,
+    une connexion manquée ne coûte qu'une requête indexée.
+    """
+    
+    def __init__(self, taille_max=5000, duree_vie=30):
+        self.taille_max = taille_max
+        self.duree_vie = duree_vie
+        self._entrees = OrderedDict()  # code -> (expiration, identité)
+        self._lock = threading.Lock()
+        self._chaud = False
+    
+    def init_app(self, app):
+        self.taille_max = app.config.get('LOGIN_CACHE_TAILLE', self.taille_max)
+        self.duree_vie = app.config.get('LOGIN_CACHE_DUREE_VIE', self.duree_vie)
+    
+    def resoudre(self, codes):
+        """Identités des codes valides, avec une seule requête IN pour les codes absents du cache"""
+        if not self._chaud:
+            self.prechauffer()
+        
+        trouves = {}
+        manquants = []
+        maintenant = time.monotonic()
+        
+        with self._lock:
+            for code in codes:
+                entree = self._entrees.get(code)
+                if entree and entree[0] > maintenant:
+                    self._entrees.move_to_end(code)
+                    trouves[code] = entree[1]
+                else:
+                    manquants.append(code)
+        
+        if manquants:
+            users = db.session.query(User.code_connexion, User.id, User.role, User.nom, User.prenom)\
+                .filter(User.code_connexion.in_(manquants))
+            for row in users:
+                trouves[row.code_connexion] = self._stocker(row)
+        
+        return trouves
+    
+    def prechauffer(self):
+        """Charge en une requête les codes les plus récents, dans la limite de la taille du cache"""
+        users = db.session.query(User.code_connexion, User.id, User.role, User.nom, User.prenom)\
+            .filter(User.code_connexion.isnot(None))\
+            .order_by(User.id.desc())\
+            .limit(self.taille_max)
+        for row in users:
+            self._stocker(row)
+        self._chaud = True
+    
+    def invalider(self, *codes):
+        with self._lock:
+            for code in codes:
+                self._entrees.pop(code, None)
+    
+    def vider(self):
+        with self._lock:
+            self._entrees.clear()
+            self._chaud = False
+    
+    def _stocker(self, row):
+        identite = {'id': row.id, 'role': row.role, 'nom': row.nom, 'prenom': row.prenom, 'code': row.code_connexion}
+        with self._lock:
+            self._entrees[row.code_connexion] = (time.monotonic() + self.duree_vie, identite)
+            self._entrees.move_to_end(row.code_connexion)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+        return identite
+
+cache_codes = CacheCodes()
+
+# Toute écriture d'un utilisateur (generate_code_connexion, mise à jour, suppression)
+# invalide son ancien et son nouveau code
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalider_user(mapper, connection, target):
+    historique = db.inspect(target).attrs.code_connexion.history
+    cache_codes.invalider(target.code_connexion, *historique.deleted)
@@ -7,6 +7,30 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///escalade.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Profil du moteur (base_donnees.py) : 'sqlite', 'postgresql', 'aucun' ; déduit de l'URI par défaut
+    BASE_PROFIL = os.environ.get('BASE_PROFIL')
+    # Transactions d'écriture rejouées si la base est occupée : nombre de reprises, délai initial (s)
+    BASE_REPRISES = 5
+    BASE_REPRISE_DELAI = 0.02
+    # Base de lecture des vues @lecture_seule (lecture.py) : None, 'lecture-seule', 'copie' ou 'replique'
+    LECTURE_MODE = os.environ.get('LECTURE_MODE') or None
+    LECTURE_URI = os.environ.get('DATABASE_URL_LECTURE')
+    # Retard maximal admis (s) avant de relire la base principale ; intervalle de mesure du retard (s)
+    LECTURE_RETARD_MAX = float(os.environ.get('LECTURE_RETARD_MAX', 5))
+    LECTURE_VERIFICATION = 1
+    # SQLite : attente d'un verrou (ms), mmap (octets), cache de pages (Ko)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_MMAP_OCTETS = 256 * 1024 * 1024
+    SQLITE_CACHE_KO = 64000
+    # PostgreSQL : connexions par worker (pool + débordement), délais en ms
+    PG_POOL_TAILLE = int(os.environ.get('PG_POOL_TAILLE', 10))
+    PG_POOL_DEBORDEMENT = int(os.environ.get('PG_POOL_DEBORDEMENT', 20))
+    PG_POOL_ATTENTE = 10
+    PG_POOL_RECYCLAGE = 1800
+    PG_STATEMENT_TIMEOUT_MS = int(os.environ.get('PG_STATEMENT_TIMEOUT_MS', 10000))
+    PG_LOCK_TIMEOUT_MS = 3000
+    PG_IDLE_TRANSACTION_TIMEOUT_MS = 60000
+    
     # Configuration upload
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
@@ -14,3 +38,51 @@ class Config:
     
     # Session
     PERMANENT_SESSION_LIFETIME = timedelta(hours=12)
+    
+    # Cache des codes de connexion (entrées, durée de vie en secondes)
+    LOGIN_CACHE_TAILLE = 5000
+    LOGIN_CACHE_DUREE_VIE = 30
+    
+    # Cache du catalogue des voies par compétition (durée de vie en secondes)
+    CATALOGUE_DUREE_VIE = 60
+    
+    # Instantané des compétitions ouvertes : délai max avant de revérifier l'ouverture en base (s)
+    INSTANTANE_VERIFICATION = 5
+    
+    # Classement en direct (SSE) : délai max entre deux relectures / battements de cœur
+    CLASSEMENT_STREAM_INTERVALLE = int(os.environ.get('CLASSEMENT_STREAM_INTERVALLE', 15))
+    # Jeton des écrans d'affichage (/classement/<id>?jeton=...) : flux lisible sans connexion, même
+    # pendant la compétition ; sans jeton configuré, le flux reste réservé aux utilisateurs connectés
+    AFFICHAGE_JETON = os.environ.get('AFFICHAGE_JETON') or None
+    
+    # Départage des ex aequo du classement (moteur_classement.py), dans l'ordre d'application
+    CLASSEMENT_DEPARTAGES = ('countback', 'tops', 'derniere_validation')
+    
+    # Réponses de classement compressées (gzip, ou br si brotli est installé) au-delà de cette taille (octets)
+    CLASSEMENT_COMPRESSION_MIN = 1024
+    
+    # Tableau de bord : fenêtre des compteurs par minute, activité récente (minutes),
+    # réconciliation avec la base (secondes), taux de réussite signalant une voie trop dure / trop facile
+    STATS_FENETRE_MINUTES = 60
+    STATS_ACTIFS_MINUTES = 15
+    STATS_RECONCILIATION = int(os.environ.get('STATS_RECONCILIATION', 60))
+    STATS_TAUX_MIN = 0.05
+    STATS_TAUX_MAX = 0.95
+    
+    # Listes d'administration paginées : taille par défaut et maximale d'une page
+    ADMIN_PAGE_TAILLE = 50
+    ADMIN_PAGE_MAX = 200
+    
+    # Nombre maximum de validations par envoi groupé (/api/validate/batch)
+    VALIDATION_BATCH_MAX = 200
+    
+    # Tâches de fond (taches.py) : threads par worker, délai avant reprise d'une tâche abandonnée (s)
+    TACHES_WORKERS = int(os.environ.get('TACHES_WORKERS', 2))
+    TACHES_DELAI_REPRISE = 600
+    TACHES_TENTATIVES_MAX = 3
+    
+    # Instrumentation SQL (instrumentation.py) : active par défaut en mode debug, en-têtes X-SQL-* en debug
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '').lower() in ('1', 'true', 'oui') or None
+    SQL_INSTRUMENTATION_ENTETES = False
+    SQL_REQUETE_LENTE_MS = int(os.environ.get('SQL_REQUETE_LENTE_MS', 200))
+    SQL_REQUETES_ALERTE = 50
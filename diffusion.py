@@ -0,0 +1,69 @@
+# diffusion.py - Diffusion en direct du classement (Server-Sent Events)
+import json
+import threading
+from models import db
+from classement import categories_classement, lignes_classement, version_classement, rangs_categories, positions_json
+
+# Compteur de notifications par compétition, partagé par les flux du processus
+_condition = threading.Condition()
+_generations = {}
+
+def notifier_classement(competition_id):
+    """Réveille les flux ouverts d'une compétition après le commit d'une validation"""
+    with _condition:
+        _generations[competition_id] = _generations.get(competition_id, 0) + 1
+        _condition.notify_all()
+
+def _attendre_notification(competition_id, generation, delai):
+    """Attend une notification (ou l'expiration du délai) et retourne la génération courante"""
+    with _condition:
+        _condition.wait_for(lambda: _generations.get(competition_id, 0) != generation, timeout=delai)
+        return _generations.get(competition_id, 0)
+
+def _evenement(nom, donnees):
+    return f"event: {nom}\ndata: {json.dumps(donnees)}\n\n"
+
+def flux_classement(competition_id, intervalle, departages):
+    """Générateur SSE : classement complet à la connexion, puis uniquement les lignes et les rangs modifiés
+    
+    Les rangs viennent du moteur (ex aequo partagés, départages) : une validation peut déplacer
+    des grimpeurs dont la ligne n'a pas changé, leurs nouveaux rangs sont envoyés avec la mise à jour.
+    """
+    categories = categories_classement(competition_id)
+    
+    generation = _generations.get(competition_id, 0)
+    version = version_classement(competition_id)
+    lignes = lignes_classement(competition_id)
+    rangs = rangs_categories(competition_id, version, departages)
+    
+    # Rendre la connexion au pool entre deux lectures : le flux reste ouvert longtemps
+    db.session.close()
+    
+    yield _evenement('init', {
+        'version': version,
+        'categories': [{'id': cat.id, 'nom': cat.nom} for cat in categories],
+        'grimpeurs': lignes,
+        'positions': positions_json(rangs)
+    })
+    
+    while True:
+        # La relecture périodique de la version couvre les validations des autres workers
+        generation = _attendre_notification(competition_id, generation, intervalle)
+        
+        nouvelle_version = version_classement(competition_id)
+        positions = {}
+        if nouvelle_version != version:
+            lignes = lignes_classement(competition_id, depuis_version=version)
+            nouveaux_rangs = rangs_categories(competition_id, nouvelle_version, departages)
+            positions = positions_json(nouveaux_rangs, rangs)
+            rangs = nouveaux_rangs
+            version = nouvelle_version
+        else:
+            lignes = []
+        db.session.close()
+        
+        if lignes or any(positions.values()):
+            yield _evenement('maj', {'version': version, 'grimpeurs': lignes, 'positions': positions})
+        else:
+            # Battement de cœur : garde la connexion ouverte derrière les proxys
+            yield ": ping\n\n"
@@ -0,0 +1,244 @@
+# exports.py - Exports CSV / XLSX en flux (classements, inscriptions, validations)
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+from models import db, User, Competition, Voie, Circle, Level, Categorie, ValidationGrimpeur, CompetitionCategorie, InscriptionCompetition, InscriptionCategorie, ScoreGrimpeur
+from scores import score_validation, joindre_bareme
+from moteur_classement import matrices_classement, par_categories, rangs_competition
+
+TAILLE_LOT = 500  # Lignes lues par aller-retour (yield_per) et écrites entre deux envois
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+# Cellules interprétées comme formules par les tableurs (injection CSV)
+DEBUTS_FORMULE = ('=', '+', '-', '@', '\t', '\r')
+
+# Caractères de contrôle interdits en XML 1.0
+CARACTERES_INVALIDES_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _texte(valeur):
+    if valeur is None:
+        return ''
+    if hasattr(valeur, 'strftime'):
+        return valeur.isoformat(sep=' ', timespec='seconds') if hasattr(valeur, 'hour') else valeur.isoformat()
+    return str(valeur)
+
+# CSV
+
+def flux_csv(entetes, lignes, separateur=';'):
+    """Générateur d'octets CSV (UTF-8 avec BOM pour les tableurs), envoyé par lots de TAILLE_LOT lignes"""
+    tampon = io.StringIO()
+    ecrivain = csv.writer(tampon, delimiter=separateur)
+    ecrivain.writerow(entetes)
+    # En-têtes envoyés immédiatement : le téléchargement démarre avant la première requête
+    yield '\ufeff'.encode('utf-8') + _vider(tampon)
+    
+    nb = 0
+    for ligne in lignes:
+        ecrivain.writerow([_cellule_csv(valeur) for valeur in ligne])
+        nb += 1
+        if nb % TAILLE_LOT == 0:
+            yield _vider(tampon)
+    yield _vider(tampon)
+
+def _cellule_csv(valeur):
+    if isinstance(valeur, (int, float)):
+        return valeur
+    texte = _texte(valeur)
+    return "'" + texte if texte.startswith(DEBUTS_FORMULE) else texte
+
+def _vider(tampon):
+    donnees = tampon.getvalue().encode('utf-8')
+    tampon.seek(0)
+    tampon.truncate()
+    return donnees
+
+# XLSX : classeur d'une feuille (chaînes en ligne), zippé au fil de l'écriture
+
+TYPES_CONTENU = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+RELATIONS_PAQUET = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+RELATIONS_CLASSEUR = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+CLASSEUR = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{nom}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+
+DEBUT_FEUILLE = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+
+FIN_FEUILLE = '</sheetData></worksheet>'
+
+class _Tampon:
+    """Fichier en écriture seule (non positionnable) dont on récupère le contenu au fur et à mesure"""
+    
+    def __init__(self):
+        self._morceaux = []
+    
+    def write(self, donnees):
+        self._morceaux.append(bytes(donnees))
+        return len(donnees)
+    
+    def flush(self):
+        pass
+    
+    def vider(self):
+        donnees = b''.join(self._morceaux)
+        self._morceaux = []
+        return donnees
+
+def _ligne_xlsx(valeurs):
+    cellules = []
+    for valeur in valeurs:
+        if isinstance(valeur, bool) or not isinstance(valeur, (int, float)):
+            texte = CARACTERES_INVALIDES_XML.sub('', _texte(valeur))
+            cellules.append(f'<c t="inlineStr"><is><t xml:space="preserve">{escape(texte)}</t></is></c>')
+        else:
+            cellules.append(f'<c><v>{valeur!r}</v></c>')
+    return '<row>' + ''.join(cellules) + '</row>'
+
+def flux_xlsx(entetes, lignes, feuille='Export'):
+    """Générateur d'octets XLSX : l'archive est produite au fil des lignes, sans fichier temporaire"""
+    tampon = _Tampon()
+    nom_feuille = re.sub(r'[\[\]:*?/\\]', ' ', feuille)[:31] or 'Export'
+    
+    with zipfile.ZipFile(tampon, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', TYPES_CONTENU)
+        archive.writestr('_rels/.rels', RELATIONS_PAQUET)
+        archive.writestr('xl/workbook.xml', CLASSEUR.format(nom=escape(nom_feuille, {'"': '&quot;'})))
+        archive.writestr('xl/_rels/workbook.xml.rels', RELATIONS_CLASSEUR)
+        
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as feuille_xml:
+            feuille_xml.write((DEBUT_FEUILLE + _ligne_xlsx(entetes)).encode('utf-8'))
+            yield tampon.vider()
+            
+            morceaux = []
+            for ligne in lignes:
+                morceaux.append(_ligne_xlsx(ligne))
+                if len(morceaux) == TAILLE_LOT:
+                    feuille_xml.write(''.join(morceaux).encode('utf-8'))
+                    morceaux = []
+                    yield tampon.vider()
+            feuille_xml.write((''.join(morceaux) + FIN_FEUILLE).encode('utf-8'))
+    
+    # Répertoire central de l'archive, écrit à la fermeture
+    yield tampon.vider()
+
+def flux_export(format_export, entetes, lignes, feuille='Export'):
+    if format_export == 'xlsx':
+        return flux_xlsx(entetes, lignes, feuille)
+    return flux_csv(entetes, lignes)
+
+# Sources : générateurs de lignes lues par lots, sans tout charger en mémoire
+
+ENTETES_CLASSEMENT = ['Compétition', 'Catégorie', 'Position', 'Nom', 'Prénom', 'Sexe', 'Score', 'Voies', 'Dernière validation']
+
+def source_classement(competitions_ids, departages, categories_ids=None):
+    """Classement de chaque catégorie de chaque compétition, dans l'ordre du classement JSON
+    
+    Positions du moteur (moteur_classement, départagées par `departages`) en classement « 1224 » :
+    les ex aequo partagent la position, les positions suivantes sont sautées.
+    """
+    paires = db.session.query(Competition.id, Competition.nom, Competition.classement_version, Categorie.id, Categorie.nom)\
+        .join(CompetitionCategorie, CompetitionCategorie.competition_id == Competition.id)\
+        .join(Categorie, CompetitionCategorie.categorie_id == Categorie.id)\
+        .filter(Competition.id.in_(competitions_ids))
+    if categories_ids is not None:
+        paires = paires.filter(Categorie.id.in_(categories_ids))
+    paires = paires.order_by(Competition.date_debut, Competition.id, CompetitionCategorie.id).all()
+    
+    for competition_id, nom_competition, version, categorie_id, nom_categorie in paires:
+        resultat = matrices_classement.classement(competition_id, version, departages)
+        membres = db.session.query(InscriptionCompetition.grimpeur_id, InscriptionCategorie.categorie_id)\
+            .join(InscriptionCategorie, InscriptionCategorie.inscription_id == InscriptionCompetition.id)\
+            .filter(InscriptionCompetition.competition_id == competition_id)\
+            .filter(InscriptionCategorie.categorie_id == categorie_id)
+        (lignes_matrice, rangs), = par_categories(resultat, [categorie_id], membres)
+        grimpeurs = resultat.matrice.grimpeurs_ids[lignes_matrice].tolist()
+        positions = rangs_competition(rangs).tolist()
+        
+        # Identités et scores matérialisés lus par lots, écrits dans l'ordre du classement
+        for debut in range(0, len(grimpeurs), TAILLE_LOT):
+            lot = grimpeurs[debut:debut + TAILLE_LOT]
+            lignes = {ligne[0]: ligne[1:] for ligne in db.session.query(
+                ScoreGrimpeur.grimpeur_id, User.nom, User.prenom, User.sexe,
+                ScoreGrimpeur.score_total, ScoreGrimpeur.nb_voies, ScoreGrimpeur.derniere_validation
+            ).join(User, ScoreGrimpeur.grimpeur_id == User.id)\
+                .filter(ScoreGrimpeur.competition_id == competition_id)\
+                .filter(ScoreGrimpeur.grimpeur_id.in_(lot))}
+            
+            for grimpeur_id, position in zip(lot, positions[debut:debut + TAILLE_LOT]):
+                ligne = lignes.get(grimpeur_id)
+                if ligne is not None:
+                    yield (nom_competition, nom_categorie, position) + tuple(ligne)
+
+ENTETES_INSCRIPTIONS = ['Nom', 'Prénom', 'Date de naissance', 'Sexe', 'Email', 'Téléphone', "Date d'inscription", 'Catégories']
+
+def source_inscriptions(competition_id):
+    """Inscrits d'une compétition avec leurs catégories (une ligne par inscrit)"""
+    query = db.session.query(
+        InscriptionCompetition.id, User.nom, User.prenom, User.date_naissance, User.sexe,
+        User.email, User.telephone, InscriptionCompetition.date_inscription, Categorie.nom
+    ).join(User, InscriptionCompetition.grimpeur_id == User.id)\
+        .outerjoin(InscriptionCategorie, InscriptionCategorie.inscription_id == InscriptionCompetition.id)\
+        .outerjoin(Categorie, InscriptionCategorie.categorie_id == Categorie.id)\
+        .filter(InscriptionCompetition.competition_id == competition_id)\
+        .order_by(InscriptionCompetition.id, Categorie.id)\
+        .yield_per(TAILLE_LOT)
+    
+    # Lignes d'un même inscrit consécutives (tri par inscription) : regroupées au fil de l'eau
+    courante = None
+    categories = []
+    for inscription_id, *identite, categorie in query:
+        if courante is not None and courante[0] != inscription_id:
+            yield (*courante[1:], ', '.join(categories))
+            categories = []
+        courante = (inscription_id, *identite)
+        if categorie is not None:
+            categories.append(categorie)
+    if courante is not None:
+        yield (*courante[1:], ', '.join(categories))
+
+ENTETES_VALIDATIONS = ['Date', 'Nom', 'Prénom', 'Voie', 'Niveau', 'Cercle', 'Score']
+
+def source_validations(competition_id):
+    """Validations comptées au classement d'une compétition, dans l'ordre d'enregistrement"""
+    query = joindre_bareme(db.session.query(
+        ValidationGrimpeur.datetime_creation, User.nom, User.prenom,
+        Voie.nom, Level.nom, Circle.ordre, score_validation
+    )).join(User, ValidationGrimpeur.grimpeur_id == User.id)\
+        .filter(ValidationGrimpeur.competition_id == competition_id)\
+        .order_by(ValidationGrimpeur.id)\
+        .yield_per(TAILLE_LOT)
+    
+    for ligne in query:
+        yield tuple(ligne)
@@ -0,0 +1,126 @@
+# format_classement.py - Représentations du classement : format compact, champs choisis, encodage et compression
+import gzip
+import json
+import threading
+from collections import OrderedDict
+
+# Dépendances optionnelles : encodeur JSON rapide et compression brotli (repli sur la bibliothèque standard)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CHAMPS = ('grimpeur', 'score_total', 'nb_voies', 'voies', 'position')
+CHAMPS_COMPACT = ('grimpeur', 'score_total', 'nb_voies', 'position')  # 'voies' sur demande (?fields=)
+
+def champs_demandes(parametre, defaut):
+    """Champs de ?fields= (séparés par des virgules), dans l'ordre de CHAMPS ; ValueError si inconnu"""
+    if not parametre:
+        return defaut
+    demandes = {champ.strip() for champ in parametre.split(',') if champ.strip()}
+    inconnus = demandes - set(CHAMPS)
+    if inconnus:
+        raise ValueError(f"Champs inconnus : {', '.join(sorted(inconnus))} (attendu : {', '.join(CHAMPS)})")
+    return tuple(champ for champ in CHAMPS if champ in demandes)
+
+def classement_compact(version, categories, lignes, identites, champs, voies=None, detail=None):
+    """Classement sans répétition : chaque grimpeur (et chaque voie) envoyé une fois, lignes en tableaux
+    
+    categories : [(id, nom)] ; lignes : par catégorie, [(grimpeur_id, position, score_total, nb_voies)]
+    identites : {grimpeur_id: "Prénom Nom"}
+    voies : [(id, nom, score du niveau)] et detail : {grimpeur_id: [(indice dans voies, ordre du cercle)]}
+    si 'voies' est demandé ; le score d'une validation vaut score du niveau / ordre du cercle.
+    La première colonne est toujours l'indice du grimpeur, même absent de champs : sans elle,
+    une ligne ne peut pas être rattachée à son grimpeur (ni à son détail des voies).
+    """
+    colonnes = ['grimpeur'] + [champ for champ in champs if champ not in ('grimpeur', 'voies')]
+    index_grimpeurs = {}
+    grimpeurs = []
+    
+    def indice(grimpeur_id):
+        i = index_grimpeurs.get(grimpeur_id)
+        if i is None:
+            i = index_grimpeurs[grimpeur_id] = len(grimpeurs)
+            entree = [grimpeur_id, identites.get(grimpeur_id, '')]
+            if detail is not None:
+                entree.append([list(validation) for validation in detail.get(grimpeur_id, ())])
+            grimpeurs.append(entree)
+        return i
+    
+    sorties = []
+    for (categorie_id, nom), lignes_categorie in zip(categories, lignes):
+        tableau = []
+        for grimpeur_id, position, score_total, nb_voies in lignes_categorie:
+            valeurs = {'grimpeur': indice(grimpeur_id), 'position': position, 'score_total': score_total, 'nb_voies': nb_voies}
+            tableau.append([valeurs[colonne] for colonne in colonnes])
+        sorties.append({'id': categorie_id, 'nom': nom, 'lignes': tableau})
+    
+    compact = {
+        'format': 'compact',
+        'version': version,
+        'colonnes': colonnes,
+        'grimpeurs': grimpeurs,  # [id, "Prénom Nom"(, [[indice de voie, ordre du cercle], ...])]
+        'categories': sorties
+    }
+    if detail is not None:
+        compact['voies'] = [list(voie) for voie in voies]  # [id, nom, score du niveau]
+    return compact
+
+def encoder_json(donnees):
+    """Corps JSON en octets : orjson s'il est installé, sinon json sans espaces"""
+    if orjson is not None:
+        return orjson.dumps(donnees, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(donnees, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def encodage_accepte(accept_encodings):
+    """Meilleur codage proposé par le client parmi br (si brotli est installé) et gzip, ou None"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compresser(corps, encodage):
+    if encodage == 'br':
+        return brotli.compress(corps, quality=5)
+    if encodage == 'gzip':
+        return gzip.compress(corps, compresslevel=6)
+    return corps
+
+class CacheCorps:
+    """Derniers corps sérialisés (et compressés) du classement, par représentation
+    
+    Les écrans qui interrogent la même version ne refont ni la sérialisation ni la compression ;
+    une nouvelle version remplace l'entrée de la représentation.
+    """
+    
+    def __init__(self, taille=64):
+        self.taille = taille
+        self._corps = OrderedDict()  # (competition_id, représentation, encodage) -> (version, corps)
+        self._lock = threading.Lock()
+    
+    def obtenir(self, cle, version):
+        with self._lock:
+            entree = self._corps.get(cle)
+            if entree is None or entree[0] != version:
+                return None
+            self._corps.move_to_end(cle)
+            return entree[1]
+    
+    def enregistrer(self, cle, version, corps):
+        with self._lock:
+            self._corps[cle] = (version, corps)
+            self._corps.move_to_end(cle)
+            while len(self._corps) > self.taille:
+                self._corps.popitem(last=False)
+    
+    def vider(self):
+        with self._lock:
+            self._corps.clear()
+
+cache_corps = CacheCorps()
@@ -0,0 +1,140 @@
+# generateur.py - Jeu de données synthétique d'une compétition (tests de charge, benchmarks)
+import random
+import time
+from datetime import date, datetime, timedelta
+from models import db, User, Competition, Voie, Circle, Level, Categorie, ValidationGrimpeur, CompetitionCategorie, CompetitionVoie, InscriptionCompetition, NIVEAUX_DEFAUT, CATEGORIES_DEFAUT
+from classement import assigner_categories, reconstruire_scores
+
+# Répartition des âges des inscrits d'une compétition de club : (âge min, âge max, poids)
+TRANCHES_AGE = [
+    (6, 8, 10), (9, 10, 14), (11, 12, 16), (13, 14, 14),
+    (15, 16, 10), (17, 19, 8), (20, 39, 18), (40, 65, 10)
+]
+
+DUREE_COMPETITION = timedelta(hours=4)
+
+def _donnees_initiales():
+    """Niveaux et catégories par défaut (comme create_tables) s'ils n'existent pas encore"""
+    if not Level.query.first():
+        db.session.add_all([Level(nom=nom, score=score) for nom, score in NIVEAUX_DEFAUT])
+    if not Categorie.query.first():
+        db.session.add_all([
+            Categorie(nom=nom, annee_min=annee_min, annee_max=annee_max, genre=genre)
+            for nom, annee_min, annee_max, genre in CATEGORIES_DEFAUT
+        ])
+    db.session.flush()
+
+def _niveau_voie(rnd, levels):
+    """Niveau d'une voie : ouverture centrée sur le milieu du barème"""
+    index = round(rnd.gauss((len(levels) - 1) / 2, len(levels) / 5))
+    return levels[min(max(index, 0), len(levels) - 1)]
+
+def _date_naissance(rnd, annee):
+    age_min, age_max, _ = rnd.choices(TRANCHES_AGE, weights=[tranche[2] for tranche in TRANCHES_AGE])[0]
+    return date(annee - rnd.randint(age_min, age_max), rnd.randint(1, 12), rnd.randint(1, 28))
+
+def generer_competition(nb_grimpeurs, nb_voies, graine=None, cercles_par_voie=(3, 6), ouverte=True):
+    """Crée une compétition ouverte avec ses voies, ses inscrits et leurs validations
+    
+    Chaque grimpeur a un niveau propre ; la probabilité de réussir une voie décroît avec
+    l'écart entre le niveau de la voie et le sien, et le cercle atteint aussi.
+    Retourne un résumé (identifiants et volumes, durée de génération).
+    """
+    debut = time.perf_counter()
+    rnd = random.Random(graine)
+    
+    _donnees_initiales()
+    levels = Level.query.order_by(Level.score).all()
+    categories = Categorie.query.all()
+    
+    maintenant = datetime.now()
+    competition = Competition(
+        nom=f"Compétition synthétique {maintenant.strftime('%d/%m/%Y %H:%M')}",
+        date_debut=maintenant - DUREE_COMPETITION,
+        date_fin=maintenant,
+        nombre_participant_max=nb_grimpeurs,
+        is_open=ouverte,
+        inscription_is_open=True
+    )
+    db.session.add(competition)
+    db.session.flush()
+    
+    for categorie in categories:
+        db.session.add(CompetitionCategorie(competition_id=competition.id, categorie_id=categorie.id))
+    
+    # Voies et cercles (positions en pourcentage de la photo, cercle 1 = sommet)
+    voies = []
+    for numero in range(1, nb_voies + 1):
+        level = _niveau_voie(rnd, levels)
+        voie = Voie(nom=f"Voie {numero}", level_id=level.id, commentaire='Voie générée')
+        db.session.add(voie)
+        voies.append((voie, levels.index(level)))
+    db.session.flush()
+    
+    circles = {}
+    for voie, _ in voies:
+        nb_circles = rnd.randint(*cercles_par_voie)
+        circles[voie.id] = [Circle(x=rnd.uniform(20, 80), y=5 + (ordre - 1) * 90 / nb_circles,
+                                   radius=rnd.uniform(3, 6), ordre=ordre, voie_id=voie.id)
+                            for ordre in range(1, nb_circles + 1)]
+        db.session.add_all(circles[voie.id])
+        db.session.add(CompetitionVoie(competition_id=competition.id, voie_id=voie.id))
+    db.session.flush()
+    
+    # Grimpeurs, codes de connexion tirés en mémoire
+    codes_utilises = {row[0] for row in db.session.query(User.code_connexion).filter(User.code_connexion.isnot(None))}
+    grimpeurs = []
+    for numero in range(1, nb_grimpeurs + 1):
+        user = User(
+            nom=f"Grimpeur{numero}",
+            prenom=rnd.choice(['Léa', 'Hugo', 'Emma', 'Louis', 'Jade', 'Gabriel', 'Chloé', 'Arthur', 'Inès', 'Jules']),
+            date_naissance=_date_naissance(rnd, maintenant.year),
+            sexe=rnd.choice(['masculin', 'feminin']),
+            role='grimpeur'
+        )
+        user.generate_code_connexion(codes_utilises)
+        grimpeurs.append(user)
+    db.session.add_all(grimpeurs)
+    db.session.flush()
+    
+    for user in grimpeurs:
+        inscription = InscriptionCompetition(competition_id=competition.id, grimpeur_id=user.id)
+        db.session.add(inscription)
+        assigner_categories(inscription, user, categories)
+    db.session.flush()
+    
+    # Validations : insertion groupée (executemany) plutôt qu'objet par objet
+    validations = []
+    for user in grimpeurs:
+        niveau_grimpeur = rnd.gauss(len(levels) / 2, len(levels) / 4)
+        for voie, index_level in voies:
+            ecart = index_level - niveau_grimpeur
+            if rnd.random() > 1 / (1 + 2 ** ecart):
+                continue
+            
+            # Cercle atteint : plus la voie est facile pour le grimpeur, plus il monte haut (ordre 1)
+            circles_voie = circles[voie.id]
+            index_circle = min(int(abs(rnd.gauss(0, 1 + max(ecart, 0)))), len(circles_voie) - 1)
+            validations.append({
+                'grimpeur_id': user.id,
+                'voie_id': voie.id,
+                'competition_id': competition.id,
+                'circle_id': circles_voie[index_circle].id,
+                'datetime_creation': competition.date_debut + DUREE_COMPETITION * rnd.random()
+            })
+    
+    if validations:
+        db.session.execute(db.insert(ValidationGrimpeur), validations)
+    db.session.commit()
+    
+    reconstruire_scores(competition.id)
+    
+    return {
+        'competition_id': competition.id,
+        'nb_grimpeurs': nb_grimpeurs,
+        'nb_voies': nb_voies,
+        'nb_validations': len(validations),
+        'grimpeurs_ids': [user.id for user in grimpeurs],
+        'codes': [user.code_connexion for user in grimpeurs],
+        'duree_s': round(time.perf_counter() - debut, 2)
+    }
@@ -0,0 +1,15 @@
+# gunicorn.conf.py - Configuration du serveur de production
+# Lancement : gunicorn -c gunicorn.conf.py "app:create_app()"
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# Workers gevent : les flux SSE du classement restent ouverts longtemps, un worker
+# asynchrone tient des centaines de connexions inactives là où un worker sync n'en tient qu'une
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+timeout = 30
+keepalive = 5
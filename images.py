@@ -0,0 +1,122 @@
+# images.py - Déclinaisons des photos de voies (redimensionnées, WebP/JPEG, nommées par empreinte)
+import hashlib
+import io
+import os
+import secrets
+from flask import current_app
+from PIL import Image, ImageOps
+from werkzeug.utils import secure_filename
+from models import db, Voie
+from taches import traitement
+
+# Variantes générées : plus grande dimension en pixels
+VARIANTES = {
+    'thumb': 480,    # Cartes de la liste des voies
+    'mobile': 1280,  # Détail d'une voie sur téléphone
+    'full': 2560     # Édition des cercles / grands écrans
+}
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}
+}
+
+def traiter_image(fichier, dossier):
+    """Génère toutes les variantes d'une photo et retourne son empreinte de contenu
+    
+    Les noms de fichiers dérivent du contenu : un même upload n'est traité qu'une fois et
+    les fichiers peuvent être servis avec un cache immuable.
+    """
+    donnees = fichier.read()
+    empreinte = hashlib.sha256(donnees).hexdigest()[:20]
+    
+    if all(os.path.exists(os.path.join(dossier, nom_variante(empreinte, variante, extension)))
+           for variante in VARIANTES for extension in FORMATS):
+        return empreinte
+    
+    image = Image.open(io.BytesIO(donnees))
+    image = ImageOps.exif_transpose(image)  # Photos de téléphone : appliquer l'orientation EXIF
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    os.makedirs(dossier, exist_ok=True)
+    for variante, taille in VARIANTES.items():
+        copie = image.copy()
+        copie.thumbnail((taille, taille), Image.LANCZOS)
+        for extension, options in FORMATS.items():
+            chemin = os.path.join(dossier, nom_variante(empreinte, variante, extension))
+            # Écriture atomique : un fichier servi n'est jamais à moitié écrit
+            copie.save(chemin + '.tmp', **options)
+            os.replace(chemin + '.tmp', chemin)
+    
+    return empreinte
+
+def enregistrer_original(fichier, dossier):
+    """Enregistre l'upload tel quel (traitement différé) après avoir vérifié qu'il s'agit d'une image"""
+    nom = f"{secrets.token_hex(8)}_{secure_filename(fichier.filename)}"
+    chemin = os.path.join(dossier, nom)
+    
+    os.makedirs(dossier, exist_ok=True)
+    fichier.save(chemin)
+    try:
+        with Image.open(chemin) as image:
+            image.verify()  # Lecture des en-têtes seulement, sans décoder les pixels
+    except Exception:
+        os.remove(chemin)
+        raise
+    
+    return nom
+
+def url_original(nom):
+    return f"/static/uploads/{nom}"
+
+@traitement('image_voie')
+def traiter_image_voie(voie_id, original):
+    """Tâche de fond : génère les variantes d'un upload et les associe à la voie
+    
+    Rejouable : une nouvelle tentative après un arrêt entre le commit et la suppression
+    de l'original trouve la voie déjà associée à ses variantes et s'arrête là.
+    """
+    dossier = current_app.config['UPLOAD_FOLDER']
+    chemin = os.path.join(dossier, original)
+    
+    voie = db.session.get(Voie, voie_id)
+    # Voie supprimée, autre image reçue ou variantes déjà associées : original inutile
+    if voie is None or voie.image_path != url_original(original):
+        _supprimer_original(chemin)
+        return {'voie_id': voie_id, 'image_hash': voie.image_hash if voie is not None else None}
+    db.session.rollback()  # Aucune transaction ouverte pendant le traitement
+    
+    with open(chemin, 'rb') as fichier:
+        empreinte = traiter_image(fichier, dossier)
+    
+    voie = db.session.get(Voie, voie_id)
+    # La voie a pu être supprimée ou recevoir une autre image pendant le traitement
+    if voie is not None and voie.image_path == url_original(original):
+        voie.image_hash = empreinte
+        voie.image_path = url_variante(empreinte, 'full', 'jpg')
+        db.session.commit()
+    
+    _supprimer_original(chemin)
+    return {'voie_id': voie_id, 'image_hash': empreinte}
+
+def _supprimer_original(chemin):
+    try:
+        os.remove(chemin)
+    except FileNotFoundError:
+        pass
+
+def nom_variante(empreinte, variante, extension):
+    return f"{empreinte}-{variante}.{extension}"
+
+def url_variante(empreinte, variante='mobile', extension='webp'):
+    return f"/media/{nom_variante(empreinte, variante, extension)}"
+
+def images_voie(voie):
+    """URLs des variantes d'une voie, ou None pour une voie sans image traitée"""
+    if not voie.image_hash:
+        return None
+    
+    return {
+        variante: {extension: url_variante(voie.image_hash, variante, extension) for extension in FORMATS}
+        for variante in VARIANTES
+    }
@@ -0,0 +1,280 @@
+# instantane.py - Instantané en mémoire d'une compétition ouverte
+import threading
+import time
+from sqlalchemy import event
+from models import db, User, Competition, Voie, Circle, Level, Categorie, ValidationGrimpeur, CompetitionVoie, CompetitionCategorie, InscriptionCompetition, InscriptionCategorie
+from images import url_variante, images_voie
+from lecture import sur_principale
+
+# Une fois la compétition ouverte, voies, cercles, niveaux et catégories ne peuvent plus être
+# modifiés (update_voie et manage_competition_voies le refusent) : on peut les lire en mémoire.
+
+class CircleInstantane:
+    __slots__ = ('id', 'x', 'y', 'radius', 'ordre')
+    
+    def __init__(self, circle):
+        self.id = circle.id
+        self.x = circle.x
+        self.y = circle.y
+        self.radius = circle.radius
+        self.ordre = circle.ordre
+
+class VoieInstantane:
+    __slots__ = ('id', 'nom', 'level_id', 'level_name', 'level_score', 'commentaire', 'image_path', 'image_hash', 'circles', 'ordres')
+    
+    def __init__(self, voie, level, circles):
+        self.id = voie.id
+        self.nom = voie.nom
+        self.level_id = voie.level_id
+        self.level_name = level.nom if level else 'N/A'
+        self.level_score = level.score if level else 0
+        self.commentaire = voie.commentaire
+        self.image_path = voie.image_path
+        self.image_hash = voie.image_hash
+        self.circles = tuple(sorted((CircleInstantane(c) for c in circles), key=lambda c: c.ordre))
+        self.ordres = {c.id: c.ordre for c in self.circles}  # circle_id -> ordre
+
+class CategorieInstantane:
+    __slots__ = ('id', 'nom')
+    
+    def __init__(self, categorie):
+        self.id = categorie.id
+        self.nom = categorie.nom
+
+class GrimpeurInstantane:
+    __slots__ = ('id', 'prenom', 'nom', 'sexe', 'categories')
+    
+    def __init__(self, user, categories):
+        self.id = user.id
+        self.prenom = user.prenom
+        self.nom = user.nom
+        self.sexe = user.sexe
+        self.categories = tuple(categories)
+
+class CompetitionInstantane:
+    """Voies (cercles triés par ordre), barème, catégories et inscrits d'une compétition ouverte"""
+    __slots__ = ('competition_id', 'voies', 'catalogue', 'bareme', 'niveaux', 'ordres', 'voies_hors', 'categories', 'grimpeurs', 'verification', '_lock')
+    
+    def __init__(self, competition_id):
+        self.competition_id = competition_id
+        self._lock = threading.Lock()
+        
+        levels = {level.id: level for level in Level.query}
+        self.bareme = {level_id: level.score for level_id, level in levels.items()}
+        
+        voies = db.session.query(Voie).join(CompetitionVoie, CompetitionVoie.voie_id == Voie.id)\
+            .filter(CompetitionVoie.competition_id == competition_id)\
+            .order_by(Voie.id).all()
+        circles = {}
+        for circle in Circle.query.filter(Circle.voie_id.in_([voie.id for voie in voies])):
+            circles.setdefault(circle.voie_id, []).append(circle)
+        self.voies = {
+            voie.id: VoieInstantane(voie, levels.get(voie.level_id), circles.get(voie.id, []))
+            for voie in voies
+        }
+        
+        # Barème des validations (règle de scores.joindre_bareme) : voies et cercles de la compétition,
+        # plus ceux des validations enregistrées avant l'ouverture hors de ces voies et cercles
+        # (voie retirée de la compétition, cercle d'une autre voie). Les validations faites
+        # pendant l'ouverture passent par circle_valide : ces tables restent complètes.
+        self.niveaux = {voie.id: self.bareme.get(voie.level_id) for voie in self.voies.values()}  # voie_id -> score du niveau ou None
+        self.ordres = {c.id: c.ordre for voie in self.voies.values() for c in voie.circles}  # circle_id -> ordre
+        self.voies_hors = {}  # voie_id -> nom, voies validées hors de la compétition
+        hors_bareme = db.session.query(Voie.id, Voie.nom, Voie.level_id, Circle.id, Circle.ordre)\
+            .select_from(ValidationGrimpeur)\
+            .outerjoin(Voie, Voie.id == ValidationGrimpeur.voie_id)\
+            .outerjoin(Circle, Circle.id == ValidationGrimpeur.circle_id)\
+            .filter(ValidationGrimpeur.competition_id == competition_id)\
+            .filter(db.or_(ValidationGrimpeur.voie_id.notin_(list(self.niveaux)),
+                           ValidationGrimpeur.circle_id.notin_(list(self.ordres))))\
+            .distinct()
+        for voie_id, nom, level_id, circle_id, ordre in hors_bareme:
+            if voie_id is not None and voie_id not in self.voies:
+                self.niveaux[voie_id] = self.bareme.get(level_id)
+                self.voies_hors[voie_id] = nom
+            if circle_id is not None:
+                self.ordres.setdefault(circle_id, ordre)
+        
+        # Même forme que CatalogueVoies.voies()
+        self.catalogue = [{
+            'id': voie.id,
+            'nom': voie.nom,
+            'level_name': voie.level_name,
+            'level_score': voie.level_score,
+            'image_path': url_variante(voie.image_hash, 'thumb', 'jpg') if voie.image_hash else (voie.image_path or '/static/default-climb.jpg'),
+            'images': images_voie(voie)
+        } for voie in self.voies.values()]
+        
+        self.categories = tuple(
+            CategorieInstantane(categorie) for categorie in db.session.query(Categorie)
+            .join(CompetitionCategorie)
+            .filter(CompetitionCategorie.competition_id == competition_id)
+        )
+        
+        self.grimpeurs = self._charger_grimpeurs()
+        self.verification = time.monotonic()
+    
+    def _charger_grimpeurs(self, grimpeurs_ids=None):
+        query = db.session.query(User, InscriptionCategorie.categorie_id)\
+            .join(InscriptionCompetition, InscriptionCompetition.grimpeur_id == User.id)\
+            .outerjoin(InscriptionCategorie, InscriptionCategorie.inscription_id == InscriptionCompetition.id)\
+            .filter(InscriptionCompetition.competition_id == self.competition_id)
+        if grimpeurs_ids is not None:
+            query = query.filter(User.id.in_(grimpeurs_ids))
+        
+        users = {}
+        categories = {}
+        for user, categorie_id in query:
+            users[user.id] = user
+            categories.setdefault(user.id, [])
+            if categorie_id is not None:
+                categories[user.id].append(categorie_id)
+        
+        return {user_id: GrimpeurInstantane(user, categories[user_id]) for user_id, user in users.items()}
+    
+    def grimpeur(self, grimpeur_id):
+        """Grimpeur inscrit, ou None ; les inscriptions faites après l'ouverture sont chargées à la demande"""
+        grimpeur = self.grimpeurs.get(grimpeur_id)
+        if grimpeur is None:
+            grimpeur = self.completer([grimpeur_id]).get(grimpeur_id)
+        return grimpeur
+    
+    def completer(self, grimpeurs_ids):
+        """Charge les inscrits absents de l'instantané parmi grimpeurs_ids"""
+        manquants = [gid for gid in grimpeurs_ids if gid not in self.grimpeurs]
+        if not manquants:
+            return self.grimpeurs
+        
+        with sur_principale():
+            nouveaux = self._charger_grimpeurs(manquants)
+        with self._lock:
+            # Copie : les lecteurs concurrents itèrent sans verrou
+            grimpeurs = dict(self.grimpeurs)
+            grimpeurs.update(nouveaux)
+            self.grimpeurs = grimpeurs
+        return self.grimpeurs
+    
+    def oublier(self, grimpeur_id):
+        """Retire un grimpeur (catégories modifiées) : completer() le recharge à la demande"""
+        if grimpeur_id not in self.grimpeurs:
+            return
+        with self._lock:
+            grimpeurs = dict(self.grimpeurs)
+            grimpeurs.pop(grimpeur_id, None)
+            self.grimpeurs = grimpeurs
+    
+    def circle_valide(self, voie_id, circle_id):
+        voie = self.voies.get(voie_id)
+        return voie is not None and circle_id in voie.ordres
+    
+    def score(self, voie_id, circle_id):
+        """(ordre du cercle, score) d'une validation, None si elle ne compte pas (même règle que scores.joindre_bareme)"""
+        niveau = self.niveaux.get(voie_id)
+        ordre = self.ordres.get(circle_id)
+        if niveau is None or ordre is None:
+            return None
+        return ordre, float(niveau) / ordre
+    
+    def validations_grimpeur(self, grimpeur_id):
+        """Même résultat que scores.validations_grimpeur, sans jointure sur le barème"""
+        query = db.session.query(ValidationGrimpeur.voie_id, ValidationGrimpeur.circle_id)\
+            .filter(ValidationGrimpeur.competition_id == self.competition_id)\
+            .filter(ValidationGrimpeur.grimpeur_id == grimpeur_id)
+        
+        validations = {}
+        for voie_id, circle_id in query:
+            bareme = self.score(voie_id, circle_id)
+            if bareme is not None:
+                validations[voie_id] = {'ordre_circle': bareme[0], 'score': bareme[1]}
+        return validations
+    
+    def detail_validations(self):
+        """Même résultat que scores.detail_competition, sans jointure sur le barème"""
+        query = db.session.query(ValidationGrimpeur.grimpeur_id, ValidationGrimpeur.voie_id, ValidationGrimpeur.circle_id)\
+            .filter(ValidationGrimpeur.competition_id == self.competition_id)\
+            .order_by(ValidationGrimpeur.id)
+        
+        detail = {}
+        for grimpeur_id, voie_id, circle_id in query:
+            bareme = self.score(voie_id, circle_id)
+            if bareme is None:
+                continue
+            voie = self.voies.get(voie_id)
+            detail.setdefault(grimpeur_id, []).append({
+                'nom': voie.nom if voie is not None else self.voies_hors[voie_id],
+                'score': bareme[1],
+                'ordre_circle': bareme[0]
+            })
+        return detail
+
+
+class Instantanes:
+    """Instantanés des compétitions ouvertes du processus
+    
+    Construits à l'ouverture (ou à la première lecture dans les autres workers) et abandonnés
+    à la fermeture ; l'état ouvert est revérifié en base au plus toutes les `verification` secondes.
+    """
+    
+    def __init__(self, verification=5):
+        self.verification = verification
+        self._instantanes = {}  # competition_id -> CompetitionInstantane
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        self.verification = app.config.get('INSTANTANE_VERIFICATION', self.verification)
+    
+    def obtenir(self, competition_id):
+        """Instantané d'une compétition ouverte, None si elle est fermée"""
+        competition_id = int(competition_id)
+        instantane = self._instantanes.get(competition_id)
+        maintenant = time.monotonic()
+        if instantane is not None and maintenant - instantane.verification < self.verification:
+            return instantane
+        
+        is_open = db.session.query(Competition.is_open).filter(Competition.id == competition_id).scalar()
+        if not is_open:
+            self.abandonner(competition_id)
+            return None
+        
+        if instantane is None:
+            return self.construire(competition_id)
+        instantane.verification = maintenant
+        return instantane
+    
+    def voie(self, voie_id):
+        """Voie d'une compétition ouverte connue du processus, ou None"""
+        for competition_id in list(self._instantanes):
+            instantane = self.obtenir(competition_id)
+            if instantane is not None and voie_id in instantane.voies:
+                return instantane.voies[voie_id]
+        return None
+    
+    def construire(self, competition_id):
+        with sur_principale():
+            instantane = CompetitionInstantane(competition_id)
+        with self._lock:
+            self._instantanes[competition_id] = instantane
+        return instantane
+    
+    def abandonner(self, competition_id):
+        with self._lock:
+            self._instantanes.pop(competition_id, None)
+    
+    def oublier_grimpeur(self, grimpeur_id, competitions_ids):
+        """Retire un grimpeur modifié des instantanés du processus : rechargé à sa prochaine lecture"""
+        for competition_id in competitions_ids:
+            instantane = self._instantanes.get(competition_id)
+            if instantane is not None:
+                instantane.oublier(grimpeur_id)
+    
+    def vider(self):
+        with self._lock:
+            self._instantanes.clear()
+
+instantanes = Instantanes()
+
+# Ouverture ou fermeture dans ce processus : abandon immédiat, reconstruction à la prochaine lecture
+@event.listens_for(Competition, 'after_update')
+def _competition_modifiee(mapper, connection, target):
+    if db.inspect(target).attrs.is_open.history.has_changes():
+        instantanes.abandonner(target.id)
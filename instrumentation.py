@@ -0,0 +1,138 @@
+# instrumentation.py - Comptage et chronométrage des requêtes SQL (par requête HTTP)
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from models import db
+
+logger = logging.getLogger(__name__)
+
+NB_PLUS_LENTES = 3  # Requêtes les plus lentes conservées par requête HTTP
+
+class InstrumentationSQL:
+    """Statistiques SQL par requête HTTP, à partir des événements du moteur SQLAlchemy
+    
+    - en-têtes X-SQL-* sur chaque réponse en mode debug (ou SQL_INSTRUMENTATION_ENTETES)
+    - journal des requêtes plus lentes que SQL_REQUETE_LENTE_MS, avec leur plan d'exécution
+    - avertissement pour les requêtes HTTP dépassant SQL_REQUETES_ALERTE requêtes (N+1)
+    """
+    
+    def __init__(self):
+        self.requete_lente = 0.2
+        self.requetes_alerte = 50
+        self.entetes = False
+        self.actif = False
+        self._compteurs = []  # Compteurs actifs de compter_requetes()
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        actif = app.config.get('SQL_INSTRUMENTATION')
+        if not (app.debug if actif is None else actif):
+            return
+        
+        self.requete_lente = app.config.get('SQL_REQUETE_LENTE_MS', 200) / 1000
+        self.requetes_alerte = app.config.get('SQL_REQUETES_ALERTE', self.requetes_alerte)
+        self.entetes = app.config.get('SQL_INSTRUMENTATION_ENTETES') or app.debug
+        
+        with app.app_context():
+            engines = list(db.engines.values())  # Base principale et base de lecture éventuelle
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._avant)
+            event.listen(engine, 'after_cursor_execute', self._apres)
+        
+        app.before_request(self._debut)
+        app.after_request(self._bilan)
+        self.actif = True
+    
+    def _debut(self):
+        g.sql_stats = {'nb': 0, 'duree': 0.0, 'plus_lentes': []}
+    
+    def _avant(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('sql_debuts', []).append(time.perf_counter())
+    
+    def _apres(self, conn, cursor, statement, parameters, context, executemany):
+        duree = time.perf_counter() - conn.info['sql_debuts'].pop()
+        
+        for compteur in self._compteurs:
+            compteur.append(statement)
+        
+        stats = g.get('sql_stats') if has_request_context() else None
+        if stats is not None:
+            stats['nb'] += 1
+            stats['duree'] += duree
+            stats['plus_lentes'].append((duree, statement))
+            stats['plus_lentes'] = sorted(stats['plus_lentes'], key=lambda lente: lente[0], reverse=True)[:NB_PLUS_LENTES]
+        
+        if duree >= self.requete_lente:
+            logger.warning(
+                "Requête SQL lente (%.0f ms)%s\n%s\nParamètres: %r\nPlan:\n%s",
+                duree * 1000,
+                f" [{request.method} {request.path}]" if has_request_context() else "",
+                statement, parameters, self._plan(conn, statement, parameters, executemany)
+            )
+    
+    def _plan(self, conn, statement, parameters, executemany):
+        """Plan d'exécution d'une requête lente (SELECT uniquement), sur la connexion DBAPI brute"""
+        if executemany or not statement.lstrip().upper().startswith('SELECT'):
+            return "(non disponible)"
+        
+        prefixe = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+        curseur = conn.connection.cursor()
+        try:
+            curseur.execute(prefixe + statement, parameters)
+            return "\n".join(" | ".join(str(colonne) for colonne in ligne) for ligne in curseur.fetchall())
+        except Exception as e:
+            return f"(indisponible: {e})"
+        finally:
+            curseur.close()
+    
+    def _bilan(self, response):
+        stats = g.get('sql_stats')
+        if stats is None:
+            return response
+        
+        if stats['nb'] > self.requetes_alerte:
+            logger.warning("%s %s : %d requêtes SQL (%.0f ms)",
+                           request.method, request.path, stats['nb'], stats['duree'] * 1000)
+        
+        if self.entetes:
+            response.headers['X-SQL-Queries'] = str(stats['nb'])
+            response.headers['X-SQL-Time-ms'] = f"{stats['duree'] * 1000:.1f}"
+            response.headers['X-SQL-Slowest-ms'] = ", ".join(
+                f"{duree * 1000:.1f}" for duree, _ in stats['plus_lentes']
+            )
+        return response
+    
+    @contextmanager
+    def compter_requetes(self):
+        """Liste des requêtes exécutées dans le bloc (tous threads confondus)"""
+        if not self.actif:
+            raise RuntimeError("Instrumentation SQL inactive : activer SQL_INSTRUMENTATION")
+        
+        requetes = []
+        with self._lock:
+            self._compteurs = self._compteurs + [requetes]
+        try:
+            yield requetes
+        finally:
+            with self._lock:
+                self._compteurs = [compteur for compteur in self._compteurs if compteur is not requetes]
+    
+    @contextmanager
+    def budget_requetes(self, maximum):
+        """Échoue (AssertionError) si le bloc exécute plus de `maximum` requêtes
+        
+        Exemple :
+            with instrumentation_sql.budget_requetes(3):
+                client.get(f'/api/competition/{competition_id}/classement')
+        """
+        with self.compter_requetes() as requetes:
+            yield requetes
+        if len(requetes) > maximum:
+            raise AssertionError(
+                f"{len(requetes)} requêtes SQL pour un budget de {maximum}:\n" + "\n".join(requetes)
+            )
+
+instrumentation_sql = InstrumentationSQL()
@@ -0,0 +1,178 @@
+# lecture.py - Routage des lectures vers une base de lecture (réplique, copie ou connexion en lecture seule)
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+BIND_LECTURE = 'lecture'
+SUFFIXE_TEMOIN = '-copie'  # Fichier témoin de la dernière copie, à côté de la base de lecture
+
+# Retard d'une réplique PostgreSQL (s) ; 0 si elle a rejoué tout ce qu'elle a reçu
+REQUETE_RETARD_PG = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+def uri_lecture_seule(uri):
+    """Même fichier SQLite que `uri`, ouvert en lecture seule (URI SQLite mode=ro)"""
+    url = make_url(uri)
+    base = url.database if url.database.startswith('file:') else f'file:{url.database}'
+    return url.set(database=base, query=dict(url.query, mode='ro', uri='true')).render_as_string(hide_password=False)
+
+class RoutageLecture:
+    """Base de lecture des endpoints @lecture_seule, utilisée tant que son retard reste sous LECTURE_RETARD_MAX
+    
+    LECTURE_MODE :
+    - 'lecture-seule' : le fichier SQLite principal ouvert en lecture seule (aucun retard)
+    - 'copie' : un second fichier SQLite (LECTURE_URI), recopié depuis la base principale
+      (API de sauvegarde SQLite) dès que la dernière copie date de plus de LECTURE_RETARD_MAX / 2 secondes
+    - 'replique' : une réplique serveur (LECTURE_URI) ; retard mesuré pour PostgreSQL
+    Au-delà du retard admis, les lectures repassent sur la base principale. Les écritures
+    (flush, INSERT/UPDATE/DELETE) restent toujours sur la base principale.
+    """
+    
+    def __init__(self, retard_max=5, verification=1):
+        self.mode = None
+        self.retard_max = retard_max
+        self.verification = verification
+        self._retard = (0.0, None)  # (instant de la mesure, retard mesuré) pour une réplique
+        self._copie_en_cours = False
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        """À appeler avant db.init_app : déclare la base de lecture dans SQLALCHEMY_BINDS"""
+        self.mode = app.config.get('LECTURE_MODE')
+        self.retard_max = app.config.get('LECTURE_RETARD_MAX', self.retard_max)
+        self.verification = app.config.get('LECTURE_VERIFICATION', self.verification)
+        if not self.mode:
+            return
+        
+        if self.mode == 'lecture-seule':
+            uri = uri_lecture_seule(app.config['SQLALCHEMY_DATABASE_URI'])
+        elif self.mode in ('copie', 'replique'):
+            uri = app.config.get('LECTURE_URI')
+            if not uri:
+                raise ValueError(f"LECTURE_URI requis pour LECTURE_MODE={self.mode}")
+        else:
+            raise ValueError(f"LECTURE_MODE inconnu: {self.mode}")
+        
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds[BIND_LECTURE] = uri
+        app.config['SQLALCHEMY_BINDS'] = binds
+    
+    def moteur(self):
+        """Moteur de lecture s'il est assez à jour, sinon None (base principale)"""
+        if not self.mode:
+            return None
+        moteur = current_app.extensions['sqlalchemy'].engines[BIND_LECTURE]
+        retard = self.retard(moteur)
+        if retard is None or retard > self.retard_max:
+            return None
+        return moteur
+    
+    def retard(self, moteur):
+        """Retard estimé de la base de lecture en secondes, None s'il est inconnu"""
+        if self.mode == 'copie':
+            return self._retard_copie(moteur)
+        if self.mode == 'replique' and moteur.dialect.name == 'postgresql':
+            return self._retard_replique(moteur)
+        return 0
+    
+    def _retard_copie(self, moteur):
+        # Date de la dernière copie = date du fichier témoin : partagée par tous les workers
+        chemin = moteur.url.database
+        age = self._age_copie(chemin)
+        if age is None or age > self.retard_max / 2:
+            self._lancer_copie(current_app.extensions['sqlalchemy'].engines[None].url.database, chemin)
+        return age
+    
+    def _age_copie(self, chemin):
+        try:
+            return time.time() - os.path.getmtime(chemin + SUFFIXE_TEMOIN)
+        except OSError:
+            return None
+    
+    def _lancer_copie(self, source, destination):
+        with self._lock:
+            if self._copie_en_cours:
+                return
+            self._copie_en_cours = True
+        threading.Thread(target=self._copier, args=(source, destination), daemon=True).start()
+    
+    def _copier(self, source, destination):
+        debut = time.perf_counter()
+        try:
+            # Un autre worker vient peut-être de la faire
+            age = self._age_copie(destination)
+            if age is not None and age <= self.retard_max / 2:
+                return
+            depart = time.time()
+            connexion_source = sqlite3.connect(source, timeout=self.retard_max)
+            connexion_destination = sqlite3.connect(destination, timeout=self.retard_max)
+            try:
+                connexion_source.backup(connexion_destination)
+            finally:
+                connexion_destination.close()
+                connexion_source.close()
+            # Témoin daté du début de la copie : la base de lecture contient tout ce qui précède
+            with open(destination + SUFFIXE_TEMOIN, 'w'):
+                pass
+            os.utime(destination + SUFFIXE_TEMOIN, (depart, depart))
+            logger.debug("Base de lecture recopiée en %.0f ms", (time.perf_counter() - debut) * 1000)
+        except (sqlite3.Error, OSError):
+            logger.exception("Échec de la copie de la base de lecture")
+        finally:
+            with self._lock:
+                self._copie_en_cours = False
+    
+    def _retard_replique(self, moteur):
+        maintenant = time.monotonic()
+        mesure, retard = self._retard
+        if maintenant - mesure < self.verification:
+            return retard
+        try:
+            with moteur.connect() as connexion:
+                valeur = connexion.execute(REQUETE_RETARD_PG).scalar()
+            retard = float(valeur) if valeur is not None else None
+        except Exception:
+            logger.exception("Retard de la réplique indisponible")
+            retard = None
+        self._retard = (maintenant, retard)
+        return retard
+
+routage_lecture = RoutageLecture()
+
+class SessionRoutee(Session):
+    """Session Flask-SQLAlchemy dont les lectures d'une vue @lecture_seule partent vers la base de lecture"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not getattr(clause, 'is_dml', False) \
+                and has_app_context() and g.get('lecture_seule'):
+            moteur = routage_lecture.moteur()
+            if moteur is not None:
+                return moteur
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@contextmanager
+def sur_principale():
+    """Lectures du bloc sur la base principale (données gardées en cache au-delà de la requête)"""
+    if not has_app_context():
+        yield
+        return
+    precedent = g.get('lecture_seule', False)
+    g.lecture_seule = False
+    try:
+        yield
+    finally:
+        g.lecture_seule = precedent
@@ -0,0 +1,133 @@
+"""Schéma initial (tables créées par db.create_all avant l'introduction des migrations)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-16 23:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nom', sa.String(length=100), nullable=False),
+        sa.Column('prenom', sa.String(length=100), nullable=False),
+        sa.Column('date_naissance', sa.Date(), nullable=False),
+        sa.Column('telephone', sa.String(length=20), nullable=True),
+        sa.Column('email', sa.String(length=120), nullable=True),
+        sa.Column('sexe', sa.String(length=10), nullable=False),
+        sa.Column('role', sa.String(length=20), nullable=False),
+        sa.Column('code_connexion', sa.String(length=6), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('code_connexion')
+    )
+    op.create_table('competition',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nom', sa.String(length=200), nullable=False),
+        sa.Column('date_creation', sa.DateTime(), nullable=True),
+        sa.Column('date_debut', sa.DateTime(), nullable=False),
+        sa.Column('date_fin', sa.DateTime(), nullable=False),
+        sa.Column('nombre_participant_max', sa.Integer(), nullable=True),
+        sa.Column('is_open', sa.Boolean(), nullable=True),
+        sa.Column('inscription_is_open', sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('level',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nom', sa.String(length=50), nullable=False),
+        sa.Column('score', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('nom')
+    )
+    op.create_table('categorie',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nom', sa.String(length=100), nullable=False),
+        sa.Column('annee_min', sa.Integer(), nullable=False),
+        sa.Column('annee_max', sa.Integer(), nullable=False),
+        sa.Column('genre', sa.String(length=10), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('voie',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nom', sa.String(length=100), nullable=False),
+        sa.Column('date_creation', sa.DateTime(), nullable=True),
+        sa.Column('image_path', sa.String(length=200), nullable=True),
+        sa.Column('level_id', sa.Integer(), nullable=True),
+        sa.Column('commentaire', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['level_id'], ['level.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('circle',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('x', sa.Float(), nullable=False),
+        sa.Column('y', sa.Float(), nullable=False),
+        sa.Column('radius', sa.Float(), nullable=False),
+        sa.Column('ordre', sa.Integer(), nullable=False),
+        sa.Column('voie_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['voie_id'], ['voie.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('validation_grimpeur',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('datetime_creation', sa.DateTime(), nullable=True),
+        sa.Column('grimpeur_id', sa.Integer(), nullable=False),
+        sa.Column('voie_id', sa.Integer(), nullable=False),
+        sa.Column('competition_id', sa.Integer(), nullable=False),
+        sa.Column('circle_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['circle_id'], ['circle.id']),
+        sa.ForeignKeyConstraint(['competition_id'], ['competition.id']),
+        sa.ForeignKeyConstraint(['grimpeur_id'], ['user.id']),
+        sa.ForeignKeyConstraint(['voie_id'], ['voie.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('competition_categorie',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('competition_id', sa.Integer(), nullable=False),
+        sa.Column('categorie_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['categorie_id'], ['categorie.id']),
+        sa.ForeignKeyConstraint(['competition_id'], ['competition.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('competition_id', 'categorie_id')
+    )
+    op.create_table('competition_voie',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('competition_id', sa.Integer(), nullable=False),
+        sa.Column('voie_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['competition_id'], ['competition.id']),
+        sa.ForeignKeyConstraint(['voie_id'], ['voie.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('competition_id', 'voie_id')
+    )
+    op.create_table('inscription_competition',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('competition_id', sa.Integer(), nullable=False),
+        sa.Column('grimpeur_id', sa.Integer(), nullable=False),
+        sa.Column('date_inscription', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['competition_id'], ['competition.id']),
+        sa.ForeignKeyConstraint(['grimpeur_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('competition_id', 'grimpeur_id')
+    )
+
+
+def downgrade():
+    op.drop_table('inscription_competition')
+    op.drop_table('competition_voie')
+    op.drop_table('competition_categorie')
+    op.drop_table('validation_grimpeur')
+    op.drop_table('circle')
+    op.drop_table('voie')
+    op.drop_table('categorie')
+    op.drop_table('level')
+    op.drop_table('competition')
+    op.drop_table('user')
@@ -0,0 +1,128 @@
+"""Classement matérialisé, tâches de fond, idempotence des validations, catégories des inscrits
+
+Les bases créées par db.create_all entre deux versions peuvent déjà contenir une partie de ces
+tables : chaque opération vérifie d'abord l'état réel du schéma.
+Après la migration : flask rebuild-scores puis flask recompute-categories.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16 23:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+COLONNES_VALIDATION = ['grimpeur_id', 'voie_id', 'competition_id']
+
+
+def _unicite_validation(inspecteur):
+    """Vrai si validation_grimpeur a déjà une contrainte ou un index unique sur COLONNES_VALIDATION"""
+    uniques = [c['column_names'] for c in inspecteur.get_unique_constraints('validation_grimpeur')]
+    uniques += [i['column_names'] for i in inspecteur.get_indexes('validation_grimpeur') if i['unique']]
+    return any(set(colonnes) == set(COLONNES_VALIDATION) for colonnes in uniques)
+
+
+def upgrade():
+    inspecteur = sa.inspect(op.get_bind())
+    tables = set(inspecteur.get_table_names())
+    
+    colonnes_competition = {c['name'] for c in inspecteur.get_columns('competition')}
+    if 'classement_version' not in colonnes_competition:
+        with op.batch_alter_table('competition') as batch_op:
+            batch_op.add_column(sa.Column('classement_version', sa.Integer(), nullable=False, server_default='0'))
+    
+    colonnes_voie = {c['name'] for c in inspecteur.get_columns('voie')}
+    if 'image_hash' not in colonnes_voie:
+        with op.batch_alter_table('voie') as batch_op:
+            batch_op.add_column(sa.Column('image_hash', sa.String(length=64), nullable=True))
+    
+    # Une seule validation par grimpeur, voie et compétition (cible de l'upsert) :
+    # les doublons laissés par des envois concurrents sont supprimés, la plus récente est gardée
+    if not _unicite_validation(inspecteur):
+        op.execute("""
+            DELETE FROM validation_grimpeur WHERE id NOT IN (
+                SELECT id FROM (
+                    SELECT MAX(id) AS id FROM validation_grimpeur
+                    GROUP BY grimpeur_id, voie_id, competition_id
+                ) AS gardees
+            )
+        """)
+        op.create_index('uq_validation_grimpeur_voie_competition', 'validation_grimpeur',
+                        COLONNES_VALIDATION, unique=True)
+    
+    if 'cle_idempotence' not in tables:
+        op.create_table('cle_idempotence',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('cle', sa.String(length=64), nullable=False),
+            sa.Column('grimpeur_id', sa.Integer(), nullable=False),
+            sa.Column('resultat', sa.Text(), nullable=False),
+            sa.Column('date_creation', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['grimpeur_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('grimpeur_id', 'cle')
+        )
+    
+    if 'tache' not in tables:
+        op.create_table('tache',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('type', sa.String(length=50), nullable=False),
+            sa.Column('parametres', sa.Text(), nullable=False),
+            sa.Column('statut', sa.String(length=20), nullable=False),
+            sa.Column('resultat', sa.Text(), nullable=True),
+            sa.Column('erreur', sa.Text(), nullable=True),
+            sa.Column('tentatives', sa.Integer(), nullable=False),
+            sa.Column('date_creation', sa.DateTime(), nullable=True),
+            sa.Column('date_maj', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_tache_statut', 'tache', ['statut'])
+    
+    if 'inscription_categorie' not in tables:
+        op.create_table('inscription_categorie',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('inscription_id', sa.Integer(), nullable=False),
+            sa.Column('categorie_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['categorie_id'], ['categorie.id']),
+            sa.ForeignKeyConstraint(['inscription_id'], ['inscription_competition.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('inscription_id', 'categorie_id')
+        )
+    
+    if 'score_grimpeur' not in tables:
+        op.create_table('score_grimpeur',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('competition_id', sa.Integer(), nullable=False),
+            sa.Column('grimpeur_id', sa.Integer(), nullable=False),
+            sa.Column('score_total', sa.Float(), nullable=False),
+            sa.Column('nb_voies', sa.Integer(), nullable=False),
+            sa.Column('derniere_validation', sa.DateTime(), nullable=True),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['competition_id'], ['competition.id']),
+            sa.ForeignKeyConstraint(['grimpeur_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('competition_id', 'grimpeur_id')
+        )
+        op.create_index('ix_score_grimpeur_classement', 'score_grimpeur', ['competition_id', 'score_total'])
+        op.create_index('ix_score_grimpeur_version', 'score_grimpeur', ['competition_id', 'version'])
+
+
+def downgrade():
+    op.drop_index('ix_score_grimpeur_version', table_name='score_grimpeur')
+    op.drop_index('ix_score_grimpeur_classement', table_name='score_grimpeur')
+    op.drop_table('score_grimpeur')
+    op.drop_table('inscription_categorie')
+    op.drop_index('ix_tache_statut', table_name='tache')
+    op.drop_table('tache')
+    op.drop_table('cle_idempotence')
+    op.drop_index('uq_validation_grimpeur_voie_competition', table_name='validation_grimpeur', if_exists=True)
+    with op.batch_alter_table('voie') as batch_op:
+        batch_op.drop_column('image_hash')
+    with op.batch_alter_table('competition') as batch_op:
+        batch_op.drop_column('classement_version')
@@ -0,0 +1,37 @@
+"""Index composites des requêtes fréquentes (validations, inscriptions, cercles, identité, ouverture)
+
+Vérifiés par flask check-query-plans (plans_requetes.py).
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16 23:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+INDEX = [
+    ('ix_validation_competition_grimpeur_voie', 'validation_grimpeur', ['competition_id', 'grimpeur_id', 'voie_id']),
+    ('ix_inscription_competition_grimpeur', 'inscription_competition', ['grimpeur_id']),
+    ('ix_circle_voie_ordre', 'circle', ['voie_id', 'ordre']),
+    ('ix_user_identite', 'user', ['nom', 'prenom', 'date_naissance']),
+    ('ix_competition_ouverture_dates', 'competition', ['is_open', 'date_debut', 'date_fin']),
+]
+
+
+def upgrade():
+    # if_not_exists : tables créées après coup par db.create_all, index déjà présents
+    for nom, table, colonnes in INDEX:
+        op.create_index(nom, table, colonnes, if_not_exists=True)
+
+
+def downgrade():
+    for nom, table, _ in reversed(INDEX):
+        op.drop_index(nom, table_name=table, if_exists=True)
@@ -0,0 +1,49 @@
+"""Séries de compétitions (classement de saison)
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+    
+    if 'serie' not in tables:
+        op.create_table('serie',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('nom', sa.String(length=200), nullable=False),
+            sa.Column('saison', sa.String(length=20), nullable=True),
+            sa.Column('agregation', sa.String(length=20), nullable=False),
+            sa.Column('nb_resultats', sa.Integer(), nullable=True),
+            sa.Column('bareme_points', sa.Text(), nullable=True),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.Column('date_creation', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+    
+    if 'serie_competition' not in tables:
+        op.create_table('serie_competition',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('serie_id', sa.Integer(), nullable=False),
+            sa.Column('competition_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['competition_id'], ['competition.id']),
+            sa.ForeignKeyConstraint(['serie_id'], ['serie.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('serie_id', 'competition_id')
+        )
+
+
+def downgrade():
+    op.drop_table('serie_competition')
+    op.drop_table('serie')
@@ -1,9 +1,53 @@
 # models.py - Modèles de base de données complets
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
 from datetime import datetime, date
-import hashlib
+import json
+import secrets
+from lecture import SessionRoutee
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': SessionRoutee})
+migrate = Migrate()  # Historique du schéma : dossier migrations/ (flask db upgrade)
+
+NB_CODES_POSSIBLES = 10 ** 6  # Codes de connexion à 6 chiffres
+
+# Données initiales (create_tables) : niveaux (nom, score) et catégories (nom, âge min, âge max, genre)
+NIVEAUX_DEFAUT = [
+    ('3a', 100), ('3b', 120), ('3c', 140),
+    ('4a', 160), ('4b', 180), ('4c', 200),
+    ('5a', 250), ('5b', 300), ('5c', 350),
+    ('6a', 400), ('6b', 450), ('6c', 500),
+    ('7a', 600), ('7b', 700), ('7c', 800)
+]
+
+CATEGORIES_DEFAUT = [
+    ('Microbe M', 6, 8, 'masculin'),
+    ('Microbe F', 6, 8, 'feminin'),
+    ('Poussin M', 9, 10, 'masculin'),
+    ('Poussin F', 9, 10, 'feminin'),
+    ('Benjamin M', 11, 12, 'masculin'),
+    ('Benjamin F', 11, 12, 'feminin'),
+    ('Minime M', 13, 14, 'masculin'),
+    ('Minime F', 13, 14, 'feminin'),
+    ('Cadet M', 15, 16, 'masculin'),
+    ('Cadet F', 15, 16, 'feminin'),
+    ('Junior M', 17, 19, 'masculin'),
+    ('Junior F', 17, 19, 'feminin'),
+    ('Senior M', 20, 39, 'masculin'),
+    ('Senior F', 20, 39, 'feminin'),
+    ('Vétéran M', 40, 99, 'masculin'),
+    ('Vétéran F', 40, 99, 'feminin'),
+    ('Mixte', 6, 99, 'mixte')
+]
+
+# Points par place des séries (barème des coupes du monde IFSC) : au-delà, aucun point
+BAREME_POINTS_DEFAUT = [
+    1000, 805, 690, 610, 545, 495, 455, 415, 380, 350,
+    325, 300, 280, 260, 240, 220, 205, 185, 170, 155,
+    145, 130, 120, 105, 95, 84, 73, 63, 56, 48
+]
+
+AGREGATIONS_SERIE = ('somme', 'meilleurs', 'points')
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -17,16 +61,31 @@ class User(db.Model):
     code_connexion = db.Column(db.String(6), unique=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Recherche d'un grimpeur déjà inscrit (inscription publique, création par l'admin)
+    __table_args__ = (db.Index('ix_user_identite', 'nom', 'prenom', 'date_naissance'),)
+    
     # Relations
     validations = db.relationship('ValidationGrimpeur', backref='grimpeur', lazy='dynamic')
     inscriptions = db.relationship('InscriptionCompetition', backref='grimpeur', lazy='dynamic')
     
-    def generate_code_connexion(self):
-        """Génère le code de connexion basé sur nom, prénom, année, sexe"""
-        data = f"{self.nom.lower()}{self.prenom.lower()}{self.date_naissance.year}{self.sexe}"
-        hash_obj = hashlib.md5(data.encode('utf-8'))
-        # Convertir en chiffres
-        code = ''.join([str(ord(c) % 10) for c in hash_obj.hexdigest()[:6]])
+    def generate_code_connexion(self, codes_utilises=None):
+        """Génère un code de connexion à 6 chiffres aléatoire et unique
+        
+        codes_utilises : ensemble des codes déjà attribués, pour les générations en masse
+        (pas de requête par utilisateur) ; il est complété avec le nouveau code.
+        """
+        if codes_utilises is not None and len(codes_utilises) >= NB_CODES_POSSIBLES:
+            raise ValueError('Plus aucun code de connexion disponible')
+        
+        while True:
+            code = f"{secrets.randbelow(NB_CODES_POSSIBLES):06d}"
+            if codes_utilises is not None:
+                if code not in codes_utilises:
+                    codes_utilises.add(code)
+                    break
+            elif not User.query.filter_by(code_connexion=code).first():
+                break
+        
         self.code_connexion = code
         return code
     
@@ -56,6 +115,10 @@ class Competition(db.Model):
     nombre_participant_max = db.Column(db.Integer, default=100)
     is_open = db.Column(db.Boolean, default=False)
     inscription_is_open = db.Column(db.Boolean, default=False)
+    classement_version = db.Column(db.Integer, nullable=False, default=0)  # Incrémentée à chaque écriture du classement
+    
+    # Compétitions ouvertes à une date donnée
+    __table_args__ = (db.Index('ix_competition_ouverture_dates', 'is_open', 'date_debut', 'date_fin'),)
     
     # Relations
     categories = db.relationship('CompetitionCategorie', backref='competition', lazy='dynamic', cascade='all, delete-orphan')
@@ -76,6 +139,39 @@ class Competition(db.Model):
     def is_past(self):
         return self.date_fin < datetime.now()
 
+class Serie(db.Model):
+    """Série de compétitions d'une saison, classée par agrégation des résultats de chaque étape
+    
+    agregation : 'somme' (total des scores), 'meilleurs' (nb_resultats meilleurs scores),
+    'points' (points de la place obtenue à chaque étape, bareme_points ; nb_resultats meilleures étapes si renseigné)
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    nom = db.Column(db.String(200), nullable=False)
+    saison = db.Column(db.String(20))
+    agregation = db.Column(db.String(20), nullable=False, default='somme')
+    nb_resultats = db.Column(db.Integer)  # Nombre de résultats retenus, tous si vide
+    bareme_points = db.Column(db.Text)  # JSON : points de la 1re place, de la 2e... (BAREME_POINTS_DEFAUT si vide)
+    version = db.Column(db.Integer, nullable=False, default=0)  # Incrémentée à chaque modification de la série
+    date_creation = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relations
+    competitions = db.relationship('SerieCompetition', backref='serie', lazy='dynamic', cascade='all, delete-orphan')
+    
+    @property
+    def bareme(self):
+        return json.loads(self.bareme_points) if self.bareme_points else BAREME_POINTS_DEFAUT
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'nom': self.nom,
+            'saison': self.saison,
+            'agregation': self.agregation,
+            'nb_resultats': self.nb_resultats,
+            'bareme_points': self.bareme if self.agregation == 'points' else None,
+            'version': self.version
+        }
+
 class Level(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nom = db.Column(db.String(50), nullable=False, unique=True)
@@ -89,6 +185,7 @@ class Voie(db.Model):
     nom = db.Column(db.String(100), nullable=False)
     date_creation = db.Column(db.DateTime, default=datetime.utcnow)
     image_path = db.Column(db.String(200))
+    image_hash = db.Column(db.String(64))  # Empreinte des variantes générées (voir images.py)
     level_id = db.Column(db.Integer, db.ForeignKey('level.id'))
     commentaire = db.Column(db.Text)
     
@@ -105,6 +202,9 @@ class Circle(db.Model):
     ordre = db.Column(db.Integer, nullable=False)
     voie_id = db.Column(db.Integer, db.ForeignKey('voie.id'), nullable=False)
     
+    # Cercles d'une voie dans l'ordre
+    __table_args__ = (db.Index('ix_circle_voie_ordre', 'voie_id', 'ordre'),)
+    
     # Relations
     validations = db.relationship('ValidationGrimpeur', backref='circle', lazy='dynamic')
 
@@ -133,12 +233,53 @@ class ValidationGrimpeur(db.Model):
     competition_id = db.Column(db.Integer, db.ForeignKey('competition.id'), nullable=False)
     circle_id = db.Column(db.Integer, db.ForeignKey('circle.id'), nullable=False)
     
+    __table_args__ = (
+        # Une seule validation par grimpeur, voie et compétition (cible de l'upsert)
+        db.Index('uq_validation_grimpeur_voie_competition', 'grimpeur_id', 'voie_id', 'competition_id', unique=True),
+        # Validations d'une compétition, d'un grimpeur dans une compétition
+        db.Index('ix_validation_competition_grimpeur_voie', 'competition_id', 'grimpeur_id', 'voie_id'),
+    )
+    
     def calculate_score(self):
         """Calcule le score de cette validation"""
         if self.voie and self.voie.level and self.circle:
             return self.voie.level.score / self.circle.ordre
         return 0
 
+class CleIdempotence(db.Model):
+    """Résultat d'une validation déjà traitée, pour répondre à l'identique aux renvois du client"""
+    id = db.Column(db.Integer, primary_key=True)
+    cle = db.Column(db.String(64), nullable=False)
+    grimpeur_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    resultat = db.Column(db.Text, nullable=False)  # JSON
+    date_creation = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('grimpeur_id', 'cle'),)
+
+class Tache(db.Model):
+    """Tâche de fond (traitement d'image, régénération de classement...) exécutée par taches.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    parametres = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    statut = db.Column(db.String(20), nullable=False, default='en_attente', index=True)  # 'en_attente', 'en_cours', 'terminee', 'echec'
+    resultat = db.Column(db.Text)  # JSON
+    erreur = db.Column(db.Text)
+    tentatives = db.Column(db.Integer, nullable=False, default=0)
+    date_creation = db.Column(db.DateTime, default=datetime.utcnow)
+    date_maj = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'statut': self.statut,
+            'resultat': json.loads(self.resultat) if self.resultat else None,
+            'erreur': self.erreur,
+            'tentatives': self.tentatives,
+            'date_creation': self.date_creation.isoformat() if self.date_creation else None,
+            'date_maj': self.date_maj.isoformat() if self.date_maj else None
+        }
+
 # Tables de liaison
 class CompetitionCategorie(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -154,10 +295,48 @@ class CompetitionVoie(db.Model):
     
     __table_args__ = (db.UniqueConstraint('competition_id', 'voie_id'),)
 
+class SerieCompetition(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    serie_id = db.Column(db.Integer, db.ForeignKey('serie.id'), nullable=False)
+    competition_id = db.Column(db.Integer, db.ForeignKey('competition.id'), nullable=False)
+    
+    __table_args__ = (db.UniqueConstraint('serie_id', 'competition_id'),)
+
 class InscriptionCompetition(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     competition_id = db.Column(db.Integer, db.ForeignKey('competition.id'), nullable=False)
     grimpeur_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date_inscription = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('competition_id', 'grimpeur_id'),)
+    # Relations
+    categories = db.relationship('InscriptionCategorie', backref='inscription', lazy='dynamic', cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.UniqueConstraint('competition_id', 'grimpeur_id'),
+        db.Index('ix_inscription_competition_grimpeur', 'grimpeur_id'),  # Compétitions d'un grimpeur
+    )
+
+class InscriptionCategorie(db.Model):
+    """Catégories auxquelles appartient un inscrit, calculées à l'inscription"""
+    id = db.Column(db.Integer, primary_key=True)
+    inscription_id = db.Column(db.Integer, db.ForeignKey('inscription_competition.id'), nullable=False)
+    categorie_id = db.Column(db.Integer, db.ForeignKey('categorie.id'), nullable=False)
+    
+    __table_args__ = (db.UniqueConstraint('inscription_id', 'categorie_id'),)
+
+# Classement matérialisé
+class ScoreGrimpeur(db.Model):
+    """Score total d'un grimpeur pour une compétition, mis à jour à chaque validation"""
+    id = db.Column(db.Integer, primary_key=True)
+    competition_id = db.Column(db.Integer, db.ForeignKey('competition.id'), nullable=False)
+    grimpeur_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    score_total = db.Column(db.Float, nullable=False, default=0)
+    nb_voies = db.Column(db.Integer, nullable=False, default=0)
+    derniere_validation = db.Column(db.DateTime)
+    version = db.Column(db.Integer, nullable=False, default=0)  # classement_version de la dernière modification
+    
+    __table_args__ = (
+        db.UniqueConstraint('competition_id', 'grimpeur_id'),
+        db.Index('ix_score_grimpeur_classement', 'competition_id', 'score_total'),
+        db.Index('ix_score_grimpeur_version', 'competition_id', 'version'),
+    )
@@ -0,0 +1,337 @@
+# moteur_classement.py - Classement vectorisé (NumPy) : matrice grimpeurs × voies, rangs denses, départages
+import threading
+from collections import OrderedDict
+import numpy as np
+from models import db, Voie, Circle, Level, ValidationGrimpeur, CompetitionVoie, InscriptionCompetition, ScoreGrimpeur
+from instantane import instantanes
+from scores import totaux_competition, score_validation, joindre_bareme
+
+# Critères de départage disponibles, dans l'ordre d'application par défaut :
+# - countback : meilleure voie, puis deuxième meilleure voie, etc.
+# - tops : nombre de voies validées au cercle 1 (sommet)
+# - derniere_validation : dernière validation la plus ancienne (objectif atteint le plus tôt)
+DEPARTAGES = ('countback', 'tops', 'derniere_validation')
+
+DECIMALES = 6  # Arrondi des scores comparés : évite les faux départages dus aux flottants
+
+# Dernière validation d'un grimpeur sans validation : après toutes les dates au départage derniere_validation
+SANS_VALIDATION = np.iinfo(np.int64).max
+
+class MatriceScores:
+    """Validations d'une compétition : une ligne par inscrit, une colonne par voie
+    
+    scores[i, j] : score de la validation du grimpeur i sur la voie j (0 sans validation)
+    ordres[i, j] : ordre du cercle atteint (0 sans validation)
+    derniere[i] : dernière validation du grimpeur (microsecondes epoch, SANS_VALIDATION sans validation)
+    """
+    __slots__ = ('grimpeurs_ids', 'voies_ids', 'scores', 'ordres', 'derniere', '_index')
+    
+    def __init__(self, grimpeurs_ids, voies_ids, scores, ordres, derniere):
+        self.grimpeurs_ids = grimpeurs_ids
+        self.voies_ids = voies_ids
+        self.scores = scores
+        self.ordres = ordres
+        self.derniere = derniere
+        self._index = None
+    
+    def index(self, grimpeur_id):
+        """Ligne d'un grimpeur, None s'il n'est pas inscrit"""
+        if self._index is None:
+            self._index = {int(gid): i for i, gid in enumerate(self.grimpeurs_ids)}
+        return self._index.get(grimpeur_id)
+    
+    def validations(self):
+        """Voies validées par grimpeur : {grimpeur_id: [(colonne de la voie, ordre du cercle)]}"""
+        lignes, colonnes = np.nonzero(self.ordres)
+        detail = {}
+        for grimpeur_id, j, ordre in zip(self.grimpeurs_ids[lignes].tolist(), colonnes.tolist(), self.ordres[lignes, colonnes].tolist()):
+            detail.setdefault(grimpeur_id, []).append((j, ordre))
+        return detail
+
+def _validations(competition_id, grimpeurs=None):
+    """Validations qui comptent (règle de scores.joindre_bareme) : tableaux grimpeur_id, voie_id, score, ordre
+    
+    Compétition ouverte : barème lu dans l'instantané, sans jointure ; sinon joint par la base.
+    """
+    instantane = instantanes.obtenir(competition_id)
+    if instantane is None:
+        query = joindre_bareme(db.session.query(
+            ValidationGrimpeur.grimpeur_id, ValidationGrimpeur.voie_id, score_validation, Circle.ordre
+        ))
+    else:
+        query = db.session.query(ValidationGrimpeur.grimpeur_id, ValidationGrimpeur.voie_id, ValidationGrimpeur.circle_id)
+    query = query.filter(ValidationGrimpeur.competition_id == competition_id)
+    if grimpeurs is not None:
+        query = query.filter(ValidationGrimpeur.grimpeur_id.in_(grimpeurs))
+    validations = query.all()
+    
+    if not validations:
+        vide = np.zeros(0, dtype=np.int64)
+        return vide, vide, np.zeros(0, dtype=np.float64), vide
+    gids, vids = (np.fromiter(colonne, dtype=np.int64, count=len(validations)) for colonne in list(zip(*validations))[:2])
+    if instantane is None:
+        _, _, scores, ordres = zip(*validations)
+        return gids, vids, np.array(scores, dtype=np.float64), np.array(ordres, dtype=np.int64)
+    
+    # Tables indexées par id : score du niveau par voie (NaN sans niveau), ordre par cercle (0 inconnu)
+    cids = np.fromiter((v[2] for v in validations), dtype=np.int64, count=len(validations))
+    niveaux = np.full(max(instantane.niveaux, default=0) + 1, np.nan)
+    for voie_id, niveau in instantane.niveaux.items():
+        if niveau is not None:
+            niveaux[voie_id] = niveau
+    ordres = np.zeros(max(instantane.ordres, default=0) + 1, dtype=np.int64)
+    for circle_id, ordre in instantane.ordres.items():
+        ordres[circle_id] = ordre
+    
+    connu = (vids < len(niveaux)) & (cids < len(ordres))
+    niveau = niveaux[np.where(connu, vids, 0)]
+    ordre = ordres[np.where(connu, cids, 0)]
+    garde = connu & ~np.isnan(niveau) & (ordre > 0)
+    return gids[garde], vids[garde], niveau[garde] / ordre[garde], ordre[garde]
+
+def voies_colonnes(competition_id, voies_ids):
+    """(id, nom, score du niveau) des voies de la matrice, dans l'ordre des colonnes"""
+    instantane = instantanes.obtenir(competition_id)
+    voies = {}
+    if instantane is not None:
+        voies = {voie.id: (voie.id, voie.nom, voie.level_score) for voie in instantane.voies.values()}
+    manquantes = [voie_id for voie_id in voies_ids.tolist() if voie_id not in voies]
+    if manquantes:
+        voies.update((ligne[0], tuple(ligne)) for ligne in db.session.query(Voie.id, Voie.nom, Level.score)
+                     .outerjoin(Level, Voie.level_id == Level.id)
+                     .filter(Voie.id.in_(manquantes)))
+    return [voies.get(voie_id, (voie_id, '', 0)) for voie_id in voies_ids.tolist()]
+
+def charger_matrice(competition_id):
+    """Matrice des scores d'une compétition : inscrits, voies, validations et dernières validations
+    
+    Colonnes : voies de la compétition et voies validées hors de la compétition, qui comptent
+    aussi (même règle que scores.joindre_bareme).
+    """
+    grimpeurs_ids = np.array(sorted(row[0] for row in db.session.query(InscriptionCompetition.grimpeur_id)
+                                    .filter(InscriptionCompetition.competition_id == competition_id)), dtype=np.int64)
+    validations = _validations(competition_id)
+    voies_ids = np.union1d(np.array([row[0] for row in db.session.query(CompetitionVoie.voie_id)
+                                     .filter(CompetitionVoie.competition_id == competition_id)], dtype=np.int64),
+                           validations[1])
+    
+    n, m = len(grimpeurs_ids), len(voies_ids)
+    matrice = MatriceScores(
+        grimpeurs_ids, voies_ids,
+        np.zeros((n, m), dtype=np.float64),
+        np.zeros((n, m), dtype=np.int16),
+        np.full(n, SANS_VALIDATION, dtype=np.int64)
+    )
+    _placer_validations(matrice, competition_id, validations)
+    return matrice
+
+def _placer_validations(matrice, competition_id, validations, grimpeurs=None):
+    """Inscrit dans la matrice les validations données (de la compétition, des seuls `grimpeurs` si donnés)"""
+    grimpeurs_ids, voies_ids = matrice.grimpeurs_ids, matrice.voies_ids
+    n, m = len(grimpeurs_ids), len(voies_ids)
+    gids, vids, scores, ordres = validations
+    
+    if not (len(gids) and n and m):
+        return
+    
+    # Validations retenues : grimpeur inscrit (les voies validées sont toutes des colonnes)
+    lignes = np.searchsorted(grimpeurs_ids, gids)
+    colonnes = np.searchsorted(voies_ids, vids)
+    garde = (lignes < n) & (grimpeurs_ids[np.minimum(lignes, n - 1)] == gids)
+    matrice.scores[lignes[garde], colonnes[garde]] = scores[garde]
+    matrice.ordres[lignes[garde], colonnes[garde]] = ordres[garde]
+    
+    # Dernière validation : une ligne par grimpeur, agrégée par la base
+    dernieres = joindre_bareme(db.session.query(ValidationGrimpeur.grimpeur_id, db.func.max(ValidationGrimpeur.datetime_creation)))\
+        .filter(ValidationGrimpeur.competition_id == competition_id)
+    if grimpeurs is not None:
+        dernieres = dernieres.filter(ValidationGrimpeur.grimpeur_id.in_(grimpeurs))
+    dernieres = [(gid, date) for gid, date in dernieres.group_by(ValidationGrimpeur.grimpeur_id) if date is not None]
+    if dernieres:
+        gids, dates = zip(*dernieres)
+        gids = np.array(gids, dtype=np.int64)
+        lignes = np.searchsorted(grimpeurs_ids, gids)
+        inscrit = (lignes < n) & (grimpeurs_ids[np.minimum(lignes, n - 1)] == gids)
+        dates = np.array(dates, dtype='datetime64[us]').astype(np.int64)
+        matrice.derniere[lignes[inscrit]] = dates[inscrit]
+
+class MatricesClassement:
+    """Matrices et classements des compétitions du processus, tenus à jour par différence
+    
+    Chaque écriture du classement marque les lignes ScoreGrimpeur modifiées de la nouvelle version :
+    seules les validations de ces grimpeurs sont relues. Un grimpeur absent de la matrice
+    (inscription) ou trop de lignes modifiées (reconstruction, catégories) : rechargement complet.
+    """
+    
+    def __init__(self, taille=16):
+        self.taille = taille
+        self._entrees = OrderedDict()  # competition_id -> (version, matrice, {départages: Classement})
+        self._lock = threading.Lock()
+    
+    def classement(self, competition_id, version, departages=DEPARTAGES):
+        """Classement de la compétition à la version donnée (Competition.classement_version)"""
+        departages = tuple(departages)
+        with self._lock:
+            entree = self._entrees.get(competition_id)
+            if entree is not None and entree[0] == version:
+                self._entrees.move_to_end(competition_id)
+                resultat = entree[2].get(departages)
+                if resultat is not None:
+                    return resultat
+        
+        if entree is not None and entree[0] == version:
+            matrice = entree[1]
+        elif entree is not None and entree[0] < version:
+            matrice = self._actualiser(competition_id, entree[0], entree[1])
+        else:
+            matrice = charger_matrice(competition_id)
+        resultat = classer(matrice, departages)
+        
+        with self._lock:
+            courante = self._entrees.get(competition_id)
+            if courante is None or courante[0] < version:
+                self._entrees[competition_id] = (version, matrice, {departages: resultat})
+            elif courante[0] == version and courante[1] is matrice:
+                courante[2][departages] = resultat
+            self._entrees.move_to_end(competition_id)
+            while len(self._entrees) > self.taille:
+                self._entrees.popitem(last=False)
+        return resultat
+    
+    def _actualiser(self, competition_id, version_connue, matrice):
+        """Copie de la matrice où seules les lignes modifiées depuis version_connue sont relues"""
+        modifies = np.array(sorted(row[0] for row in db.session.query(ScoreGrimpeur.grimpeur_id)
+                                   .filter(ScoreGrimpeur.competition_id == competition_id)
+                                   .filter(ScoreGrimpeur.version > version_connue)), dtype=np.int64)
+        n = len(matrice.grimpeurs_ids)
+        if len(modifies) > n // 4 + 1:
+            return charger_matrice(competition_id)
+        
+        lignes = np.searchsorted(matrice.grimpeurs_ids, modifies)
+        if np.any(lignes >= n) or np.any(matrice.grimpeurs_ids[np.minimum(lignes, n - 1)] != modifies):
+            return charger_matrice(competition_id)
+        
+        validations = _validations(competition_id, modifies.tolist()) if len(modifies) else None
+        if validations is not None and not np.isin(validations[1], matrice.voies_ids).all():
+            return charger_matrice(competition_id)  # Voie validée hors des colonnes
+        
+        copie = MatriceScores(matrice.grimpeurs_ids, matrice.voies_ids, matrice.scores.copy(),
+                              matrice.ordres.copy(), matrice.derniere.copy())
+        copie.scores[lignes] = 0
+        copie.ordres[lignes] = 0
+        copie.derniere[lignes] = SANS_VALIDATION
+        if validations is not None:
+            _placer_validations(copie, competition_id, validations, modifies.tolist())
+        return copie
+    
+    def vider(self):
+        with self._lock:
+            self._entrees.clear()
+
+class Classement:
+    """Résultat de classer() : ordre global, rangs denses, totaux"""
+    __slots__ = ('matrice', 'totaux', 'nb_voies', 'tops', 'ordre', 'rangs', '_groupes')
+    
+    def __init__(self, matrice, totaux, nb_voies, tops, ordre, rangs, groupes):
+        self.matrice = matrice
+        self.totaux = totaux      # Score total par ligne de la matrice
+        self.nb_voies = nb_voies
+        self.tops = tops
+        self.ordre = ordre        # Lignes de la matrice du premier au dernier
+        self.rangs = rangs        # Rang dense par ligne de la matrice (1 = premier, ex aequo partagés)
+        self._groupes = groupes   # Début de chaque groupe d'ex aequo dans `ordre`
+    
+    def par_categorie(self, appartenance):
+        """Classement de chaque catégorie, toutes calculées ensemble
+        
+        appartenance : booléens (lignes de la matrice × catégories).
+        Retourne, par catégorie, (lignes de la matrice dans l'ordre, rangs denses dans la catégorie).
+        """
+        appartenance = np.asarray(appartenance, dtype=bool)
+        triee = appartenance[self.ordre]
+        if not len(self.ordre):
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)) for _ in range(appartenance.shape[1])]
+        
+        # Rang dans une catégorie = nombre de groupes d'ex aequo représentés dans la catégorie
+        # jusqu'au groupe du grimpeur inclus
+        presence = np.logical_or.reduceat(triee, self._groupes, axis=0)
+        rangs_groupes = np.cumsum(presence, axis=0)
+        groupe_de_ligne = np.repeat(np.arange(len(self._groupes)), np.diff(np.append(self._groupes, len(self.ordre))))
+        
+        resultats = []
+        for j in range(appartenance.shape[1]):
+            positions = np.flatnonzero(triee[:, j])
+            resultats.append((self.ordre[positions], rangs_groupes[groupe_de_ligne[positions], j]))
+        return resultats
+
+def par_categories(resultat, categories_ids, membres):
+    """Classement de chaque catégorie (Classement.par_categorie) à partir de couples (grimpeur_id, categorie_id)"""
+    matrice = resultat.matrice
+    colonnes = {categorie_id: j for j, categorie_id in enumerate(categories_ids)}
+    appartenance = np.zeros((len(matrice.grimpeurs_ids), len(colonnes)), dtype=bool)
+    for grimpeur_id, categorie_id in membres:
+        i = matrice.index(grimpeur_id)
+        j = colonnes.get(categorie_id)
+        if i is not None and j is not None:
+            appartenance[i, j] = True
+    return resultat.par_categorie(appartenance)
+
+def rangs_competition(rangs):
+    """Rangs « 1224 » à partir de rangs denses triés (ordre du classement) : les ex aequo partagent
+    la place et les places suivantes sont sautées (100, 100, 90 -> 1, 1, 3)"""
+    rangs = np.asarray(rangs)
+    return np.searchsorted(rangs, rangs, side='left') + 1
+
+def cles_tri(matrice, departages=DEPARTAGES):
+    """Matrice des clés de tri (lignes × critères), à trier par ordre croissant, total en premier"""
+    totaux = matrice.scores.sum(axis=1)
+    cles = [-np.round(totaux, DECIMALES)[:, None]]
+    for critere in departages:
+        if critere == 'countback':
+            meilleures = -np.sort(matrice.scores, axis=1)[:, ::-1]
+            cles.append(np.round(meilleures, DECIMALES))
+        elif critere == 'tops':
+            cles.append(-(matrice.ordres == 1).sum(axis=1, dtype=np.float64)[:, None])
+        elif critere == 'derniere_validation':
+            cles.append(matrice.derniere.astype(np.float64)[:, None])
+        else:
+            raise ValueError(f"Critère de départage inconnu: {critere}")
+    return np.hstack(cles), totaux
+
+def classer(matrice, departages=DEPARTAGES):
+    """Classe les grimpeurs : score total décroissant, puis les critères de départage dans l'ordre"""
+    cles, totaux = cles_tri(matrice, departages)
+    n = len(totaux)
+    
+    # np.lexsort trie sur la dernière clé en premier : critères inversés
+    ordre = np.lexsort(cles.T[::-1]) if n else np.zeros(0, dtype=np.int64)
+    triees = cles[ordre]
+    nouveau = np.ones(n, dtype=bool)
+    nouveau[1:] = np.any(triees[1:] != triees[:-1], axis=1)
+    
+    rangs = np.empty(n, dtype=np.int64)
+    rangs[ordre] = np.cumsum(nouveau)
+    
+    return Classement(
+        matrice,
+        totaux,
+        (matrice.ordres > 0).sum(axis=1),
+        (matrice.ordres == 1).sum(axis=1),
+        ordre,
+        rangs,
+        np.flatnonzero(nouveau)
+    )
+
+def ecarts_sql(competition_id, resultat, tolerance=1e-9):
+    """Grimpeurs dont le total ou le nombre de voies diffère du calcul SQL (scores.totaux_competition)"""
+    totaux = totaux_competition(competition_id)
+    matrice = resultat.matrice
+    ecarts = []
+    for i, grimpeur_id in enumerate(matrice.grimpeurs_ids.tolist()):
+        attendu = totaux.get(grimpeur_id, {'score_total': 0, 'nb_voies': 0})
+        if abs(attendu['score_total'] - resultat.totaux[i]) > tolerance or attendu['nb_voies'] != resultat.nb_voies[i]:
+            ecarts.append((grimpeur_id, attendu['score_total'], float(resultat.totaux[i]),
+                           attendu['nb_voies'], int(resultat.nb_voies[i])))
+    return ecarts
+
+matrices_classement = MatricesClassement()
@@ -0,0 +1,42 @@
+# pagination.py - Pagination par curseur (keyset) des listes d'administration
+import base64
+import json
+from models import db
+
+class CurseurInvalide(ValueError):
+    pass
+
+def encoder_curseur(valeurs):
+    return base64.urlsafe_b64encode(json.dumps(valeurs).encode()).decode().rstrip('=')
+
+def decoder_curseur(curseur):
+    try:
+        valeurs = json.loads(base64.urlsafe_b64decode(curseur + '=' * (-len(curseur) % 4)))
+    except (ValueError, TypeError):
+        raise CurseurInvalide(curseur)
+    if not isinstance(valeurs, list):
+        raise CurseurInvalide(curseur)
+    return valeurs
+
+def page_keyset(query, cles, curseur=None, limite=50, descendant=False):
+    """Page suivant le curseur d'une requête triée sur `cles` (la dernière clé doit être unique)
+    
+    Retourne (lignes, curseur suivant ou None). La condition porte sur le tuple des clés :
+    chaque page est une requête indexée, quelle que soit sa position dans la liste.
+    """
+    if curseur:
+        valeurs = decoder_curseur(curseur)
+        if len(valeurs) != len(cles):
+            raise CurseurInvalide(curseur)
+        tuple_cles = db.tuple_(*cles)
+        query = query.filter(tuple_cles < db.tuple_(*valeurs) if descendant else tuple_cles > db.tuple_(*valeurs))
+    
+    query = query.order_by(*(cle.desc() if descendant else cle for cle in cles))
+    lignes = query.limit(limite + 1).all()
+    
+    suivant = None
+    if len(lignes) > limite:
+        lignes = lignes[:limite]
+        suivant = encoder_curseur([getattr(lignes[-1], cle.key) for cle in cles])
+    
+    return lignes, suivant
@@ -0,0 +1,70 @@
+# plans_requetes.py - Vérification des plans d'exécution des requêtes fréquentes (flask check-query-plans)
+from datetime import date, datetime
+from sqlalchemy import text
+from models import db, User, Competition, Circle, ValidationGrimpeur, InscriptionCompetition
+
+def _requetes():
+    """(nom, requête, index attendus) : mêmes filtres que les endpoints, paramètres arbitraires"""
+    aujourd_hui = date.today()
+    return [
+        ('validations_grimpeur',
+         db.session.query(ValidationGrimpeur.voie_id, ValidationGrimpeur.circle_id)
+            .filter(ValidationGrimpeur.competition_id == 1)
+            .filter(ValidationGrimpeur.grimpeur_id == 1),
+         ['ix_validation_competition_grimpeur_voie']),
+        ('validations_competition',
+         db.session.query(ValidationGrimpeur.grimpeur_id, ValidationGrimpeur.voie_id, ValidationGrimpeur.circle_id)
+            .filter(ValidationGrimpeur.competition_id == 1),
+         ['ix_validation_competition_grimpeur_voie']),
+        ('inscriptions_grimpeur',
+         db.session.query(InscriptionCompetition.competition_id)
+            .filter(InscriptionCompetition.grimpeur_id == 1),
+         ['ix_inscription_competition_grimpeur']),
+        ('circles_voie',
+         Circle.query.filter_by(voie_id=1).order_by(Circle.ordre),
+         ['ix_circle_voie_ordre']),
+        ('grimpeur_existant',
+         User.query.filter_by(nom='Nom', prenom='Prenom', date_naissance=date(2000, 1, 1)),
+         ['ix_user_identite']),
+        ('competitions_ouvertes_du_jour',
+         db.session.query(Competition.id)
+            .filter(Competition.is_open == True)
+            .filter(Competition.date_debut <= datetime.combine(aujourd_hui, datetime.max.time()))
+            .filter(Competition.date_fin >= datetime.combine(aujourd_hui, datetime.min.time())),
+         ['ix_competition_ouverture_dates']),
+    ]
+
+def plan_requete(connexion, requete):
+    """Plan d'exécution d'une requête ORM (EXPLAIN QUERY PLAN en SQLite, EXPLAIN ailleurs)"""
+    compilee = requete.statement.compile(dialect=connexion.dialect)
+    if compilee.positional:
+        parametres = tuple(compilee.params[nom] for nom in compilee.positiontup)
+    else:
+        parametres = compilee.params
+    
+    prefixe = 'EXPLAIN QUERY PLAN ' if connexion.dialect.name == 'sqlite' else 'EXPLAIN '
+    lignes = connexion.exec_driver_sql(prefixe + str(compilee), parametres).fetchall()
+    return "\n".join(" | ".join(str(colonne) for colonne in ligne) for ligne in lignes)
+
+def verifier_plans():
+    """Liste de (nom, index attendus, plan, conforme) pour chaque requête fréquente
+    
+    Sur PostgreSQL, les parcours séquentiels sont désactivés le temps de la vérification :
+    sur une petite table, le planificateur les préfère même quand l'index convient.
+    """
+    resultats = []
+    connexion = db.session.connection()
+    if connexion.dialect.name == 'postgresql':
+        connexion.execute(text("SET LOCAL enable_seqscan = off"))
+    elif connexion.dialect.name == 'sqlite':
+        # EXPLAIN ne revérifie pas le schéma en cache de la connexion : le relire, des index
+        # ont pu être créés ou supprimés par une autre connexion du pool
+        connexion.execute(text("SELECT count(*) FROM sqlite_master"))
+    try:
+        for nom, requete, index_attendus in _requetes():
+            plan = plan_requete(connexion, requete)
+            conforme = any(index in plan for index in index_attendus)
+            resultats.append((nom, index_attendus, plan, conforme))
+    finally:
+        db.session.rollback()
+    return resultats
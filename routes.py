@@ -1,16 +1,37 @@
 # routes.py - Routes API complètes pour l'application d'escalade
 
-from flask import Blueprint, request, jsonify, session, current_app
-from werkzeug.utils import secure_filename
+from flask import Blueprint, request, jsonify, session, current_app, g, Response, stream_with_context, send_from_directory
 import os
+import re
+import hmac
 import json
+import unicodedata
+import time
 from datetime import datetime, date
-from models import db, User, Competition, Voie, Circle, Level, Categorie, ValidationGrimpeur, CompetitionCategorie, CompetitionVoie, InscriptionCompetition
+from models import db, User, Competition, Voie, Circle, Level, Categorie, ValidationGrimpeur, CompetitionCategorie, CompetitionVoie, InscriptionCompetition, InscriptionCategorie, ScoreGrimpeur, CleIdempotence, Tache, Serie, SerieCompetition, AGREGATIONS_SERIE
+from classement import maj_score_grimpeur, reconstruire_scores, competitions_de_voie, incrementer_version, categories_competition, assigner_categories, reassigner_categories_grimpeur, categories_classement, detail_classement, lignes_classement, rangs_categories, positions_json
+from scores import validations_grimpeur
+from diffusion import notifier_classement, flux_classement
+from validations import upsert_validation, enregistrer_validation, resultat_idempotent, memoriser_resultat
+from sqlalchemy.exc import IntegrityError
+from codes_connexion import cache_codes
+from images import enregistrer_original, url_original, url_variante, images_voie
+from taches import creer_tache, file_taches
+from catalogue import catalogue_voies
+from instantane import instantanes
+from pagination import page_keyset, CurseurInvalide
+from base_donnees import profil_base
+from moteur_classement import matrices_classement, par_categories, voies_colonnes
+from series import classements_series
+from statistiques import statistiques
+from format_classement import CHAMPS, CHAMPS_COMPACT, champs_demandes, classement_compact, encoder_json, encodage_accepte, compresser, cache_corps
+from exports import FORMATS, flux_export, source_classement, source_inscriptions, source_validations, ENTETES_CLASSEMENT, ENTETES_INSCRIPTIONS, ENTETES_VALIDATIONS
 
 # Création des blueprints
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 grimpeur_bp = Blueprint('grimpeur', __name__, url_prefix='/grimpeur')
+media_bp = Blueprint('media', __name__, url_prefix='/media')
 
 # Décorateurs pour vérifier les rôles
 def require_login(f):
@@ -29,6 +50,14 @@ def require_admin_or_ouvreur(f):
     wrapper.__name__ = f.__name__
     return wrapper
 
+def lecture_seule(f):
+    """Vue sans écriture : ses lectures peuvent être servies par la base de lecture (lecture.py)"""
+    def wrapper(*args, **kwargs):
+        g.lecture_seule = True
+        return f(*args, **kwargs)
+    wrapper.__name__ = f.__name__
+    return wrapper
+
 def require_admin(f):
     def wrapper(*args, **kwargs):
         if 'user_id' not in session or session.get('user_role') != 'admin':
@@ -60,14 +89,15 @@ def get_current_user():
 @api_bp.route('/login', methods=['POST'])
 def api_login():
     data = request.get_json()
-    code = data.get('code')
+    # Code saisi ou envoyé en nombre : comparé sous la forme enregistrée (chaîne sans espaces)
+    code = str(data.get('code') or '').strip()
     
-    user = User.query.filter_by(code_connexion=code).first()
+    user = cache_codes.resoudre([code]).get(code) if code else None
     
     if user:
-        session['user_id'] = user.id
-        session['user_role'] = user.role
-        return jsonify({'success': True, 'user': {'role': user.role}})
+        session['user_id'] = user['id']
+        session['user_role'] = user['role']
+        return jsonify({'success': True, 'user': {'role': user['role']}})
     
     return jsonify({'success': False, 'message': 'Code invalide'}), 400
 
@@ -101,49 +131,55 @@ def get_grimpeur_competitions():
 
 @api_bp.route('/voies/list')
 @require_login
+@lecture_seule
 def get_voies_list():
     user_id = session['user_id']
-    competition_id = request.args.get('competition_id')
+    competition_id = request.args.get('competition_id', type=int)
     
     if not competition_id:
         return jsonify({'error': 'competition_id requis'}), 400
     
-    # Récupérer les voies de la compétition
-    voies = db.session.query(Voie).join(CompetitionVoie)\
-        .filter(CompetitionVoie.competition_id == competition_id)\
-        .all()
+    # Catalogue commun (instantané si la compétition est ouverte, sinon cache), statut du grimpeur en une requête
+    instantane = instantanes.obtenir(competition_id)
+    if instantane is not None:
+        voies = instantane.catalogue
+        validations = instantane.validations_grimpeur(user_id)
+    else:
+        voies = catalogue_voies.voies(competition_id)
+        validations = validations_grimpeur(competition_id, user_id)
     
     result = []
     for voie in voies:
-        # Vérifier si le grimpeur a validé cette voie
-        validation = ValidationGrimpeur.query.filter_by(
-            grimpeur_id=user_id,
-            voie_id=voie.id,
-            competition_id=competition_id
-        ).first()
-        
-        result.append({
-            'id': voie.id,
-            'nom': voie.nom,
-            'level_name': voie.level.nom if voie.level else 'N/A',
-            'image_path': voie.image_path or '/static/default-climb.jpg',
-            'validated': validation is not None
-        })
+        validation = validations.get(voie['id'])
+        result.append(dict(
+            voie,
+            validated=validation is not None,
+            ordre_circle=validation['ordre_circle'] if validation else None,
+            score=validation['score'] if validation else 0
+        ))
     
     return jsonify(result)
 
 @api_bp.route('/voie/<int:voie_id>')
 @require_login
+@lecture_seule
 def get_voie_details(voie_id):
-    voie = Voie.query.get_or_404(voie_id)
-    
-    circles = Circle.query.filter_by(voie_id=voie_id).order_by(Circle.ordre).all()
+    # Voie d'une compétition ouverte : lue dans l'instantané, sans requête sur les voies/cercles
+    voie = instantanes.voie(voie_id)
+    if voie is not None:
+        circles = voie.circles
+        level_name = voie.level_name
+    else:
+        voie = Voie.query.get_or_404(voie_id)
+        circles = Circle.query.filter_by(voie_id=voie_id).order_by(Circle.ordre).all()
+        level_name = voie.level.nom if voie.level else 'N/A'
     
     return jsonify({
         'id': voie.id,
         'nom': voie.nom,
-        'level_name': voie.level.nom if voie.level else 'N/A',
-        'image_path': voie.image_path or '/static/default-climb.jpg',
+        'level_name': level_name,
+        'image_path': url_variante(voie.image_hash, 'mobile', 'jpg') if voie.image_hash else (voie.image_path or '/static/default-climb.jpg'),
+        'images': images_voie(voie),
         'commentaire': voie.commentaire,
         'circles': [{
             'id': circle.id,
@@ -167,63 +203,241 @@ def validate_grimpeur():
     if not all([circle_id, voie_id, competition_id]):
         return jsonify({'success': False, 'message': 'Données manquantes'}), 400
     
-    # Vérifier si le grimpeur est inscrit à la compétition
-    inscription = InscriptionCompetition.query.filter_by(
-        grimpeur_id=user_id,
-        competition_id=competition_id
-    ).first()
+    try:
+        circle_id, voie_id, competition_id = int(circle_id), int(voie_id), int(competition_id)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Données invalides'}), 400
+    
+    # Renvoi d'une validation déjà traitée : même réponse, sans rien réécrire
+    cle = data.get('idempotency_key')
+    deja = resultat_idempotent(user_id, cle)
+    if deja is not None:
+        return jsonify(deja)
+    
+    # Vérifier si le grimpeur est inscrit à la compétition (et le cercle, si la compétition est ouverte)
+    instantane = instantanes.obtenir(competition_id)
+    if instantane is not None:
+        inscrit = instantane.grimpeur(user_id) is not None
+    else:
+        inscrit = InscriptionCompetition.query.filter_by(
+            grimpeur_id=user_id,
+            competition_id=competition_id
+        ).first() is not None
     
-    if not inscription:
+    if not inscrit:
         return jsonify({'success': False, 'message': 'Non inscrit à cette compétition'}), 403
     
-    # Vérifier si une validation existe déjà pour cette voie
-    existing = ValidationGrimpeur.query.filter_by(
-        grimpeur_id=user_id,
-        voie_id=voie_id,
-        competition_id=competition_id
-    ).first()
-    
-    if existing:
-        # Mettre à jour la validation existante
-        existing.circle_id = circle_id
-        existing.datetime_creation = datetime.utcnow()
-    else:
-        # Créer une nouvelle validation
-        validation = ValidationGrimpeur(
-            grimpeur_id=user_id,
-            voie_id=voie_id,
-            competition_id=competition_id,
-            circle_id=circle_id
-        )
-        db.session.add(validation)
+    if instantane is not None and not instantane.circle_valide(voie_id, circle_id):
+        return jsonify({'success': False, 'message': 'Cercle inconnu pour cette voie'}), 400
     
     try:
-        db.session.commit()
+        profil_base.ecrire(enregistrer_validation, user_id, voie_id, competition_id, circle_id, user_id, cle)
+        notifier_classement(competition_id)
+        statistiques.validation(competition_id, user_id, voie_id,
+                                instantane.voies[voie_id].ordres[circle_id] if instantane is not None else None)
         return jsonify({'success': True})
+    except IntegrityError as e:
+        # Renvoi concurrent avec la même clé : l'autre requête a déjà enregistré la validation
+        db.session.rollback()
+        deja = resultat_idempotent(user_id, cle)
+        if deja is not None:
+            return jsonify(deja)
+        return jsonify({'success': False, 'message': str(e)}), 500
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@api_bp.route('/validate/batch', methods=['POST'])
+@require_login
+def validate_grimpeur_batch():
+    """Applique une liste ordonnée de validations (file hors ligne du téléphone) en une transaction"""
+    data = request.get_json() or {}
+    user_id = session['user_id']
+    elements = data.get('validations')
+    
+    if not isinstance(elements, list) or not elements:
+        return jsonify({'success': False, 'message': 'Liste de validations requise'}), 400
+    
+    if len(elements) > current_app.config['VALIDATION_BATCH_MAX']:
+        return jsonify({'success': False, 'message': 'Trop de validations dans un seul envoi'}), 400
+    
+    elements = [element if isinstance(element, dict) else {} for element in elements]
+    elements_valides = []
+    for element in elements:
+        try:
+            elements_valides.append({
+                'circle_id': int(element['circle_id']),
+                'voie_id': int(element['voie_id']),
+                'competition_id': int(element['competition_id'])
+            })
+        except (KeyError, TypeError, ValueError):
+            elements_valides.append(None)
+    
+    competitions_ids = {e['competition_id'] for e in elements_valides if e}
+    voies_ids = {e['voie_id'] for e in elements_valides if e}
+    cles = [e.get('idempotency_key') for e in elements if e.get('idempotency_key')]
+    
+    # Trois requêtes pour tout l'envoi : clés déjà traitées, inscriptions, validations existantes
+    deja_traitees = {}
+    if cles:
+        for cle in CleIdempotence.query.filter(CleIdempotence.grimpeur_id == user_id, CleIdempotence.cle.in_(cles)):
+            deja_traitees[cle.cle] = json.loads(cle.resultat)
+    
+    # Compétitions ouvertes : inscription et cercles vérifiés dans l'instantané
+    instantanes_batch = {}
+    for competition_id in competitions_ids:
+        instantane = instantanes.obtenir(competition_id)
+        if instantane is not None:
+            instantanes_batch[competition_id] = instantane
+    
+    inscriptions = {competition_id for competition_id, instantane in instantanes_batch.items()
+                    if instantane.grimpeur(user_id) is not None}
+    autres_competitions = competitions_ids - set(instantanes_batch)
+    if autres_competitions:
+        inscriptions.update(row[0] for row in db.session.query(InscriptionCompetition.competition_id)
+                            .filter(InscriptionCompetition.grimpeur_id == user_id)
+                            .filter(InscriptionCompetition.competition_id.in_(autres_competitions)))
+    
+    existantes = {
+        (competition_id, voie_id): horodatage
+        for competition_id, voie_id, horodatage in db.session.query(
+                ValidationGrimpeur.competition_id,
+                ValidationGrimpeur.voie_id,
+                ValidationGrimpeur.datetime_creation
+            )
+            .filter(ValidationGrimpeur.grimpeur_id == user_id)
+            .filter(ValidationGrimpeur.competition_id.in_(competitions_ids))
+            .filter(ValidationGrimpeur.voie_id.in_(voies_ids))
+    }
+    
+    maintenant = datetime.utcnow()
+    resultats = []
+    ecritures = []
+    memorisations = []
+    competitions_modifiees = set()
+    
+    for index, (element, valide) in enumerate(zip(elements, elements_valides)):
+        cle = element.get('idempotency_key')
+        
+        if cle and cle in deja_traitees:
+            resultats.append(dict(deja_traitees[cle], index=index, doublon=True))
+            continue
+        
+        resultat = {'index': index, 'idempotency_key': cle}
+        
+        if valide is None:
+            resultat.update(success=False, statut='erreur', message='Données manquantes')
+        elif valide['competition_id'] not in inscriptions:
+            resultat.update(success=False, statut='erreur', message='Non inscrit à cette compétition')
+        elif valide['competition_id'] in instantanes_batch and \
+                not instantanes_batch[valide['competition_id']].circle_valide(valide['voie_id'], valide['circle_id']):
+            resultat.update(success=False, statut='erreur', message='Cercle inconnu pour cette voie')
+        else:
+            # Horodatage client (ms) borné à l'heure serveur : sert à ignorer les validations dépassées
+            try:
+                horodatage = min(datetime.utcfromtimestamp(float(element['client_ts']) / 1000), maintenant)
+            except (KeyError, TypeError, ValueError, OverflowError, OSError):
+                horodatage = maintenant
+            
+            derniere = existantes.get((valide['competition_id'], valide['voie_id']))
+            if derniere and derniere > horodatage:
+                resultat.update(success=True, statut='obsolete')
+            else:
+                ecritures.append((valide, horodatage))
+                existantes[(valide['competition_id'], valide['voie_id'])] = horodatage
+                competitions_modifiees.add(valide['competition_id'])
+                resultat.update(success=True, statut='enregistree')
+        
+        if cle:
+            deja_traitees[cle] = resultat
+            memorisations.append((cle, resultat))
+        resultats.append(resultat)
+    
+    # Écritures regroupées après les décisions : la transaction peut être rejouée si la base est occupée
+    def enregistrer():
+        for valide, horodatage in ecritures:
+            upsert_validation(user_id, valide['voie_id'], valide['competition_id'], valide['circle_id'], horodatage)
+        for cle, resultat in memorisations:
+            memoriser_resultat(user_id, cle, resultat)
+        for competition_id in competitions_modifiees:
+            maj_score_grimpeur(competition_id, user_id)
+        db.session.commit()
+    
+    try:
+        profil_base.ecrire(enregistrer)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+    
+    for competition_id in competitions_modifiees:
+        notifier_classement(competition_id)
+    for valide, _ in ecritures:
+        instantane = instantanes_batch.get(valide['competition_id'])
+        statistiques.validation(valide['competition_id'], user_id, valide['voie_id'],
+                                instantane.voies[valide['voie_id']].ordres[valide['circle_id']] if instantane is not None else None)
+    
+    return jsonify({'success': True, 'results': resultats})
+
 # Routes pour l'administration des voies
 @api_bp.route('/admin/voies')
 @require_admin_or_ouvreur
+@lecture_seule
 def get_admin_voies():
-    voies = Voie.query.all()
+    # Une seule requête : niveau joint, nombre de cercles par sous-requête groupée
+    nb_circles = db.session.query(Circle.voie_id, db.func.count(Circle.id).label('nb'))\
+        .group_by(Circle.voie_id).subquery()
+    
+    voies = db.session.query(
+        Voie.id, Voie.nom, Voie.image_path, Voie.commentaire, Voie.date_creation,
+        Level.nom.label('level_nom'), Level.score.label('level_score'),
+        db.func.coalesce(nb_circles.c.nb, 0).label('nb_circles')
+    ).outerjoin(Level, Voie.level_id == Level.id)\
+        .outerjoin(nb_circles, nb_circles.c.voie_id == Voie.id)
+    
+    # Filtres côté serveur
+    level_id = request.args.get('level_id', type=int)
+    if level_id:
+        voies = voies.filter(Voie.level_id == level_id)
+    competition_id = request.args.get('competition_id', type=int)
+    if competition_id:
+        voies = voies.filter(Voie.id.in_(
+            db.session.query(CompetitionVoie.voie_id).filter(CompetitionVoie.competition_id == competition_id)
+        ))
+    recherche = request.args.get('q', '').strip()
+    if recherche:
+        voies = voies.filter(Voie.nom.ilike(f"%{recherche}%"))
+    
+    try:
+        voies, suivant = page_keyset(voies, [Voie.nom, Voie.id], *parametres_page())
+    except CurseurInvalide:
+        return jsonify({'success': False, 'message': 'Curseur invalide'}), 400
     
     result = []
     for voie in voies:
         result.append({
             'id': voie.id,
             'nom': voie.nom,
-            'level_name': voie.level.nom if voie.level else 'N/A',
-            'level_score': voie.level.score if voie.level else 0,
+            'level_name': voie.level_nom or 'N/A',
+            'level_score': voie.level_score or 0,
             'image_path': voie.image_path,
             'commentaire': voie.commentaire,
             'date_creation': voie.date_creation.strftime('%d/%m/%Y'),
-            'nb_circles': voie.circles.count()
+            'nb_circles': voie.nb_circles
         })
     
-    return jsonify(result)
+    return jsonify({'success': True, 'voies': result, 'next_cursor': suivant})
+
+def parametres_page():
+    """(curseur, taille de page) d'une liste d'administration paginée"""
+    limite = request.args.get('limit', current_app.config['ADMIN_PAGE_TAILLE'], type=int)
+    return request.args.get('cursor'), max(1, min(limite, current_app.config['ADMIN_PAGE_MAX']))
+
+@api_bp.route('/admin/stats')
+@require_admin_or_ouvreur
+@lecture_seule
+def get_stats():
+    """Tableau de bord : compteurs en mémoire, réconciliés périodiquement avec la base"""
+    return jsonify(statistiques.lire())
 
 @api_bp.route('/admin/levels')
 @require_admin_or_ouvreur
@@ -247,27 +461,22 @@ def create_voie():
     if not nom or not level_id:
         return jsonify({'success': False, 'message': 'Nom et niveau requis'}), 400
     
-    # Gérer l'upload de l'image
-    image_path = None
+    # Gérer l'upload de l'image : original enregistré tel quel, variantes générées en tâche de fond
+    original = None
     if 'image' in request.files:
         file = request.files['image']
         if file and file.filename:
-            filename = secure_filename(file.filename)
-            # Ajouter un timestamp pour éviter les conflits
-            filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            
-            # Créer le dossier s'il n'existe pas
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            file.save(file_path)
-            image_path = f"/static/uploads/{filename}"
+            try:
+                original = enregistrer_original(file, current_app.config['UPLOAD_FOLDER'])
+            except Exception:
+                return jsonify({'success': False, 'message': 'Image invalide'}), 400
     
     # Créer la voie
     voie = Voie(
         nom=nom,
         level_id=int(level_id),
         commentaire=commentaire,
-        image_path=image_path
+        image_path=url_original(original) if original else None
     )
     
     db.session.add(voie)
@@ -287,8 +496,12 @@ def create_voie():
             )
             db.session.add(circle)
         
+        taches = []
+        if original:
+            taches.append(creer_tache('image_voie', voie_id=voie.id, original=original))
+        
         db.session.commit()
-        return jsonify({'success': True, 'voie_id': voie.id})
+        return jsonify({'success': True, 'voie_id': voie.id, 'taches': lancer_taches(taches)})
     
     except Exception as e:
         db.session.rollback()
@@ -319,6 +532,18 @@ def update_voie(voie_id):
         voie.level_id = int(level_id)
     voie.commentaire = commentaire
     
+    # Nouvelle image éventuelle, traitée en tâche de fond comme à la création
+    original = None
+    if 'image' in request.files:
+        file = request.files['image']
+        if file and file.filename:
+            try:
+                original = enregistrer_original(file, current_app.config['UPLOAD_FOLDER'])
+            except Exception:
+                return jsonify({'success': False, 'message': 'Image invalide'}), 400
+            voie.image_path = url_original(original)
+            voie.image_hash = None
+    
     try:
         # Supprimer les anciens cercles
         Circle.query.filter_by(voie_id=voie_id).delete()
@@ -335,42 +560,91 @@ def update_voie(voie_id):
             )
             db.session.add(circle)
         
+        taches = []
+        if original:
+            taches.append(creer_tache('image_voie', voie_id=voie_id, original=original))
+        
+        # Le niveau ou les cercles ont pu changer : régénérer les classements concernés
+        for comp_id in competitions_de_voie(voie_id):
+            taches.append(creer_tache('reconstruire_scores', competition_id=comp_id))
+        
         db.session.commit()
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'taches': lancer_taches(taches)})
     
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def lancer_taches(taches):
+    """Soumet au pool les tâches qui viennent d'être commitées et décrit leur suivi"""
+    result = []
+    for tache in taches:
+        file_taches.lancer(tache.id)
+        result.append({'id': tache.id, 'type': tache.type, 'url': f'/api/taches/{tache.id}'})
+    return result
+
+@api_bp.route('/taches/<int:tache_id>')
+@require_admin_or_ouvreur
+def get_tache(tache_id):
+    tache = Tache.query.get_or_404(tache_id)
+    return jsonify({'success': True, 'tache': tache.to_dict()})
+
 # Routes pour les compétitions
 @api_bp.route('/admin/competitions')
 @require_admin_or_ouvreur
+@lecture_seule
 def get_competitions():
-    competitions = Competition.query.order_by(Competition.date_creation.desc()).all()
+    # Deux requêtes au total : compétitions avec leurs compteurs groupés, puis toutes les catégories
+    nb_inscrits = db.session.query(InscriptionCompetition.competition_id, db.func.count(InscriptionCompetition.id).label('nb'))\
+        .group_by(InscriptionCompetition.competition_id).subquery()
+    nb_voies = db.session.query(CompetitionVoie.competition_id, db.func.count(CompetitionVoie.id).label('nb'))\
+        .group_by(CompetitionVoie.competition_id).subquery()
+    
+    competitions = db.session.query(
+        Competition.id, Competition.nom, Competition.date_debut, Competition.date_fin,
+        Competition.nombre_participant_max, Competition.is_open, Competition.inscription_is_open,
+        db.func.coalesce(nb_inscrits.c.nb, 0).label('nb_inscrits'),
+        db.func.coalesce(nb_voies.c.nb, 0).label('nb_voies')
+    ).outerjoin(nb_inscrits, nb_inscrits.c.competition_id == Competition.id)\
+        .outerjoin(nb_voies, nb_voies.c.competition_id == Competition.id)
+    
+    # Filtres côté serveur
+    if request.args.get('is_open') in ('0', '1'):
+        competitions = competitions.filter(Competition.is_open == (request.args['is_open'] == '1'))
+    recherche = request.args.get('q', '').strip()
+    if recherche:
+        competitions = competitions.filter(Competition.nom.ilike(f"%{recherche}%"))
+    
+    # Plus récentes d'abord : l'identifiant suit l'ordre de création
+    try:
+        competitions, suivant = page_keyset(competitions, [Competition.id], *parametres_page(), descendant=True)
+    except CurseurInvalide:
+        return jsonify({'success': False, 'message': 'Curseur invalide'}), 400
+    
+    categories = {}
+    for competition_id, nom in db.session.query(CompetitionCategorie.competition_id, Categorie.nom)\
+            .join(Categorie, CompetitionCategorie.categorie_id == Categorie.id)\
+            .filter(CompetitionCategorie.competition_id.in_([comp.id for comp in competitions]))\
+            .order_by(CompetitionCategorie.id):
+        categories.setdefault(competition_id, []).append(nom)
     
     result = []
     for comp in competitions:
-        nb_inscrits = InscriptionCompetition.query.filter_by(competition_id=comp.id).count()
-        nb_voies = CompetitionVoie.query.filter_by(competition_id=comp.id).count()
-        
-        categories = db.session.query(Categorie).join(CompetitionCategorie)\
-            .filter(CompetitionCategorie.competition_id == comp.id).all()
-        
         result.append({
             'id': comp.id,
             'nom': comp.nom,
             'date_debut': comp.date_debut.strftime('%d/%m/%Y %H:%M'),
             'date_fin': comp.date_fin.strftime('%d/%m/%Y %H:%M'),
             'nb_participant_max': comp.nombre_participant_max,
-            'nb_inscrits': nb_inscrits,
-            'nb_voies': nb_voies,
+            'nb_inscrits': comp.nb_inscrits,
+            'nb_voies': comp.nb_voies,
             'is_open': comp.is_open,
             'inscription_is_open': comp.inscription_is_open,
-            'categories': [cat.nom for cat in categories],
+            'categories': categories.get(comp.id, []),
             'status': 'En cours' if comp.is_open else 'Fermée'
         })
     
-    return jsonify(result)
+    return jsonify({'success': True, 'competitions': result, 'next_cursor': suivant})
 
 @api_bp.route('/competition/create', methods=['POST'])
 @require_admin_or_ouvreur
@@ -420,6 +694,28 @@ def create_competition():
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@api_bp.route('/competition/<int:comp_id>/ouverture', methods=['POST'])
+@require_admin
+def ouverture_competition(comp_id):
+    """Ouvre ou ferme une compétition ; l'ouverture fige voies, cercles et catégories en mémoire"""
+    competition = Competition.query.get_or_404(comp_id)
+    data = request.get_json() or {}
+    
+    competition.is_open = bool(data.get('is_open'))
+    
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+    
+    if competition.is_open:
+        instantanes.construire(comp_id)
+    else:
+        instantanes.abandonner(comp_id)
+    
+    return jsonify({'success': True, 'is_open': competition.is_open})
+
 @api_bp.route('/competition/<int:comp_id>/voies', methods=['GET', 'POST'])
 @require_admin_or_ouvreur
 def manage_competition_voies(comp_id):
@@ -446,8 +742,9 @@ def manage_competition_voies(comp_id):
         data = request.get_json()
         voies_ids = data.get('voies_ids', [])
         
-        # Supprimer les anciennes associations
+        # Supprimer les anciennes associations (suppression groupée : pas d'événement ORM)
         CompetitionVoie.query.filter_by(competition_id=comp_id).delete()
+        catalogue_voies.invalider(comp_id)
         
         # Ajouter les nouvelles
         for voie_id in voies_ids:
@@ -534,14 +831,48 @@ def create_level():
 # Routes pour les utilisateurs
 @api_bp.route('/admin/users')
 @require_admin_or_ouvreur
+@lecture_seule
 def get_users():
-    users = User.query.all()
+    # Une seule requête : compteurs par sous-requêtes groupées, colonnes utiles seulement
+    nb_validations = db.session.query(ValidationGrimpeur.grimpeur_id, db.func.count(ValidationGrimpeur.id).label('nb'))\
+        .group_by(ValidationGrimpeur.grimpeur_id).subquery()
+    nb_inscriptions = db.session.query(InscriptionCompetition.grimpeur_id, db.func.count(InscriptionCompetition.id).label('nb'))\
+        .group_by(InscriptionCompetition.grimpeur_id).subquery()
+    
+    users = db.session.query(
+        User.id, User.nom, User.prenom, User.date_naissance, User.email, User.telephone,
+        User.sexe, User.role, User.code_connexion,
+        db.func.coalesce(nb_validations.c.nb, 0).label('nb_validations'),
+        db.func.coalesce(nb_inscriptions.c.nb, 0).label('nb_inscriptions')
+    ).outerjoin(nb_validations, nb_validations.c.grimpeur_id == User.id)\
+        .outerjoin(nb_inscriptions, nb_inscriptions.c.grimpeur_id == User.id)
+    
+    # Filtres côté serveur
+    for champ, colonne in (('role', User.role), ('sexe', User.sexe)):
+        if request.args.get(champ):
+            users = users.filter(colonne == request.args[champ])
+    competition_id = request.args.get('competition_id', type=int)
+    if competition_id:
+        users = users.filter(User.id.in_(
+            db.session.query(InscriptionCompetition.grimpeur_id).filter(InscriptionCompetition.competition_id == competition_id)
+        ))
+    if request.args.get('code') == 'avec':
+        users = users.filter(User.code_connexion.isnot(None))
+    elif request.args.get('code') == 'sans':
+        users = users.filter(User.code_connexion.is_(None))
+    recherche = request.args.get('q', '').strip()
+    if recherche:
+        motif = f"%{recherche}%"
+        users = users.filter(db.or_(User.nom.ilike(motif), User.prenom.ilike(motif), User.email.ilike(motif)))
+    
+    curseur, limite = parametres_page()
+    try:
+        users, suivant = page_keyset(users, [User.nom, User.prenom, User.id], curseur, limite)
+    except CurseurInvalide:
+        return jsonify({'success': False, 'message': 'Curseur invalide'}), 400
     
     result = []
     for user in users:
-        nb_validations = ValidationGrimpeur.query.filter_by(grimpeur_id=user.id).count()
-        nb_inscriptions = InscriptionCompetition.query.filter_by(grimpeur_id=user.id).count()
-        
         result.append({
             'id': user.id,
             'nom': user.nom,
@@ -552,11 +883,57 @@ def get_users():
             'sexe': user.sexe,
             'role': user.role,
             'code_connexion': user.code_connexion,
-            'nb_validations': nb_validations,
-            'nb_inscriptions': nb_inscriptions
+            'nb_validations': user.nb_validations,
+            'nb_inscriptions': user.nb_inscriptions
         })
     
-    return jsonify(result)
+    reponse = {'success': True, 'users': result, 'next_cursor': suivant}
+    
+    # Première page : effectifs par rôle (toute la base, hors filtres) pour les statistiques
+    if not curseur:
+        reponse['stats'] = dict(db.session.query(User.role, db.func.count(User.id)).group_by(User.role).all())
+    
+    return jsonify(reponse)
+
+@api_bp.route('/users/generate-codes-bulk', methods=['POST'])
+@require_admin
+def generate_codes_bulk():
+    """Attribue des codes de connexion uniques à tous les utilisateurs sélectionnés en une passe"""
+    data = request.get_json() or {}
+    
+    roles = []
+    if data.get('grimpeurs', True):
+        roles.append('grimpeur')
+    if data.get('ouvreurs', False):
+        roles.append('ouvreur')
+    regenerer = data.get('regenerer', False)
+    
+    debut = time.perf_counter()
+    
+    query = User.query.filter(User.role.in_(roles))
+    if not regenerer:
+        query = query.filter(User.code_connexion.is_(None))
+    users = query.all()
+    
+    # Collisions vérifiées en mémoire : une requête pour tous les codes existants
+    codes_utilises = {row[0] for row in db.session.query(User.code_connexion)
+                      .filter(User.code_connexion.isnot(None))}
+    
+    try:
+        for user in users:
+            user.generate_code_connexion(codes_utilises)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+    
+    duree = time.perf_counter() - debut
+    return jsonify({
+        'success': True,
+        'nb_codes': len(users),
+        'duree_ms': round(duree * 1000, 1),
+        'codes_par_seconde': round(len(users) / duree) if duree > 0 else None
+    })
 
 @api_bp.route('/user/create', methods=['POST'])
 @require_admin_or_ouvreur
@@ -582,6 +959,7 @@ def create_user():
             existing.email = email
         if telephone:
             existing.telephone = telephone
+        recategoriser = existing.sexe != sexe
         existing.sexe = sexe
         user = existing
     else:
@@ -599,7 +977,10 @@ def create_user():
         db.session.add(user)
     
     try:
+        # Sexe modifié : catégories des inscriptions existantes réassignées dans la même transaction
+        competitions_ids = reassigner_categories_grimpeur(user) if existing and recategoriser else []
         db.session.commit()
+        grimpeur_recategorise(user.id, competitions_ids)
         return jsonify({
             'success': True, 
             'user_id': user.id, 
@@ -641,19 +1022,13 @@ def inscription_competition(comp_id):
         return jsonify(user_response), 400
     
     user_id = user_response['user_id']
+    competitions_recategorisees = user_response['competitions_recategorisees']
     user = User.query.get(user_id)
     
     # Vérifier que l'utilisateur correspond à une catégorie de la compétition
-    categories = db.session.query(Categorie).join(CompetitionCategorie)\
-        .filter(CompetitionCategorie.competition_id == comp_id).all()
-    
-    user_matches_category = False
-    for categorie in categories:
-        if check_user_category(user, categorie):
-            user_matches_category = True
-            break
+    categories = categories_competition(comp_id)
     
-    if not user_matches_category:
+    if not any(check_user_category(user, categorie) for categorie in categories):
         return jsonify({'success': False, 'message': 'Aucune catégorie ne correspond à ce profil'}), 403
     
     # Vérifier si déjà inscrit
@@ -673,7 +1048,16 @@ def inscription_competition(comp_id):
     
     try:
         db.session.add(inscription)
+        # Catégories calculées une fois pour toutes : le classement n'a plus qu'à faire une jointure
+        assigner_categories(inscription, user, categories)
+        db.session.add(ScoreGrimpeur(
+            competition_id=comp_id,
+            grimpeur_id=user_id,
+            version=incrementer_version(comp_id)
+        ))
         db.session.commit()
+        grimpeur_recategorise(user_id, competitions_recategorisees)
+        statistiques.inscription(comp_id)
         return jsonify({
             'success': True,
             'message': 'Inscription réussie',
@@ -704,6 +1088,7 @@ def create_user_internal(data):
             existing.email = email
         if telephone:
             existing.telephone = telephone
+        recategoriser = existing.sexe != sexe
         existing.sexe = sexe
         user = existing
     else:
@@ -719,90 +1104,346 @@ def create_user_internal(data):
         )
         user.generate_code_connexion()
         db.session.add(user)
+        db.session.flush()  # Pour obtenir l'ID du nouvel utilisateur
     
-    return {'success': True, 'user_id': user.id, 'code_connexion': user.code_connexion}
+    # Sexe modifié : catégories des inscriptions existantes réassignées (validées avec l'appelant)
+    competitions_ids = reassigner_categories_grimpeur(user) if existing and recategoriser else []
+    return {'success': True, 'user_id': user.id, 'code_connexion': user.code_connexion,
+            'competitions_recategorisees': competitions_ids}
+
+def grimpeur_recategorise(grimpeur_id, competitions_ids):
+    """Après le commit d'une réassignation : instantanés et flux des compétitions concernées"""
+    instantanes.oublier_grimpeur(grimpeur_id, competitions_ids)
+    for competition_id in competitions_ids:
+        notifier_classement(competition_id)
 
 def check_user_category(user, categorie):
     """Vérifier si un utilisateur correspond à une catégorie"""
-    annee_naissance = user.date_naissance.year
-    age = datetime.now().year - annee_naissance
-    
-    # Vérifier l'âge
-    if age < categorie.annee_min or age > categorie.annee_max:
-        return False
-    
-    # Vérifier le genre
-    if categorie.genre == 'mixte':
-        return True
-    elif categorie.genre == user.sexe:
-        return True
-    
-    return False
+    return categorie.matches_user(user)
+
+def classement_accessible(competition):
+    """Le classement est visible une fois la compétition terminée, ou par les admins/ouvreurs"""
+    user_role = session.get('user_role')
+    return competition.date_fin <= datetime.now() or user_role in ['admin', 'ouvreur']
 
 # Routes pour le classement
 @api_bp.route('/competition/<int:comp_id>/classement')
 @require_login
+@lecture_seule
 def get_classement(comp_id):
     competition = Competition.query.get_or_404(comp_id)
     
-    # Vérifier que la compétition est terminée ou que l'utilisateur a les droits
-    user_role = session.get('user_role')
-    if competition.date_fin > datetime.now() and user_role not in ['admin', 'ouvreur']:
+    if not classement_accessible(competition):
         return jsonify({'error': 'Classement non disponible'}), 403
     
-    # Récupérer les catégories de la compétition
-    categories = db.session.query(Categorie).join(CompetitionCategorie)\
-        .filter(CompetitionCategorie.competition_id == comp_id).all()
+    # Représentation demandée : format compact (?format=compact) et champs choisis (?fields=grimpeur,position)
+    format_reponse = request.args.get('format', 'complet')
+    if format_reponse not in ('complet', 'compact'):
+        return jsonify({'error': 'Format inconnu (attendu : complet ou compact)'}), 400
+    try:
+        champs = champs_demandes(request.args.get('fields'), CHAMPS_COMPACT if format_reponse == 'compact' else CHAMPS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Les différentiels (?since=) ont leur propre forme (lignes modifiées + positions) : pas de format ni de champs
+    since = request.args.get('since', type=int)
+    if since is not None and ('format' in request.args or 'fields' in request.args):
+        return jsonify({'error': 'since ne se combine pas avec format ou fields'}), 400
+    
+    # Classement inchangé depuis la dernière lecture du client : rien à recalculer
+    version = competition.classement_version
+    etag = f"classement-{comp_id}-{version}" + (f"-since-{since}" if since is not None else "")
+    if since is None and (format_reponse != 'complet' or champs != CHAMPS):
+        etag += f"-{format_reponse}-" + '.'.join(champs)
+    if request.if_none_match.contains_weak(etag) or (since is not None and since >= version):
+        return classement_response('', version, etag, 304)
+    
+    # Synchronisation différentielle : uniquement les grimpeurs modifiés depuis la version du client,
+    # avec tous les rangs (une validation déplace aussi des grimpeurs dont la ligne n'a pas changé)
+    if since is not None:
+        return classement_response(jsonify({
+            'version': version,
+            'categories': [{'id': cat.id, 'nom': cat.nom} for cat in categories_classement(comp_id)],
+            'grimpeurs': lignes_classement(comp_id, depuis_version=since),
+            'positions': positions_json(rangs_categories(comp_id, version, current_app.config['CLASSEMENT_DEPARTAGES']))
+        }), version, etag)
+    
+    # Corps sérialisé et compressé une fois par version et par représentation, partagé par tous les écrans
+    encodage = encodage_accepte(request.accept_encodings)
+    cle = (comp_id, format_reponse, champs, encodage)
+    en_cache = cache_corps.obtenir(cle, version)
+    if en_cache is None:
+        corps = encoder_json(donnees_classement(comp_id, version, format_reponse, champs))
+        if encodage is not None and len(corps) >= current_app.config['CLASSEMENT_COMPRESSION_MIN']:
+            corps = compresser(corps, encodage)
+        else:
+            encodage = None
+        en_cache = (corps, encodage)
+        cache_corps.enregistrer(cle, version, en_cache)
+    corps, encodage = en_cache
+    
+    response = Response(corps, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if encodage is not None:
+        response.content_encoding = encodage
+    # Représentation compressée : même contenu, octets différents (ETag faible)
+    return classement_response(response, version, etag, faible=encodage is not None)
+
+def donnees_classement(comp_id, version, format_reponse, champs):
+    """Classement de chaque catégorie, au format complet (objets par grimpeur) ou compact (tableaux)"""
+    categories = categories_classement(comp_id)
+    
+    # Identité et catégories enregistrées à l'inscription, lues avec le classement matérialisé
+    lignes = {ligne['id']: ligne for ligne in lignes_classement(comp_id)}
+    
+    # Rangs (ex aequo partagés, départages) calculés par le moteur vectorisé, toutes catégories ensemble
+    # (matrice gardée en mémoire, seules les lignes modifiées depuis la version précédente sont relues)
+    resultat = matrices_classement.classement(comp_id, version, current_app.config['CLASSEMENT_DEPARTAGES'])
+    matrice = resultat.matrice
+    membres = [(grimpeur_id, categorie_id) for grimpeur_id, ligne in lignes.items() for categorie_id in ligne['categories']]
+    
+    # Lignes (grimpeur_id, position, score_total, nb_voies) de chaque catégorie, dans l'ordre du classement
+    grimpeurs_ids = matrice.grimpeurs_ids.tolist()
+    totaux = resultat.totaux.tolist()
+    nb_voies = resultat.nb_voies.tolist()
+    par_categorie = [
+        [(grimpeurs_ids[i], rang, totaux[i], nb_voies[i]) for i, rang in zip(indices.tolist(), rangs.tolist())]
+        for indices, rangs in par_categories(resultat, [categorie.id for categorie in categories], membres)
+    ]
+    identites = {grimpeur_id: f"{ligne['prenom']} {ligne['nom']}" for grimpeur_id, ligne in lignes.items()}
+    
+    if format_reponse == 'compact':
+        voies = detail = None
+        if 'voies' in champs:
+            voies = voies_colonnes(comp_id, matrice.voies_ids)
+            detail = matrice.validations()
+        return classement_compact(version, [(categorie.id, categorie.nom) for categorie in categories],
+                                  par_categorie, identites, champs, voies, detail)
+    
+    # Détail des voies validées, en une seule requête, seulement s'il est demandé
+    voies_validees = detail_classement(comp_id) if 'voies' in champs else {}
     
     classements = {}
-    
-    for categorie in categories:
-        # Récupérer tous les grimpeurs de cette catégorie inscrits à la compétition
-        grimpeurs = db.session.query(User).join(InscriptionCompetition)\
-            .filter(InscriptionCompetition.competition_id == comp_id)\
-            .all()
-        
-        # Filtrer par catégorie
-        grimpeurs_categorie = [g for g in grimpeurs if check_user_category(g, categorie)]
-        
-        # Calculer les scores
-        scores = []
-        for grimpeur in grimpeurs_categorie:
-            validations = ValidationGrimpeur.query.filter_by(
-                grimpeur_id=grimpeur.id,
-                competition_id=comp_id
-            ).all()
-            
-            score_total = 0
-            voies_validees = []
-            
-            for validation in validations:
-                if validation.voie and validation.voie.level and validation.circle:
-                    score_voie = validation.voie.level.score / validation.circle.ordre
-                    score_total += score_voie
-                    voies_validees.append({
-                        'nom': validation.voie.nom,
-                        'score': score_voie,
-                        'ordre_circle': validation.circle.ordre
-                    })
-            
-            scores.append({
-                'grimpeur': f"{grimpeur.prenom} {grimpeur.nom}",
+    for categorie, lignes_categorie in zip(categories, par_categorie):
+        scores = classements[categorie.nom] = []
+        for grimpeur_id, position, score_total, nb in lignes_categorie:
+            valeurs = {
+                'grimpeur': identites[grimpeur_id],
                 'score_total': score_total,
-                'nb_voies': len(voies_validees),
-                'voies': voies_validees
-            })
-        
-        # Trier par score décroissant
-        scores.sort(key=lambda x: x['score_total'], reverse=True)
+                'nb_voies': nb,
+                'voies': voies_validees.get(grimpeur_id, []),
+                'position': position
+            }
+            scores.append({champ: valeurs[champ] for champ in champs})
+    return classements
+
+def classement_response(response, version, etag, status=200, faible=False):
+    """Réponse de classement revalidable par ETag et portant sa version"""
+    response = current_app.make_response((response, status))
+    response.set_etag(etag, weak=faible)
+    response.headers['X-Classement-Version'] = str(version)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def jeton_affichage_valide():
+    """Écran d'affichage public : jeton ?jeton= égal à AFFICHAGE_JETON (désactivé si non configuré)"""
+    jeton = current_app.config['AFFICHAGE_JETON']
+    return bool(jeton) and hmac.compare_digest(request.args.get('jeton', ''), jeton)
+
+@api_bp.route('/competition/<int:comp_id>/classement/stream')
+@lecture_seule
+def stream_classement(comp_id):
+    competition = Competition.query.get_or_404(comp_id)
+    
+    # Écrans d'affichage : le jeton remplace la connexion et la fin de compétition
+    if not jeton_affichage_valide():
+        if 'user_id' not in session:
+            return jsonify({'error': 'Non connecté'}), 401
+        if not classement_accessible(competition):
+            return jsonify({'error': 'Classement non disponible'}), 403
+    
+    flux = flux_classement(comp_id, current_app.config['CLASSEMENT_STREAM_INTERVALLE'], current_app.config['CLASSEMENT_DEPARTAGES'])
+    
+    return Response(stream_with_context(flux), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Désactiver le buffering nginx
+    })
+
+# Exports CSV / XLSX en flux : mémoire constante, premiers octets envoyés avant la fin des requêtes
+def reponse_export(nom_fichier, entetes, lignes):
+    """Réponse en flux au format ?format=csv (défaut) ou xlsx"""
+    format_export = request.args.get('format', 'csv')
+    if format_export not in FORMATS:
+        return jsonify({'success': False, 'message': f"Format inconnu (attendu : {', '.join(FORMATS)})"}), 400
+    
+    flux = flux_export(format_export, entetes, lignes, feuille=nom_fichier)
+    return Response(stream_with_context(flux), mimetype=FORMATS[format_export], headers={
+        'Content-Disposition': f'attachment; filename="{nom_fichier}.{format_export}"',
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no'  # Désactiver le buffering nginx
+    })
+
+def nom_export(*parties):
+    """Nom de fichier ASCII sans séparateurs ni guillemets"""
+    nom = '_'.join(str(partie) for partie in parties)
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', unicodedata.normalize('NFKD', nom).encode('ascii', 'ignore').decode()).strip('_')
+
+@api_bp.route('/competition/<int:comp_id>/export/classement')
+@require_admin_or_ouvreur
+@lecture_seule
+def export_classement(comp_id):
+    competition = Competition.query.get_or_404(comp_id)
+    categorie_id = request.args.get('categorie_id', type=int)
+    
+    lignes = source_classement([comp_id], current_app.config['CLASSEMENT_DEPARTAGES'], None if categorie_id is None else [categorie_id])
+    return reponse_export(nom_export('classement', competition.nom), ENTETES_CLASSEMENT, lignes)
+
+@api_bp.route('/competition/<int:comp_id>/export/inscriptions')
+@require_admin_or_ouvreur
+@lecture_seule
+def export_inscriptions(comp_id):
+    competition = Competition.query.get_or_404(comp_id)
+    return reponse_export(nom_export('inscriptions', competition.nom), ENTETES_INSCRIPTIONS, source_inscriptions(comp_id))
+
+@api_bp.route('/competition/<int:comp_id>/export/validations')
+@require_admin_or_ouvreur
+@lecture_seule
+def export_validations(comp_id):
+    competition = Competition.query.get_or_404(comp_id)
+    return reponse_export(nom_export('validations', competition.nom), ENTETES_VALIDATIONS, source_validations(comp_id))
+
+@api_bp.route('/categories/<int:categorie_id>/export')
+@require_admin_or_ouvreur
+@lecture_seule
+def export_categorie(categorie_id):
+    """Classement d'une catégorie dans chaque compétition qui l'ouvre (ou ?competition_id=)"""
+    categorie = Categorie.query.get_or_404(categorie_id)
+    
+    competition_id = request.args.get('competition_id', type=int)
+    if competition_id is not None:
+        competitions_ids = [competition_id]
+    else:
+        competitions_ids = [row[0] for row in db.session.query(CompetitionCategorie.competition_id)
+                            .filter(CompetitionCategorie.categorie_id == categorie_id)]
+    
+    lignes = source_classement(competitions_ids, current_app.config['CLASSEMENT_DEPARTAGES'], [categorie_id])
+    return reponse_export(nom_export('categorie', categorie.nom), ENTETES_CLASSEMENT, lignes)
+
+# Routes pour les séries (classement de saison)
+@api_bp.route('/series')
+@require_login
+@lecture_seule
+def get_series():
+    competitions = {}
+    for serie_id, competition_id, nom in db.session.query(SerieCompetition.serie_id, Competition.id, Competition.nom)\
+            .join(Competition, SerieCompetition.competition_id == Competition.id)\
+            .order_by(Competition.date_debut):
+        competitions.setdefault(serie_id, []).append({'id': competition_id, 'nom': nom})
+    
+    return jsonify([
+        dict(serie.to_dict(), competitions=competitions.get(serie.id, []))
+        for serie in Serie.query.order_by(Serie.id.desc())
+    ])
+
+def parametres_serie(data, serie):
+    """Applique les paramètres d'agrégation de `data` à la série ; message d'erreur, ou None"""
+    agregation = data.get('agregation', serie.agregation or 'somme')
+    if agregation not in AGREGATIONS_SERIE:
+        return f"Agrégation inconnue (attendu : {', '.join(AGREGATIONS_SERIE)})"
+    
+    nb_resultats = data.get('nb_resultats', serie.nb_resultats)
+    if nb_resultats is not None and (not isinstance(nb_resultats, int) or nb_resultats < 1):
+        return 'nb_resultats doit être un entier positif'
+    if agregation == 'meilleurs' and nb_resultats is None:
+        return 'nb_resultats requis pour l\'agrégation meilleurs'
+    
+    if 'bareme_points' in data:
+        bareme = data['bareme_points']
+        if bareme is not None and (not isinstance(bareme, list) or not bareme
+                                   or not all(isinstance(p, (int, float)) and p >= 0 for p in bareme)):
+            return 'bareme_points doit être une liste de points positifs'
+        serie.bareme_points = json.dumps(bareme) if bareme else None
+    
+    serie.agregation = agregation
+    serie.nb_resultats = nb_resultats
+    return None
+
+@api_bp.route('/serie/create', methods=['POST'])
+@require_admin_or_ouvreur
+def create_serie():
+    data = request.get_json() or {}
+    
+    if not data.get('nom'):
+        return jsonify({'success': False, 'message': 'Données manquantes'}), 400
+    
+    serie = Serie(nom=data['nom'], saison=data.get('saison'))
+    erreur = parametres_serie(data, serie)
+    if erreur:
+        return jsonify({'success': False, 'message': erreur}), 400
+    
+    db.session.add(serie)
+    
+    try:
+        db.session.flush()
         
-        # Ajouter les positions
-        for i, score in enumerate(scores):
-            score['position'] = i + 1
+        for competition_id in data.get('competitions', []):
+            db.session.add(SerieCompetition(serie_id=serie.id, competition_id=competition_id))
         
-        classements[categorie.nom] = scores
+        db.session.commit()
+        return jsonify({'success': True, 'serie_id': serie.id})
     
-    return jsonify(classements)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@api_bp.route('/serie/<int:serie_id>/update', methods=['POST'])
+@require_admin_or_ouvreur
+def update_serie(serie_id):
+    serie = Serie.query.get_or_404(serie_id)
+    data = request.get_json() or {}
+    
+    if 'nom' in data:
+        if not data['nom']:
+            return jsonify({'success': False, 'message': 'Données manquantes'}), 400
+        serie.nom = data['nom']
+    if 'saison' in data:
+        serie.saison = data['saison']
+    
+    erreur = parametres_serie(data, serie)
+    if erreur:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': erreur}), 400
+    
+    try:
+        # Remplacer les étapes de la série
+        if 'competitions' in data:
+            SerieCompetition.query.filter_by(serie_id=serie_id).delete()
+            for competition_id in data['competitions']:
+                db.session.add(SerieCompetition(serie_id=serie_id, competition_id=competition_id))
+        
+        # Nouvelle version : les classements gardés en mémoire par les workers sont périmés
+        serie.version = Serie.version + 1
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@api_bp.route('/serie/<int:serie_id>/classement')
+@require_login
+@lecture_seule
+def get_classement_serie(serie_id):
+    """Classement de saison par catégorie, agrégé à partir des classements matérialisés des étapes"""
+    serie = Serie.query.get_or_404(serie_id)
+    
+    # Comme pour une compétition : les grimpeurs ne voient que les étapes terminées
+    terminees_seulement = session.get('user_role') not in ['admin', 'ouvreur']
+    empreinte, classement = classements_series.classement(serie, current_app.config['CLASSEMENT_DEPARTAGES'], terminees_seulement)
+    
+    etag = f"serie-{serie_id}-{empreinte}"
+    if request.if_none_match.contains(etag):
+        return classement_response('', serie.version, etag, 304)
+    return classement_response(jsonify(classement), serie.version, etag)
 
 # Route pour la validation par un ouvreur/admin
 @api_bp.route('/admin/validate', methods=['POST'])
@@ -818,28 +1459,36 @@ def admin_validate():
     if not all([grimpeur_id, circle_id, voie_id, competition_id]):
         return jsonify({'success': False, 'message': 'Données manquantes'}), 400
     
-    # Vérifier si une validation existe déjà
-    existing = ValidationGrimpeur.query.filter_by(
-        grimpeur_id=grimpeur_id,
-        voie_id=voie_id,
-        competition_id=competition_id
-    ).first()
-    
-    if existing:
-        existing.circle_id = circle_id
-        existing.datetime_creation = datetime.utcnow()
-    else:
-        validation = ValidationGrimpeur(
-            grimpeur_id=grimpeur_id,
-            voie_id=voie_id,
-            competition_id=competition_id,
-            circle_id=circle_id
-        )
-        db.session.add(validation)
+    try:
+        grimpeur_id, circle_id, voie_id, competition_id = int(grimpeur_id), int(circle_id), int(voie_id), int(competition_id)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Données invalides'}), 400
+    
+    # Renvoi d'une validation déjà traitée : même réponse, sans rien réécrire
+    emetteur_id = session['user_id']
+    cle = data.get('idempotency_key')
+    deja = resultat_idempotent(emetteur_id, cle)
+    if deja is not None:
+        return jsonify(deja)
+    
+    # Même contrôle que validate_grimpeur : le détail de l'instantané suit les totaux de ScoreGrimpeur
+    instantane = instantanes.obtenir(competition_id)
+    if instantane is not None and not instantane.circle_valide(voie_id, circle_id):
+        return jsonify({'success': False, 'message': 'Cercle inconnu pour cette voie'}), 400
     
     try:
-        db.session.commit()
+        # Même transaction que validate_grimpeur, rejouée si la base est occupée
+        profil_base.ecrire(enregistrer_validation, grimpeur_id, voie_id, competition_id, circle_id, emetteur_id, cle)
+        notifier_classement(competition_id)
+        statistiques.validation(competition_id, grimpeur_id, voie_id,
+                                instantane.voies[voie_id].ordres[circle_id] if instantane is not None else None)
         return jsonify({'success': True})
+    except IntegrityError as e:
+        db.session.rollback()
+        deja = resultat_idempotent(emetteur_id, cle)
+        if deja is not None:
+            return jsonify(deja)
+        return jsonify({'success': False, 'message': str(e)}), 500
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -848,17 +1497,20 @@ def admin_validate():
 @api_bp.route('/login/multiple', methods=['POST'])
 def login_multiple():
     data = request.get_json()
-    codes = data.get('codes', [])  # Liste de codes
+    codes = [str(code).strip() for code in data.get('codes', [])]  # Liste de codes
+    
+    # Tous les codes résolus d'un coup (cache, puis une seule requête IN pour le reste)
+    identites = cache_codes.resoudre(codes)
     
     users = []
     for code in codes:
-        user = User.query.filter_by(code_connexion=code).first()
+        user = identites.get(code)
         if user:
             users.append({
-                'id': user.id,
-                'nom': user.nom,
-                'prenom': user.prenom,
-                'code': user.code_connexion
+                'id': user['id'],
+                'nom': user['nom'],
+                'prenom': user['prenom'],
+                'code': user['code']
             })
     
     if users:
@@ -869,8 +1521,17 @@ def login_multiple():
     
     return jsonify({'success': False, 'message': 'Aucun code valide'}), 400
 
+# Images des voies : noms dérivés du contenu, donc cache immuable
+@media_bp.route('/<path:filename>')
+def media_image(filename):
+    response = send_from_directory(current_app.config['UPLOAD_FOLDER'], filename, max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 # Enregistrer les blueprints dans l'application principale
 def register_routes(app):
     app.register_blueprint(api_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(grimpeur_bp)
+    app.register_blueprint(media_bp)
+    app.add_template_global(url_variante)
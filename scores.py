@@ -0,0 +1,84 @@
+# scores.py - Calcul ensembliste des scores d'une compétition
+from sqlalchemy import func
+from models import db, Voie, Circle, Level, ValidationGrimpeur
+
+# Score d'une validation : score du niveau divisé par l'ordre du cercle atteint
+# (même formule que ValidationGrimpeur.calculate_score, en division flottante)
+score_validation = db.cast(Level.score, db.Float) / Circle.ordre
+
+def joindre_bareme(query):
+    """Joint une requête sur ValidationGrimpeur à la voie, au niveau et au cercle
+    
+    Même règle que ValidationGrimpeur.calculate_score : une validation compte si sa voie,
+    le niveau de la voie et son cercle existent. L'instantané et le moteur de classement
+    (moteur_classement.charger_matrice) appliquent cette même règle.
+    """
+    return query.join(Voie, ValidationGrimpeur.voie_id == Voie.id)\
+        .join(Level, Voie.level_id == Level.id)\
+        .join(Circle, ValidationGrimpeur.circle_id == Circle.id)
+
+def query_totaux():
+    """Requête GROUP BY grimpeur : (grimpeur_id, total, nombre de voies, dernière validation)"""
+    return joindre_bareme(db.session.query(
+        ValidationGrimpeur.grimpeur_id,
+        func.coalesce(func.sum(score_validation), 0),
+        func.count(ValidationGrimpeur.id),
+        func.max(ValidationGrimpeur.datetime_creation)
+    )).group_by(ValidationGrimpeur.grimpeur_id)
+
+def totaux_competition(competition_id):
+    """Totaux de tous les grimpeurs d'une compétition en une requête"""
+    query = query_totaux().filter(ValidationGrimpeur.competition_id == competition_id)
+    
+    return {
+        grimpeur_id: {
+            'score_total': total,
+            'nb_voies': nb_voies,
+            'derniere_validation': derniere
+        }
+        for grimpeur_id, total, nb_voies, derniere in query
+    }
+
+def detail_competition(competition_id):
+    """Détail des voies validées par grimpeur d'une compétition en une requête"""
+    query = joindre_bareme(db.session.query(
+        ValidationGrimpeur.grimpeur_id,
+        Voie.nom,
+        score_validation,
+        Circle.ordre
+    )).filter(ValidationGrimpeur.competition_id == competition_id)\
+        .order_by(ValidationGrimpeur.id)
+    
+    detail = {}
+    for grimpeur_id, nom_voie, score_voie, ordre in query:
+        detail.setdefault(grimpeur_id, []).append({
+            'nom': nom_voie,
+            'score': score_voie,
+            'ordre_circle': ordre
+        })
+    
+    return detail
+
+def validations_grimpeur(competition_id, grimpeur_id):
+    """Voies validées par un grimpeur dans une compétition : {voie_id: {'ordre_circle', 'score'}}"""
+    query = joindre_bareme(db.session.query(
+        ValidationGrimpeur.voie_id,
+        Circle.ordre,
+        score_validation
+    )).filter(ValidationGrimpeur.competition_id == competition_id)\
+        .filter(ValidationGrimpeur.grimpeur_id == grimpeur_id)
+    
+    return {
+        voie_id: {'ordre_circle': ordre, 'score': score_voie}
+        for voie_id, ordre, score_voie in query
+    }
+
+def scores_competition(competition_id):
+    """Totaux et détail par grimpeur d'une compétition (deux requêtes au total)"""
+    totaux = totaux_competition(competition_id)
+    detail = detail_competition(competition_id)
+    
+    return {
+        grimpeur_id: dict(total, voies=detail.get(grimpeur_id, []))
+        for grimpeur_id, total in totaux.items()
+    }
@@ -0,0 +1,229 @@
+# series.py - Classement de saison : agrégation incrémentale des classements des compétitions d'une série
+import hashlib
+import threading
+import numpy as np
+from datetime import datetime
+from models import db, User, Competition, Categorie, CompetitionCategorie, InscriptionCompetition, InscriptionCategorie, ScoreGrimpeur, SerieCompetition
+from moteur_classement import MatriceScores, classer, matrices_classement, rangs_competition
+
+class ResultatsCompetition:
+    """Résultats d'une compétition lus dans le classement matérialisé (ScoreGrimpeur), tenus à jour par différence
+    
+    Chaque écriture du classement incrémente Competition.classement_version et marque les lignes
+    modifiées de cette version : seules les lignes plus récentes que la version connue sont relues.
+    Les places sont celles du moteur de classement (mêmes départages que le classement de la compétition).
+    """
+    __slots__ = ('competition_id', 'version', 'nb_lignes', 'lignes', 'noms', '_categories')
+    
+    def __init__(self, competition_id):
+        self.competition_id = competition_id
+        self.version = None
+        self.nb_lignes = 0
+        self.lignes = {}  # grimpeur_id -> (score_total, nb_voies, catégories)
+        self.noms = {}    # grimpeur_id -> "Prénom Nom"
+        self._categories = None
+    
+    def actualiser(self, version, nb_lignes):
+        """Relit les lignes modifiées depuis la version connue ; tout si des lignes ont disparu"""
+        if self.version is not None and version <= self.version and nb_lignes == self.nb_lignes:
+            return
+        
+        complet = self.version is None
+        lignes, noms = self._lire(None if complet else self.version)
+        if complet:
+            self.lignes, self.noms = lignes, noms
+        else:
+            self.lignes = dict(self.lignes)
+            self.lignes.update(lignes)
+            self.noms = dict(self.noms)
+            self.noms.update(noms)
+            if len(self.lignes) != nb_lignes:
+                # Lignes supprimées (rebuild-scores) : relecture complète
+                self.lignes, self.noms = self._lire(None)
+        self.version = max(version, self.version or 0)
+        self.nb_lignes = nb_lignes
+        self._categories = None
+    
+    def _lire(self, depuis_version):
+        query = db.session.query(
+            ScoreGrimpeur.grimpeur_id, ScoreGrimpeur.score_total, ScoreGrimpeur.nb_voies,
+            User.prenom, User.nom, InscriptionCategorie.categorie_id
+        ).join(User, ScoreGrimpeur.grimpeur_id == User.id)\
+            .join(InscriptionCompetition, db.and_(
+            InscriptionCompetition.competition_id == ScoreGrimpeur.competition_id,
+            InscriptionCompetition.grimpeur_id == ScoreGrimpeur.grimpeur_id
+        )).outerjoin(InscriptionCategorie, InscriptionCategorie.inscription_id == InscriptionCompetition.id)\
+            .filter(ScoreGrimpeur.competition_id == self.competition_id)
+        if depuis_version is not None:
+            query = query.filter(ScoreGrimpeur.version > depuis_version)
+        
+        lignes = {}
+        noms = {}
+        for grimpeur_id, score_total, nb_voies, prenom, nom, categorie_id in query:
+            _, _, categories = lignes.setdefault(grimpeur_id, (score_total, nb_voies, []))
+            noms[grimpeur_id] = f"{prenom} {nom}"
+            if categorie_id is not None:
+                categories.append(categorie_id)
+        return lignes, noms
+    
+    def par_categorie(self, departages):
+        """Par catégorie : (grimpeurs triés, scores, places) ; place 0 sans voie validée
+        
+        Places du moteur (matrices_classement) départagées par `departages`, en classement « 1224 » :
+        les ex aequo partagent la place (et les points), les places suivantes sont sautées.
+        """
+        departages = tuple(departages)
+        if self._categories is not None and self._categories[0] == departages:
+            return self._categories[1]
+        
+        resultat = matrices_classement.classement(self.competition_id, self.version, departages)
+        matrice = resultat.matrice
+        categories_ids = sorted({categorie_id for _, _, categories in self.lignes.values() for categorie_id in categories})
+        colonnes = {categorie_id: j for j, categorie_id in enumerate(categories_ids)}
+        appartenance = np.zeros((len(matrice.grimpeurs_ids), len(colonnes)), dtype=bool)
+        for grimpeur_id, (_, _, categories) in self.lignes.items():
+            i = matrice.index(grimpeur_id)
+            if i is not None:
+                appartenance[i, [colonnes[categorie_id] for categorie_id in categories]] = True
+        
+        resultats = {}
+        for categorie_id, (lignes_matrice, rangs) in zip(categories_ids, resultat.par_categorie(appartenance)):
+            places_moteur = dict(zip(matrice.grimpeurs_ids[lignes_matrice].tolist(), rangs_competition(rangs).tolist()))
+            grimpeurs = np.array(sorted(grimpeur_id for grimpeur_id, (_, _, categories) in self.lignes.items()
+                                        if categorie_id in categories), dtype=np.int64)
+            scores = np.array([self.lignes[grimpeur_id][0] for grimpeur_id in grimpeurs.tolist()], dtype=np.float64)
+            places = np.array([places_moteur.get(grimpeur_id, 0) if self.lignes[grimpeur_id][1] > 0 else 0
+                               for grimpeur_id in grimpeurs.tolist()], dtype=np.int64)
+            resultats[categorie_id] = (grimpeurs, scores, places)
+        
+        self._categories = (departages, resultats)
+        return resultats
+
+class ClassementsSeries:
+    """Classements des séries du processus
+    
+    Les résultats de chaque compétition sont gardés en mémoire et actualisés par différence ;
+    le classement d'une série n'est recalculé que si une version (série ou compétition) a changé.
+    """
+    
+    def __init__(self):
+        self._competitions = {}  # competition_id -> ResultatsCompetition
+        self._classements = {}   # (serie_id, terminees_seulement) -> (clé, classement)
+        self._lock = threading.Lock()
+    
+    def classement(self, serie, departages, terminees_seulement=False):
+        """(empreinte, classement) d'une série ; places des étapes départagées par `departages`,
+        terminees_seulement : étapes terminées uniquement"""
+        departages = tuple(departages)
+        etapes = self._etapes(serie.id, terminees_seulement)
+        cle = (serie.version, departages, tuple((etape.id, etape.classement_version, etape.nb_lignes) for etape in etapes))
+        empreinte = hashlib.sha1(repr(cle).encode()).hexdigest()[:16]
+        
+        en_cache = self._classements.get((serie.id, terminees_seulement))
+        if en_cache is not None and en_cache[0] == cle:
+            return empreinte, en_cache[1]
+        
+        with self._lock:
+            competitions = []
+            for etape in etapes:
+                competition = self._competitions.get(etape.id)
+                if competition is None:
+                    competition = self._competitions[etape.id] = ResultatsCompetition(etape.id)
+                competition.actualiser(etape.classement_version, etape.nb_lignes)
+                competitions.append(competition)
+            
+            classement = {
+                'serie': serie.to_dict(),
+                'competitions': [{'id': etape.id, 'nom': etape.nom} for etape in etapes],
+                'classements': self._agreger(serie, [etape.id for etape in etapes], competitions, departages)
+            }
+        self._classements[(serie.id, terminees_seulement)] = (cle, classement)
+        return empreinte, classement
+    
+    def _etapes(self, serie_id, terminees_seulement):
+        """Compétitions de la série avec leur version et leur nombre de lignes de classement, en une requête"""
+        # Sous-requête corrélée : compte par l'index (competition_id, version), étape par étape
+        nb_lignes = db.session.query(db.func.count(ScoreGrimpeur.id))\
+            .filter(ScoreGrimpeur.competition_id == Competition.id)\
+            .correlate(Competition).scalar_subquery()
+        query = db.session.query(
+            Competition.id, Competition.nom, Competition.classement_version, nb_lignes.label('nb_lignes')
+        ).join(SerieCompetition, SerieCompetition.competition_id == Competition.id)\
+            .filter(SerieCompetition.serie_id == serie_id)
+        if terminees_seulement:
+            query = query.filter(Competition.date_fin <= datetime.now())
+        return query.order_by(Competition.date_debut, Competition.id).all()
+    
+    def _agreger(self, serie, competitions_ids, competitions, departages):
+        """Classement par catégorie : une matrice grimpeurs × étapes classée par le moteur vectorisé"""
+        categories = db.session.query(Categorie.id, Categorie.nom).join(CompetitionCategorie)\
+            .filter(CompetitionCategorie.competition_id.in_(competitions_ids))\
+            .distinct().order_by(Categorie.id).all()
+        bareme = np.array(serie.bareme, dtype=np.float64)
+        resultats = [competition.par_categorie(departages) for competition in competitions]
+        
+        matrices = {}
+        for categorie_id, _ in categories:
+            etapes = [resultat.get(categorie_id) for resultat in resultats]
+            presents = [etape[0] for etape in etapes if etape is not None]
+            grimpeurs = np.unique(np.concatenate(presents)) if presents else np.zeros(0, dtype=np.int64)
+            
+            # Résultat de chaque étape (score, ou points de la place), NaN si le grimpeur n'y était pas
+            valeurs = np.full((len(grimpeurs), len(etapes)), np.nan)
+            for j, etape in enumerate(etapes):
+                if etape is None:
+                    continue
+                lignes = np.searchsorted(grimpeurs, etape[0])
+                if serie.agregation == 'points':
+                    places = etape[2]
+                    points = np.zeros(len(places))
+                    dans_bareme = (places > 0) & (places <= len(bareme))
+                    points[dans_bareme] = bareme[places[dans_bareme] - 1]
+                    valeurs[lignes, j] = points
+                else:
+                    valeurs[lignes, j] = etape[1]
+            matrices[categorie_id] = (grimpeurs, valeurs, self._retenus(valeurs, serie))
+        
+        noms = {}
+        for competition in competitions:
+            noms.update(competition.noms)
+        
+        classements = {}
+        for categorie_id, nom_categorie in categories:
+            grimpeurs, valeurs, retenus = matrices[categorie_id]
+            
+            # Total des résultats retenus ; départage par les meilleurs résultats (countback)
+            scores = np.where(retenus, np.nan_to_num(valeurs), 0.0)
+            matrice = MatriceScores(grimpeurs, np.array(competitions_ids, dtype=np.int64), scores,
+                                    np.zeros(scores.shape, dtype=np.int16), np.zeros(len(grimpeurs), dtype=np.int64))
+            resultat = classer(matrice, ('countback',))
+            
+            # Conversion en listes Python colonne par colonne, dans l'ordre du classement
+            ordre = resultat.ordre
+            tries = valeurs[ordre].astype(object)
+            tries[np.isnan(valeurs[ordre])] = None  # Étape non courue
+            classements[nom_categorie] = [{
+                'grimpeur_id': grimpeur_id,
+                'grimpeur': noms.get(grimpeur_id, ''),
+                'total': total,
+                'resultats': ligne,
+                'retenus': retenu,
+                'position': position
+            } for grimpeur_id, total, ligne, retenu, position in zip(
+                grimpeurs[ordre].tolist(), resultat.totaux[ordre].tolist(), tries.tolist(),
+                retenus[ordre].tolist(), resultat.rangs[ordre].tolist()
+            )]
+        return classements
+    
+    def _retenus(self, valeurs, serie):
+        """Résultats comptés : tous, ou les nb_resultats meilleurs de chaque grimpeur"""
+        presents = ~np.isnan(valeurs)
+        if not serie.nb_resultats or serie.agregation == 'somme' or serie.nb_resultats >= valeurs.shape[1]:
+            return presents
+        # Rang de chaque résultat parmi ceux du grimpeur, du meilleur au moins bon (absents en dernier)
+        ordre = np.argsort(-np.where(presents, valeurs, -np.inf), axis=1, kind='stable')
+        rangs = np.empty_like(ordre)
+        np.put_along_axis(rangs, ordre, np.arange(valeurs.shape[1])[None, :], axis=1)
+        return presents & (rangs < serie.nb_resultats)
+
+classements_series = ClassementsSeries()
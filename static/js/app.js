@@ -230,6 +230,94 @@ function debounce(func, wait) {
     };
 }
 
+// File d'attente des validations (réseau instable en salle)
+// Chaque validation reçoit un horodatage et une clé d'idempotence, est conservée dans le
+// localStorage, puis envoyée par lots à /api/validate/batch dès que le réseau le permet.
+const VALIDATION_QUEUE_KEY = 'validationQueue';
+const VALIDATION_BATCH_SIZE = 100;
+let validationFlush = null;
+
+function loadValidationQueue() {
+    try {
+        return JSON.parse(localStorage.getItem(VALIDATION_QUEUE_KEY)) || [];
+    } catch (e) {
+        return [];
+    }
+}
+
+function saveValidationQueue(queue) {
+    localStorage.setItem(VALIDATION_QUEUE_KEY, JSON.stringify(queue));
+}
+
+function generateIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+function queueValidation(validation) {
+    const item = Object.assign({
+        client_ts: Date.now(),
+        idempotency_key: generateIdempotencyKey()
+    }, validation);
+    
+    const queue = loadValidationQueue();
+    queue.push(item);
+    saveValidationQueue(queue);
+    
+    // Résultat de cette validation, ou {queued: true} si elle reste en attente du réseau
+    return flushValidationQueue().then(results => results[item.idempotency_key] || { success: true, queued: true });
+}
+
+function flushValidationQueue() {
+    const queue = loadValidationQueue();
+    if (queue.length === 0 || !navigator.onLine) {
+        return Promise.resolve({});
+    }
+    if (validationFlush) {
+        return validationFlush.then(() => flushValidationQueue());
+    }
+    
+    const batch = queue.slice(0, VALIDATION_BATCH_SIZE);
+    
+    validationFlush = fetch('/api/validate/batch', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ validations: batch })
+    })
+    .then(response => response.json())
+    .then(data => {
+        const results = {};
+        (data.results || []).forEach(result => {
+            if (result.idempotency_key) {
+                results[result.idempotency_key] = result;
+            }
+        });
+        
+        // Retirer les validations traitées par le serveur (acceptées ou refusées), garder les autres
+        const remaining = loadValidationQueue().filter(item => !(item.idempotency_key in results));
+        saveValidationQueue(remaining);
+        
+        if (remaining.length > 0 && Object.keys(results).length > 0) {
+            setTimeout(flushValidationQueue, 0);
+        }
+        return results;
+    })
+    .catch(error => {
+        console.warn('Validations conservées hors ligne:', error);
+        return {};
+    })
+    .finally(() => {
+        validationFlush = null;
+    });
+    
+    return validationFlush;
+}
+
+window.addEventListener('online', flushValidationQueue);
+document.addEventListener('DOMContentLoaded', flushValidationQueue);
+
 // Validation de formulaires
 function validateForm(formElement) {
     const requiredFields = formElement.querySelectorAll('[required]');
@@ -713,16 +801,23 @@ class ClassementManager {
         this.categories = [];
         this.classements = {};
         this.displayMode = 'mobile'; // mobile ou carousel
+        this.eventSource = null;
+        this.categoriesFlux = [];
+        this.grimpeurs = new Map(); // Lignes du flux en direct, par id de grimpeur
+        this.positions = new Map(); // Rangs calculés par le serveur : "<categorie_id>" -> Map(id de grimpeur -> rang)
+        this.version = null; // Version du classement détenue par le client
+        this.pollTimer = null;
     }
     
     loadClassement(competitionId) {
         this.currentCompetition = competitionId;
         
-        fetch(`/api/competition/${competitionId}/classement`)
+        // Format compact : chaque grimpeur envoyé une fois, lignes en tableaux (voir decodeCompact)
+        fetch(`/api/competition/${competitionId}/classement?format=compact`)
             .then(response => response.json())
             .then(data => {
-                this.classements = data;
-                this.categories = Object.keys(data);
+                this.classements = data.format === 'compact' ? this.decodeCompact(data) : data;
+                this.categories = Object.keys(this.classements);
                 this.renderClassement();
             })
             .catch(error => {
@@ -731,6 +826,153 @@ class ClassementManager {
             });
     }
     
+    // Reconstruit { catégorie: [{grimpeur, score_total, nb_voies, position, voies?}] } depuis le format compact
+    decodeCompact(data) {
+        const voies = data.voies || [];
+        const grimpeurs = data.grimpeurs.map(([id, nom, validations]) => ({
+            id,
+            nom,
+            voies: validations && validations.map(([indice, ordre]) => ({
+                nom: voies[indice][1],
+                score: voies[indice][2] / ordre,
+                ordre_circle: ordre
+            }))
+        }));
+        
+        const classements = {};
+        data.categories.forEach(categorie => {
+            classements[categorie.nom] = categorie.lignes.map(ligne => {
+                const resultat = {};
+                data.colonnes.forEach((colonne, i) => { resultat[colonne] = ligne[i]; });
+                const grimpeur = grimpeurs[resultat.grimpeur];
+                resultat.grimpeur = grimpeur.nom;
+                if (grimpeur.voies) resultat.voies = grimpeur.voies;
+                return resultat;
+            });
+        });
+        return classements;
+    }
+    
+    // Classement en direct (Server-Sent Events) : complet à la connexion, puis lignes modifiées
+    connectStream(competitionId) {
+        this.disconnectStream();
+        this.stopPolling();
+        this.currentCompetition = competitionId;
+        
+        if (!window.EventSource) {
+            this.startPolling(competitionId);
+            return;
+        }
+        
+        this.eventSource = new EventSource(`/api/competition/${competitionId}/classement/stream`);
+        
+        this.eventSource.addEventListener('init', (event) => {
+            const data = JSON.parse(event.data);
+            this.categoriesFlux = data.categories;
+            this.grimpeurs = new Map(data.grimpeurs.map(grimpeur => [grimpeur.id, grimpeur]));
+            this.positions = new Map();
+            this.mergePositions(data.positions);
+            this.version = data.version;
+            this.rebuildClassements();
+        });
+        
+        this.eventSource.addEventListener('maj', (event) => {
+            this.mergeRows(JSON.parse(event.data));
+        });
+        
+        this.eventSource.onerror = () => {
+            // Flux refusé ou fermé par le serveur : repli sur le chargement ponctuel
+            if (this.eventSource && this.eventSource.readyState === EventSource.CLOSED) {
+                this.disconnectStream();
+                this.startPolling(competitionId);
+            }
+        };
+    }
+    
+    disconnectStream() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+    }
+    
+    // Synchronisation différentielle : le serveur répond 304 tant que rien n'a bougé,
+    // sinon uniquement les grimpeurs modifiés depuis this.version
+    pollClassement(competitionId) {
+        if (this.currentCompetition !== competitionId) {
+            this.currentCompetition = competitionId;
+            this.version = null;
+            this.grimpeurs = new Map();
+            this.positions = new Map();
+        }
+        
+        const since = this.version === null ? 0 : this.version;
+        
+        return fetch(`/api/competition/${competitionId}/classement?since=${since}`)
+            .then(response => {
+                if (response.status === 304) return null;
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            })
+            .then(data => {
+                if (!data) return;
+                this.categoriesFlux = data.categories;
+                this.mergeRows(data);
+            })
+            .catch(error => {
+                console.error('Erreur synchronisation classement:', error);
+            });
+    }
+    
+    startPolling(competitionId, interval = 30000) {
+        this.stopPolling();
+        this.pollClassement(competitionId);
+        this.pollTimer = setInterval(() => this.pollClassement(competitionId), interval);
+    }
+    
+    stopPolling() {
+        if (this.pollTimer) {
+            clearInterval(this.pollTimer);
+            this.pollTimer = null;
+        }
+    }
+    
+    mergeRows(data) {
+        data.grimpeurs.forEach(grimpeur => this.grimpeurs.set(grimpeur.id, grimpeur));
+        this.mergePositions(data.positions);
+        this.version = data.version;
+        this.rebuildClassements();
+    }
+    
+    // Rangs du serveur (ex aequo partagés, départages) : seuls ceux qui ont changé sont renvoyés
+    mergePositions(positions) {
+        Object.entries(positions || {}).forEach(([cle, rangs]) => {
+            if (!this.positions.has(cle)) this.positions.set(cle, new Map());
+            const rangsCategorie = this.positions.get(cle);
+            rangs.forEach(([grimpeurId, rang]) => rangsCategorie.set(grimpeurId, rang));
+        });
+    }
+    
+    rebuildClassements() {
+        const lignes = Array.from(this.grimpeurs.values());
+        
+        this.classements = {};
+        this.categoriesFlux.forEach(categorie => {
+            const rangs = this.positions.get(String(categorie.id)) || new Map();
+            this.classements[categorie.nom] = lignes
+                .filter(grimpeur => grimpeur.categories.includes(categorie.id))
+                .map(grimpeur => ({
+                    grimpeur: `${grimpeur.prenom} ${grimpeur.nom}`,
+                    score_total: grimpeur.score_total,
+                    nb_voies: grimpeur.nb_voies,
+                    position: rangs.get(grimpeur.id)
+                }))
+                .sort((a, b) => (a.position ?? Infinity) - (b.position ?? Infinity) || b.score_total - a.score_total);
+        });
+        this.categories = Object.keys(this.classements);
+        this.renderClassement();
+    }
+    
     renderClassement() {
         const container = document.getElementById('classement-container');
         if (!container) return;
@@ -766,7 +1008,8 @@ class ClassementManager {
             </div>
         `;
         
-        // Auto-rotation du carousel
+        // Auto-rotation du carousel (un seul timer, même si le rendu est refait en direct)
+        this.stopCarousel();
         this.startCarousel();
     }
     
@@ -0,0 +1,265 @@
+# statistiques.py - Statistiques en direct du tableau de bord (compteurs glissants en mémoire)
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from models import db, User, Competition, Voie, Circle, ValidationGrimpeur, CompetitionVoie, InscriptionCompetition
+
+EPOQUE = datetime(1970, 1, 1)
+
+def _secondes(horodatage):
+    """Horodatage UTC naïf (datetime_creation) en secondes epoch"""
+    return (horodatage - EPOQUE).total_seconds()
+
+class CompteurGlissant:
+    """Événements par minute sur les `minutes` dernières minutes (tableau circulaire, mise à jour O(1))"""
+    __slots__ = ('minutes', '_comptes', '_reperes')
+    
+    def __init__(self, minutes):
+        self.minutes = minutes
+        self._comptes = [0] * minutes
+        self._reperes = [-1] * minutes  # Minute (epoch) à laquelle correspond chaque case
+    
+    def ajouter(self, instant, nombre=1):
+        minute = int(instant // 60)
+        case = minute % self.minutes
+        if self._reperes[case] != minute:
+            if self._reperes[case] > minute:
+                return  # Plus ancien que la fenêtre
+            self._reperes[case] = minute
+            self._comptes[case] = 0
+        self._comptes[case] += nombre
+    
+    def par_minute(self, maintenant):
+        """Comptes des `minutes` dernières minutes, de la plus ancienne à la minute en cours"""
+        courante = int(maintenant // 60)
+        return [
+            self._comptes[minute % self.minutes] if self._reperes[minute % self.minutes] == minute else 0
+            for minute in range(courante - self.minutes + 1, courante + 1)
+        ]
+
+class GrimpeursActifs:
+    """Dernière activité de chaque grimpeur, la plus ancienne en tête : les expirés sortent par le début"""
+    __slots__ = ('duree', '_activites')
+    
+    def __init__(self, duree):
+        self.duree = duree
+        self._activites = OrderedDict()  # grimpeur_id -> instant
+    
+    def activite(self, grimpeur_id, instant):
+        precedent = self._activites.get(grimpeur_id)
+        if precedent is not None and precedent >= instant:
+            return
+        self._activites[grimpeur_id] = instant
+        self._activites.move_to_end(grimpeur_id)
+    
+    def nombre(self, maintenant):
+        limite = maintenant - self.duree
+        while self._activites:
+            grimpeur_id, instant = next(iter(self._activites.items()))
+            if instant >= limite:
+                break
+            del self._activites[grimpeur_id]
+        return len(self._activites)
+
+class StatistiquesDirect:
+    """Compteurs du tableau de bord tenus à jour par les écritures (validations, inscriptions)
+    
+    Chaque worker ne voit que ses propres écritures : toutes les `reconciliation` secondes, la
+    lecture suivante recalcule les compteurs depuis la base (totaux, fenêtres glissantes des
+    compétitions ouvertes, validations par voie), puis les écritures locales s'y ajoutent.
+    Une revalidation (meilleur cercle) compte comme une validation jusqu'à la réconciliation.
+    """
+    
+    def __init__(self, fenetre=60, actifs=15, reconciliation=60):
+        self.fenetre = fenetre                # minutes
+        self.actifs = actifs                  # minutes
+        self.reconciliation = reconciliation  # secondes
+        self.taux_min = 0.05
+        self.taux_max = 0.95
+        self._reconcilie = None  # time.monotonic() de la dernière réconciliation
+        self._date_reconciliation = None
+        self._lock = threading.Lock()
+        self._reconciliation_lock = threading.Lock()
+        self._vider()
+    
+    def init_app(self, app):
+        self.fenetre = app.config.get('STATS_FENETRE_MINUTES', self.fenetre)
+        self.actifs = app.config.get('STATS_ACTIFS_MINUTES', self.actifs)
+        self.reconciliation = app.config.get('STATS_RECONCILIATION', self.reconciliation)
+        self.taux_min = app.config.get('STATS_TAUX_MIN', self.taux_min)
+        self.taux_max = app.config.get('STATS_TAUX_MAX', self.taux_max)
+        self._vider()
+    
+    def _vider(self):
+        self.totaux = {'competitions': 0, 'grimpeurs': 0, 'voies': 0, 'validations': 0, 'inscriptions': 0}
+        self.validations_minute = CompteurGlissant(self.fenetre)
+        self.inscriptions_minute = CompteurGlissant(self.fenetre)
+        self.grimpeurs_actifs = GrimpeursActifs(self.actifs * 60)
+        self.competitions = {}  # competition_id (ouverte) -> {'nom', 'nb_inscrits', 'voies': {voie_id: [nom, validations, tops]}}
+        self._reconcilie = None
+    
+    # Écritures : appelées après le commit
+    
+    def validation(self, competition_id, grimpeur_id, voie_id, ordre=None):
+        """Une validation enregistrée ; ordre du cercle s'il est connu (instantané)"""
+        maintenant = time.time()
+        with self._lock:
+            self.totaux['validations'] += 1
+            self.validations_minute.ajouter(maintenant)
+            self.grimpeurs_actifs.activite(grimpeur_id, maintenant)
+            competition = self.competitions.get(competition_id)
+            if competition is not None:
+                voie = competition['voies'].setdefault(voie_id, [None, 0, 0])
+                voie[1] += 1
+                if ordre == 1:
+                    voie[2] += 1
+    
+    def inscription(self, competition_id):
+        maintenant = time.time()
+        with self._lock:
+            self.totaux['inscriptions'] += 1
+            self.inscriptions_minute.ajouter(maintenant)
+            competition = self.competitions.get(competition_id)
+            if competition is not None:
+                competition['nb_inscrits'] += 1
+    
+    # Lecture
+    
+    def lire(self):
+        """Statistiques courantes ; réconciliées avec la base si la dernière réconciliation est trop ancienne"""
+        if self._reconcilie is None or time.monotonic() - self._reconcilie >= self.reconciliation:
+            # Une seule réconciliation à la fois : les autres lecteurs servent les compteurs courants
+            if self._reconciliation_lock.acquire(blocking=self._reconcilie is None):
+                try:
+                    self.reconcilier()
+                finally:
+                    self._reconciliation_lock.release()
+        
+        maintenant = time.time()
+        with self._lock:
+            par_minute = self.validations_minute.par_minute(maintenant)
+            inscriptions = self.inscriptions_minute.par_minute(maintenant)
+            return dict(
+                self.totaux,
+                validations_par_minute=par_minute,
+                validations_derniere_minute=par_minute[-1],
+                inscriptions_fenetre=sum(inscriptions),
+                grimpeurs_actifs=self.grimpeurs_actifs.nombre(maintenant),
+                fenetre_minutes=self.fenetre,
+                actifs_minutes=self.actifs,
+                competitions_ouvertes=[self._voies(competition_id, competition)
+                                       for competition_id, competition in self.competitions.items()],
+                reconciliation=self._date_reconciliation.isoformat() if self._date_reconciliation else None
+            )
+    
+    def _voies(self, competition_id, competition):
+        """Taux de réussite des voies d'une compétition, de la plus dure à la plus facile"""
+        nb_inscrits = competition['nb_inscrits']
+        voies = []
+        for voie_id, (nom, validations, tops) in competition['voies'].items():
+            taux = validations / nb_inscrits if nb_inscrits else 0
+            alerte = None
+            if nb_inscrits and taux < self.taux_min:
+                alerte = 'trop_dure'
+            elif nb_inscrits and taux > self.taux_max:
+                alerte = 'trop_facile'
+            voies.append({
+                'voie_id': voie_id,
+                'nom': nom,
+                'validations': validations,
+                'tops': tops,
+                'taux': round(taux, 3),
+                'alerte': alerte
+            })
+        voies.sort(key=lambda voie: voie['taux'])
+        return {'id': competition_id, 'nom': competition['nom'], 'nb_inscrits': nb_inscrits, 'voies': voies}
+    
+    def reconcilier(self):
+        """Recalcule tous les compteurs depuis la base (quelques requêtes groupées)"""
+        maintenant = time.time()
+        debut_fenetre = datetime.utcnow() - timedelta(minutes=self.fenetre)
+        debut_actifs = datetime.utcnow() - timedelta(minutes=self.actifs)
+        
+        totaux = db.session.query(
+            db.session.query(db.func.count(Competition.id)).scalar_subquery(),
+            db.session.query(db.func.count(User.id)).filter(User.role == 'grimpeur').scalar_subquery(),
+            db.session.query(db.func.count(Voie.id)).scalar_subquery(),
+            db.session.query(db.func.count(ValidationGrimpeur.id)).scalar_subquery(),
+            db.session.query(db.func.count(InscriptionCompetition.id)).scalar_subquery()
+        ).one()
+        
+        ouvertes = {competition_id: {'nom': nom, 'nb_inscrits': 0, 'voies': {}}
+                    for competition_id, nom in db.session.query(Competition.id, Competition.nom)
+                    .filter(Competition.is_open == True)}
+        ids = list(ouvertes)
+        
+        validations_minute = CompteurGlissant(self.fenetre)
+        inscriptions_minute = CompteurGlissant(self.fenetre)
+        grimpeurs_actifs = GrimpeursActifs(self.actifs * 60)
+        
+        if ids:
+            for competition_id, nb in db.session.query(InscriptionCompetition.competition_id, db.func.count(InscriptionCompetition.id))\
+                    .filter(InscriptionCompetition.competition_id.in_(ids))\
+                    .group_by(InscriptionCompetition.competition_id):
+                ouvertes[competition_id]['nb_inscrits'] = nb
+            
+            # Toutes les voies, y compris celles que personne n'a encore validées
+            for competition_id, voie_id, nom in db.session.query(CompetitionVoie.competition_id, Voie.id, Voie.nom)\
+                    .join(Voie, CompetitionVoie.voie_id == Voie.id)\
+                    .filter(CompetitionVoie.competition_id.in_(ids)):
+                ouvertes[competition_id]['voies'][voie_id] = [nom, 0, 0]
+            
+            for competition_id, voie_id, nom, validations, tops in db.session.query(
+                    ValidationGrimpeur.competition_id, ValidationGrimpeur.voie_id, Voie.nom,
+                    db.func.count(ValidationGrimpeur.id),
+                    db.func.sum(db.case((Circle.ordre == 1, 1), else_=0))
+                ).join(Voie, ValidationGrimpeur.voie_id == Voie.id)\
+                    .join(Circle, ValidationGrimpeur.circle_id == Circle.id)\
+                    .filter(ValidationGrimpeur.competition_id.in_(ids))\
+                    .group_by(ValidationGrimpeur.competition_id, ValidationGrimpeur.voie_id, Voie.nom):
+                ouvertes[competition_id]['voies'][voie_id] = [nom, validations, tops or 0]
+            
+            # Fenêtres glissantes : validations des compétitions ouvertes (index par compétition)
+            minute = self._minute(ValidationGrimpeur.datetime_creation)
+            for debut_minute, nb in db.session.query(minute, db.func.count(ValidationGrimpeur.id))\
+                    .filter(ValidationGrimpeur.competition_id.in_(ids))\
+                    .filter(ValidationGrimpeur.datetime_creation >= debut_fenetre)\
+                    .group_by(minute):
+                validations_minute.ajouter(_secondes(self._en_datetime(debut_minute)), nb)
+            
+            for grimpeur_id, derniere in db.session.query(ValidationGrimpeur.grimpeur_id, db.func.max(ValidationGrimpeur.datetime_creation))\
+                    .filter(ValidationGrimpeur.competition_id.in_(ids))\
+                    .filter(ValidationGrimpeur.datetime_creation >= debut_actifs)\
+                    .group_by(ValidationGrimpeur.grimpeur_id)\
+                    .order_by(db.func.max(ValidationGrimpeur.datetime_creation)):
+                grimpeurs_actifs.activite(grimpeur_id, _secondes(self._en_datetime(derniere)))
+        
+        minute = self._minute(InscriptionCompetition.date_inscription)
+        for debut_minute, nb in db.session.query(minute, db.func.count(InscriptionCompetition.id))\
+                .filter(InscriptionCompetition.date_inscription >= debut_fenetre)\
+                .group_by(minute):
+            inscriptions_minute.ajouter(_secondes(self._en_datetime(debut_minute)), nb)
+        
+        with self._lock:
+            self.totaux = dict(zip(('competitions', 'grimpeurs', 'voies', 'validations', 'inscriptions'), totaux))
+            self.competitions = ouvertes
+            self.validations_minute = validations_minute
+            self.inscriptions_minute = inscriptions_minute
+            self.grimpeurs_actifs = grimpeurs_actifs
+            self._reconcilie = time.monotonic()
+            self._date_reconciliation = datetime.utcfromtimestamp(maintenant)
+    
+    def _minute(self, colonne):
+        """Expression SQL : horodatage tronqué à la minute"""
+        if db.session.get_bind().dialect.name == 'postgresql':
+            return db.func.date_trunc('minute', colonne)
+        return db.func.strftime('%Y-%m-%d %H:%M:00', colonne)
+    
+    def _en_datetime(self, valeur):
+        # SQLite renvoie les expressions strftime / max() sous forme de texte
+        if isinstance(valeur, str):
+            return datetime.fromisoformat(valeur)
+        return valeur
+
+statistiques = StatistiquesDirect()
@@ -0,0 +1,155 @@
+# taches.py - File de tâches de fond persistée en base (sans broker externe)
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from models import db, Tache
+
+# Workers gunicorn gevent : threading est patché (dépendance optionnelle hors production)
+try:
+    from gevent import monkey as gevent_monkey
+    from gevent.threadpool import ThreadPoolExecutor as ThreadPoolExecutorNatif
+except ImportError:
+    gevent_monkey = None
+
+logger = logging.getLogger(__name__)
+
+# Type de tâche -> fonction exécutée (appelée avec les paramètres enregistrés)
+TRAITEMENTS = {}
+
+def traitement(type_tache):
+    """Déclare la fonction exécutée pour un type de tâche"""
+    def decorateur(fonction):
+        TRAITEMENTS[type_tache] = fonction
+        return fonction
+    return decorateur
+
+def creer_tache(type_tache, **parametres):
+    """Ajoute une tâche dans la transaction courante ; la lancer avec file_taches.lancer() après le commit"""
+    if type_tache not in TRAITEMENTS:
+        raise ValueError(f"Type de tâche inconnu: {type_tache}")
+    tache = Tache(type=type_tache, parametres=json.dumps(parametres), statut='en_attente')
+    db.session.add(tache)
+    db.session.flush()
+    return tache
+
+class FileTaches:
+    """Pool de threads exécutant les tâches enregistrées dans la table Tache
+    
+    Les tâches tournent dans des threads système, y compris sous gevent : avec threading patché,
+    un ThreadPoolExecutor n'exécuterait que des greenlets, et un traitement CPU
+    (images.traiter_image) bloquerait la boucle d'événements du worker et ses flux SSE.
+    
+    Chaque tâche est réservée par un UPDATE conditionnel sur son statut : plusieurs workers
+    gunicorn peuvent partager la table sans exécuter deux fois la même tâche. Au démarrage,
+    les tâches en attente (et celles restées en cours trop longtemps, worker arrêté en pleine
+    exécution) sont relancées.
+    """
+    
+    def __init__(self, nb_workers=2, delai_reprise=600, tentatives_max=3):
+        self.nb_workers = nb_workers
+        self.delai_reprise = delai_reprise
+        self.tentatives_max = tentatives_max
+        self.app = None
+        self._executor = None
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        self.app = app
+        self.nb_workers = app.config.get('TACHES_WORKERS', self.nb_workers)
+        self.delai_reprise = app.config.get('TACHES_DELAI_REPRISE', self.delai_reprise)
+        self.tentatives_max = app.config.get('TACHES_TENTATIVES_MAX', self.tentatives_max)
+    
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                if gevent_monkey is not None and gevent_monkey.is_module_patched('threading'):
+                    self._executor = ThreadPoolExecutorNatif(max_workers=self.nb_workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.nb_workers, thread_name_prefix='tache')
+            return self._executor
+    
+    def lancer(self, tache_id):
+        """Soumet une tâche (déjà commitée) au pool"""
+        return self._pool().submit(self._executer, tache_id)
+    
+    def reprendre(self):
+        """Relance les tâches en attente ou abandonnées ; retourne leur nombre
+        
+        Les tentatives sont comptées à la réservation : une tâche qui arrête le worker à chaque
+        exécution (sans passer par l'échec enregistré dans _executer) finit en échec au lieu
+        d'être relancée à chaque démarrage.
+        """
+        limite = datetime.utcnow() - timedelta(seconds=self.delai_reprise)
+        abandonnees = Tache.query.filter(Tache.statut == 'en_cours', Tache.date_maj < limite)
+        abandonnees.filter(Tache.tentatives >= self.tentatives_max)\
+            .update({'statut': 'echec', 'erreur': 'Interrompue à chaque tentative'}, synchronize_session=False)
+        abandonnees.filter(Tache.tentatives < self.tentatives_max)\
+            .update({'statut': 'en_attente'}, synchronize_session=False)
+        db.session.commit()
+        
+        taches_ids = [row[0] for row in db.session.query(Tache.id)
+                      .filter(Tache.statut == 'en_attente')
+                      .order_by(Tache.id)]
+        for tache_id in taches_ids:
+            self.lancer(tache_id)
+        return len(taches_ids)
+    
+    def attendre(self):
+        """Attend la fin des tâches soumises (arrêt propre, commandes CLI)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+    
+    def _reserver(self, tache_id):
+        """Passe la tâche en cours si elle est encore en attente ; False si un autre worker l'a prise"""
+        nb_lignes = Tache.query.filter_by(id=tache_id, statut='en_attente')\
+            .update({
+                'statut': 'en_cours',
+                'tentatives': Tache.tentatives + 1,
+                'date_maj': datetime.utcnow()
+            }, synchronize_session=False)
+        db.session.commit()
+        return nb_lignes == 1
+    
+    def _executer(self, tache_id):
+        # Nouvel essai immédiat, dans le même thread, tant que le nombre maximum de tentatives
+        # n'est pas atteint (le pool natif de gevent ne reçoit des tâches que du thread du hub)
+        while self._tentative(tache_id):
+            pass
+    
+    def _tentative(self, tache_id):
+        """Exécute la tâche une fois ; True si elle a échoué et doit être relancée"""
+        with self.app.app_context():
+            try:
+                if not self._reserver(tache_id):
+                    return False
+                
+                tache = db.session.get(Tache, tache_id)
+                resultat = TRAITEMENTS[tache.type](**json.loads(tache.parametres))
+                
+                tache.statut = 'terminee'
+                tache.resultat = json.dumps(resultat)
+                tache.erreur = None
+                db.session.commit()
+                return False
+            
+            except Exception as e:
+                db.session.rollback()
+                logger.exception("Échec de la tâche %s", tache_id)
+                
+                tache = db.session.get(Tache, tache_id)
+                if tache is None:
+                    return False
+                relancer = tache.tentatives < self.tentatives_max
+                tache.statut = 'en_attente' if relancer else 'echec'
+                tache.erreur = str(e)
+                db.session.commit()
+                return relancer
+            
+            finally:
+                db.session.remove()
+
+file_taches = FileTaches()
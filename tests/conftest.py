@@ -0,0 +1,167 @@
+# tests/conftest.py - Application de test sur une base SQLite temporaire et jeu de données commun
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, User, Competition, Voie, Circle, Level, Categorie, ValidationGrimpeur, CompetitionCategorie, CompetitionVoie, InscriptionCompetition
+from classement import reconstruire_scores, recalculer_categories
+from catalogue import catalogue_voies
+from codes_connexion import cache_codes
+from instantane import instantanes
+from format_classement import cache_corps
+from moteur_classement import matrices_classement
+from taches import file_taches
+
+@pytest.fixture
+def config_app():
+    """Configuration ajoutée à celle des tests (fixture redéfinie par les modules qui en ont besoin)"""
+    return {}
+
+@pytest.fixture
+def app(tmp_path, config_app):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'escalade.db'}",
+        'TACHES_WORKERS': 1,
+        'SQL_INSTRUMENTATION': True,  # Budgets de requêtes (instrumentation_sql.budget_requetes)
+        **config_app
+    })
+    with app.app_context():
+        yield app
+        file_taches.attendre()
+        db.session.remove()
+    
+    # Caches du processus indexés par identifiant : vidés entre deux bases
+    for cache in (catalogue_voies, cache_codes, instantanes, cache_corps, matrices_classement):
+        cache.vider()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def connecter(client, user):
+    with client.session_transaction() as session:
+        session['user_id'] = user.id
+        session['user_role'] = user.role
+
+def validations_particulieres(competition):
+    """Validations en marge du barème de la compétition
+    
+    Comptent (ValidationGrimpeur.calculate_score) : voie retirée de la compétition, cercle d'une autre voie.
+    Ne compte pas : voie sans niveau.
+    """
+    niveau_id = competition.voies_test[0].level_id
+    hors_competition = Voie(nom='Hors compétition', level_id=niveau_id)
+    sans_niveau = Voie(nom='Sans niveau', level_id=None)
+    db.session.add_all([hors_competition, sans_niveau])
+    db.session.flush()
+    db.session.add(CompetitionVoie(competition_id=competition.id, voie_id=sans_niveau.id))
+    cercles = {}
+    for voie in (hors_competition, sans_niveau):
+        cercles[voie.id] = Circle(x=1, y=1, radius=1, ordre=2, voie_id=voie.id)
+        db.session.add(cercles[voie.id])
+    db.session.flush()
+    
+    maintenant = datetime.utcnow()
+    grimpeurs = competition.grimpeurs_test
+    for grimpeur, voie in ((grimpeurs[0], hors_competition), (grimpeurs[2], sans_niveau)):
+        db.session.add(ValidationGrimpeur(grimpeur_id=grimpeur.id, voie_id=voie.id, competition_id=competition.id,
+                                          circle_id=cercles[voie.id].id, datetime_creation=maintenant))
+    
+    # Cercle d'une voie de la compétition, enregistré sur une autre voie que le grimpeur n'a pas validée
+    grimpeur = grimpeurs[1]
+    validees = {v.voie_id for v in ValidationGrimpeur.query.filter_by(grimpeur_id=grimpeur.id, competition_id=competition.id)}
+    voie = next(v for v in competition.voies_test if v.id not in validees)
+    autre = next(v for v in competition.voies_test if v.id != voie.id)
+    db.session.add(ValidationGrimpeur(grimpeur_id=grimpeur.id, voie_id=voie.id, competition_id=competition.id,
+                                      circle_id=autre.circles.filter_by(ordre=3).first().id, datetime_creation=maintenant))
+    db.session.commit()
+    reconstruire_scores(competition.id)
+
+def totaux_par_validation(competition_id):
+    """{grimpeur_id: (total, nombre de voies)} calculés validation par validation (ValidationGrimpeur.calculate_score)"""
+    totaux = {}
+    for validation in ValidationGrimpeur.query.filter_by(competition_id=competition_id):
+        if validation.voie and validation.voie.level and validation.circle:
+            total, nb_voies = totaux.get(validation.grimpeur_id, (0, 0))
+            totaux[validation.grimpeur_id] = (total + validation.calculate_score(), nb_voies + 1)
+    return totaux
+
+def ex_aequo(competition):
+    """Deux grimpeurs aux validations identiques (mêmes voies, cercles et dates) : ex aequo après départages"""
+    modele = next(grimpeur for grimpeur in competition.grimpeurs_test
+                  if ValidationGrimpeur.query.filter_by(grimpeur_id=grimpeur.id, competition_id=competition.id).count())
+    copie = next(grimpeur for grimpeur in competition.grimpeurs_test if grimpeur.id != modele.id)
+    ValidationGrimpeur.query.filter_by(grimpeur_id=copie.id, competition_id=competition.id).delete()
+    for validation in ValidationGrimpeur.query.filter_by(grimpeur_id=modele.id, competition_id=competition.id).all():
+        db.session.add(ValidationGrimpeur(grimpeur_id=copie.id, voie_id=validation.voie_id, competition_id=competition.id,
+                                          circle_id=validation.circle_id, datetime_creation=validation.datetime_creation))
+    db.session.commit()
+    reconstruire_scores(competition.id)
+    return modele.id, copie.id
+
+@pytest.fixture
+def competition(app):
+    """Compétition terminée : 8 voies de 4 cercles, 30 inscrits, validations aléatoires"""
+    aleatoire = random.Random(1)
+    niveaux = Level.query.order_by(Level.score).all()
+    categories = [
+        Categorie(nom='Senior M', annee_min=20, annee_max=39, genre='masculin'),
+        Categorie(nom='Senior F', annee_min=20, annee_max=39, genre='feminin'),
+        Categorie(nom='Open', annee_min=6, annee_max=99, genre='mixte')
+    ]
+    db.session.add_all(categories)
+    competition = Competition(
+        nom='Contest', date_debut=datetime.now() - timedelta(days=2), date_fin=datetime.now() - timedelta(days=1),
+        is_open=False, inscription_is_open=True, nombre_participant_max=1000
+    )
+    db.session.add(competition)
+    db.session.flush()
+    for categorie in categories:
+        db.session.add(CompetitionCategorie(competition_id=competition.id, categorie_id=categorie.id))
+    
+    voies = []
+    for i in range(8):
+        voie = Voie(nom=f'Voie {i}', level_id=aleatoire.choice(niveaux).id)
+        db.session.add(voie)
+        db.session.flush()
+        for ordre in range(1, 5):
+            db.session.add(Circle(x=10, y=10, radius=5, ordre=ordre, voie_id=voie.id))
+        db.session.add(CompetitionVoie(competition_id=competition.id, voie_id=voie.id))
+        voies.append(voie)
+    
+    grimpeurs = []
+    for i in range(30):
+        grimpeur = User(
+            nom=f'Nom{i}', prenom=f'Prenom{i}', date_naissance=date(1990 + aleatoire.randint(0, 10), 1, 1),
+            sexe=aleatoire.choice(['masculin', 'feminin']), role='grimpeur', code_connexion=f'{100000 + i}'
+        )
+        db.session.add(grimpeur)
+        db.session.flush()
+        db.session.add(InscriptionCompetition(competition_id=competition.id, grimpeur_id=grimpeur.id))
+        grimpeurs.append(grimpeur)
+    db.session.flush()
+    
+    for grimpeur in grimpeurs:
+        for voie in aleatoire.sample(voies, aleatoire.randint(0, len(voies))):
+            circle = aleatoire.choice(voie.circles.all())
+            db.session.add(ValidationGrimpeur(
+                grimpeur_id=grimpeur.id, voie_id=voie.id, competition_id=competition.id, circle_id=circle.id,
+                datetime_creation=datetime.utcnow() - timedelta(minutes=aleatoire.randint(0, 600))
+            ))
+    db.session.commit()
+    
+    reconstruire_scores(competition.id)
+    recalculer_categories(competition.id)
+    competition.voies_test = voies
+    competition.grimpeurs_test = grimpeurs
+    return competition
+
+@pytest.fixture
+def admin(app):
+    return User.query.filter_by(role='admin').first()
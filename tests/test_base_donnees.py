@@ -0,0 +1,32 @@
+# tests/test_base_donnees.py - Profil SQLite (WAL) et transactions d'écriture rejouées quand la base est occupée
+import sqlite3
+import pytest
+from sqlalchemy.exc import OperationalError
+from models import db
+from base_donnees import profil_base
+
+def test_ecriture_rejouee_si_base_occupee(app):
+    appels = []
+    
+    def transaction():
+        appels.append(1)
+        if len(appels) < 3:
+            raise OperationalError('INSERT', {}, sqlite3.OperationalError('database is locked'))
+        return 'ok'
+    assert profil_base.ecrire(transaction) == 'ok'
+    assert len(appels) == 3
+    
+    # Autre erreur : pas de nouvelle tentative
+    appels.clear()
+    
+    def erreur():
+        appels.append(1)
+        raise OperationalError('INSERT', {}, sqlite3.OperationalError('no such table: x'))
+    with pytest.raises(OperationalError):
+        profil_base.ecrire(erreur)
+    assert len(appels) == 1
+
+def test_profil_sqlite(app):
+    pragmas = {nom: db.session.execute(db.text(f'PRAGMA {nom}')).scalar()
+               for nom in ('journal_mode', 'busy_timeout', 'synchronous')}
+    assert pragmas == {'journal_mode': 'wal', 'busy_timeout': app.config['SQLITE_BUSY_TIMEOUT_MS'], 'synchronous': 1}
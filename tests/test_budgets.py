@@ -0,0 +1,112 @@
+# tests/test_budgets.py - Nombre de requêtes SQL des routes fréquentes, indépendant du nombre de grimpeurs et de voies
+from datetime import date, datetime
+import pytest
+from models import db, User, Competition, Voie, Circle, ValidationGrimpeur, CompetitionCategorie, CompetitionVoie, InscriptionCompetition
+from instrumentation import instrumentation_sql
+from instantane import instantanes
+from conftest import connecter
+
+@pytest.fixture
+def ids(competition):
+    """Identifiants lus avant les requêtes : chaque requête part d'une session vide, comme en production"""
+    voie = competition.voies_test[0]
+    return {
+        'competition': competition.id,
+        'grimpeur': competition.grimpeurs_test[0],
+        'voie': voie.id,
+        'circle': voie.circles.first().id
+    }
+
+# Listes d'administration paginées : une requête de liste (compteurs groupés), plus les rôles
+# comptés (utilisateurs) ou les catégories des compétitions de la page
+BUDGETS_LISTES_ADMIN = {
+    '/api/admin/users': 2,
+    '/api/admin/competitions': 2,
+    '/api/admin/voies': 1
+}
+
+def _ouvrir(competition_id):
+    db.session.get(Competition, competition_id).is_open = True
+    db.session.commit()
+    instantanes.obtenir(competition_id)
+
+def _requete(client, budget, methode, url, **kwargs):
+    db.session.remove()
+    with instrumentation_sql.budget_requetes(budget):
+        reponse = getattr(client, methode)(url, **kwargs)
+    assert reponse.status_code in (200, 304)
+    return reponse
+
+def test_budget_classement(client, admin, ids):
+    connecter(client, admin)
+    url = f"/api/competition/{ids['competition']}/classement"
+    
+    # Premier calcul : matrice chargée une fois pour toutes les catégories
+    _requete(client, 13, 'get', url)
+    # Même version : corps en cache, seule la compétition est relue
+    reponse = _requete(client, 1, 'get', url)
+    _requete(client, 1, 'get', url, headers={'If-None-Match': reponse.headers['ETag']})
+    # Autre représentation de la même version : matrice en mémoire
+    _requete(client, 5, 'get', url + '?format=compact')
+    _requete(client, 9, 'get', url + '?since=0')
+
+def test_budget_liste_des_voies(client, ids):
+    connecter(client, ids['grimpeur'])
+    url = f"/api/voies/list?competition_id={ids['competition']}"
+    
+    _requete(client, 3, 'get', url)
+    _requete(client, 2, 'get', url)  # Catalogue en cache
+    
+    # Compétition ouverte : catalogue dans l'instantané, statut du grimpeur en une requête
+    _ouvrir(ids['competition'])
+    _requete(client, 1, 'get', url)
+
+def test_budget_validation(client, ids):
+    connecter(client, ids['grimpeur'])
+    donnees = {'circle_id': ids['circle'], 'voie_id': ids['voie'], 'competition_id': ids['competition']}
+    
+    _requete(client, 9, 'post', '/api/validate', json=donnees)
+    
+    # Compétition ouverte : inscription et cercle vérifiés dans l'instantané
+    _ouvrir(ids['competition'])
+    _requete(client, 7, 'post', '/api/validate', json=donnees)
+    # Clé d'idempotence : lue puis enregistrée ; un renvoi ne relit que la clé
+    _requete(client, 9, 'post', '/api/validate', json=dict(donnees, idempotency_key='cle-budget'))
+    _requete(client, 1, 'post', '/api/validate', json=dict(donnees, idempotency_key='cle-budget'))
+
+def _agrandir(ids, facteur):
+    """Ajoute des grimpeurs, compétitions et voies (avec inscriptions, catégories, cercles et validations)"""
+    categorie_id = db.session.query(CompetitionCategorie.categorie_id).filter_by(competition_id=ids['competition']).first()[0]
+    level_id = db.session.get(Voie, ids['voie']).level_id
+    for i in range(facteur * 30):
+        grimpeur = User(nom=f'Ajout{i}', prenom='Grimpeur', date_naissance=date(2000, 1, 1), sexe='feminin', role='grimpeur')
+        db.session.add(grimpeur)
+        db.session.flush()
+        db.session.add(InscriptionCompetition(competition_id=ids['competition'], grimpeur_id=grimpeur.id))
+        db.session.add(ValidationGrimpeur(grimpeur_id=grimpeur.id, voie_id=ids['voie'], competition_id=ids['competition'], circle_id=ids['circle']))
+    for i in range(facteur * 10):
+        autre = Competition(nom=f'Ajout {i}', date_debut=datetime(2026, 1, 1), date_fin=datetime(2026, 1, 2), is_open=False)
+        db.session.add(autre)
+        db.session.flush()
+        db.session.add(CompetitionCategorie(competition_id=autre.id, categorie_id=categorie_id))
+        db.session.add(CompetitionVoie(competition_id=autre.id, voie_id=ids['voie']))
+    for i in range(facteur * 8):
+        autre = Voie(nom=f'Ajout {i}', level_id=level_id)
+        db.session.add(autre)
+        db.session.flush()
+        db.session.add(Circle(x=1, y=1, radius=1, ordre=1, voie_id=autre.id))
+    db.session.commit()
+
+@pytest.mark.parametrize('url', ['/api/admin/users', '/api/admin/competitions', '/api/admin/voies'])
+def test_budget_listes_admin(client, admin, ids, url):
+    connecter(client, admin)
+    budget = BUDGETS_LISTES_ADMIN[url]
+    
+    # Même nombre de requêtes quel que soit le volume : pas de requête par ligne
+    nombres = []
+    for facteur in (0, 10):
+        _agrandir(ids, facteur)
+        with instrumentation_sql.compter_requetes() as requetes:
+            _requete(client, budget, 'get', url)
+        nombres.append(len(requetes))
+    assert nombres[0] == nombres[1]
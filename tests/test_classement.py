@@ -0,0 +1,148 @@
+# tests/test_classement.py - Représentations du classement : synchronisation différentielle et flux en direct
+import json
+import pytest
+from models import db, Competition, ScoreGrimpeur
+from classement import categories_competition, version_classement, publier_versions_en_attente, VERSION_EN_ATTENTE
+from instrumentation import instrumentation_sql
+from validations import enregistrer_validation
+from diffusion import flux_classement
+from conftest import connecter
+
+def _positions(donnees):
+    """{cle: {grimpeur_id: rang}} à partir des positions [[grimpeur_id, rang], ...] envoyées au client"""
+    return {cle: dict(map(tuple, rangs)) for cle, rangs in donnees['positions'].items()}
+
+def _evenement(texte):
+    nom, donnees = texte.strip().split('\n')
+    return nom.removeprefix('event: '), json.loads(donnees.removeprefix('data: '))
+
+def test_positions_differentielles_egales_au_classement(client, admin, competition):
+    connecter(client, admin)
+    complet = client.get(f'/api/competition/{competition.id}/classement').get_json()
+    differentiel = client.get(f'/api/competition/{competition.id}/classement?since=0').get_json()
+    
+    noms = {f"{ligne['prenom']} {ligne['nom']}": ligne['id'] for ligne in differentiel['grimpeurs']}
+    positions = _positions(differentiel)
+    for categorie in differentiel['categories']:
+        attendu = {noms[ligne['grimpeur']]: ligne['position'] for ligne in complet[categorie['nom']]}
+        assert positions[str(categorie['id'])] == attendu
+
+def test_flux_envoie_les_rangs_modifies(app, client, competition):
+    departages = app.config['CLASSEMENT_DEPARTAGES']
+    grimpeur = competition.grimpeurs_test[3]
+    autre = competition.grimpeurs_test[0]
+    cercles = [(voie.id, voie.circles.first().id) for voie in competition.voies_test]
+    flux = flux_classement(competition.id, 0.01, departages)
+    nom, init = _evenement(next(flux))
+    assert nom == 'init'
+    rangs = _positions(init)
+    
+    # Un grimpeur valide toutes les voies : il passe en tête et décale les autres sans que leur ligne change
+    connecter(client, grimpeur)
+    for voie_id, circle_id in cercles:
+        client.post('/api/validate', json={'circle_id': circle_id, 'voie_id': voie_id, 'competition_id': competition.id})
+    
+    texte = next(flux)
+    while texte.startswith(':'):
+        texte = next(flux)
+    nom, maj = _evenement(texte)
+    assert nom == 'maj'
+    assert [ligne['id'] for ligne in maj['grimpeurs']] == [grimpeur.id]
+    for cle, modifies in _positions(maj).items():
+        rangs[cle].update(modifies)
+    
+    # Rangs initiaux mis à jour par les seuls rangs modifiés = rangs complets de la nouvelle version
+    connecter(client, autre)
+    differentiel = client.get(f'/api/competition/{competition.id}/classement?since=0').get_json()
+    assert differentiel['version'] == maj['version']
+    assert rangs == _positions(differentiel)
+
+def test_flux_ouvert_aux_ecrans_avec_jeton(app, client, competition):
+    url = f'/api/competition/{competition.id}/classement/stream'
+    assert client.get(url).status_code == 401
+    assert client.get(url + '?jeton=secret').status_code == 401
+    
+    app.config['AFFICHAGE_JETON'] = 'secret'
+    assert client.get(url + '?jeton=autre').status_code == 401
+    reponse = client.get(url + '?jeton=secret', buffered=False)
+    assert reponse.status_code == 200
+    assert next(reponse.response).startswith(b'event: init')
+    reponse.close()
+    
+    # Page d'affichage : jeton transmis au flux
+    assert b'"secret"' in client.get(f'/classement/{competition.id}?jeton=secret').data
+
+def test_differentiel_refuse_format_et_champs(client, admin, competition):
+    connecter(client, admin)
+    url = f'/api/competition/{competition.id}/classement?since=0'
+    assert client.get(url).status_code == 200
+    assert client.get(url + '&format=compact').status_code == 400
+    assert client.get(url + '&fields=grimpeur,position').status_code == 400
+
+def test_sexe_modifie_reassigne_les_categories(client, admin, competition):
+    grimpeur = competition.grimpeurs_test[4]
+    autre_sexe = 'feminin' if grimpeur.sexe == 'masculin' else 'masculin'
+    categories = {categorie.genre: categorie.id for categorie in categories_competition(competition.id)}
+    connecter(client, admin)
+    version = client.get(f'/api/competition/{competition.id}/classement?since=0').get_json()['version']
+    
+    reponse = client.post('/api/user/create', json={
+        'nom': grimpeur.nom, 'prenom': grimpeur.prenom, 'sexe': autre_sexe,
+        'date_naissance': grimpeur.date_naissance.strftime('%Y-%m-%d')
+    })
+    assert reponse.get_json()['success']
+    
+    # Seule la ligne du grimpeur est renvoyée, avec ses nouvelles catégories
+    differentiel = client.get(f'/api/competition/{competition.id}/classement?since={version}').get_json()
+    assert [ligne['id'] for ligne in differentiel['grimpeurs']] == [grimpeur.id]
+    assert sorted(differentiel['grimpeurs'][0]['categories']) == sorted([categories[autre_sexe], categories['mixte']])
+
+def test_format_compact_rattache_les_lignes_aux_grimpeurs(client, admin, competition):
+    connecter(client, admin)
+    url = f'/api/competition/{competition.id}/classement'
+    complet = client.get(url).get_json()
+    
+    # Détail des voies seul : l'indice du grimpeur reste la première colonne
+    compact = client.get(url + '?format=compact&fields=voies').get_json()
+    assert compact['colonnes'] == ['grimpeur']
+    voies = compact['voies']
+    for categorie in compact['categories']:
+        attendu = {ligne['grimpeur']: ligne['voies'] for ligne in complet[categorie['nom']]}
+        decode = {}
+        for (indice,) in categorie['lignes']:
+            _, nom, validations = compact['grimpeurs'][indice]
+            decode[nom] = [voies[i][2] / ordre for i, ordre in validations]
+        assert decode.keys() == attendu.keys()
+        for nom, scores in decode.items():
+            assert sorted(scores) == pytest.approx(sorted(voie['score'] for voie in attendu[nom]))
+    
+    compact = client.get(url + '?format=compact&fields=position,score_total').get_json()
+    assert compact['colonnes'] == ['grimpeur', 'score_total', 'position']
+
+def test_version_publiee_apres_le_commit(competition):
+    grimpeur = competition.grimpeurs_test[5]
+    voie = competition.voies_test[0]
+    version = version_classement(competition.id)
+    
+    # Ligne Competition mise à jour une seule fois, après les scores (publication hors de la transaction)
+    with instrumentation_sql.compter_requetes() as requetes:
+        enregistrer_validation(grimpeur.id, voie.id, competition.id, voie.circles.first().id, grimpeur.id, None)
+    ecritures = [requete for requete in requetes if requete.lstrip().upper().startswith('UPDATE COMPETITION')]
+    assert len(ecritures) == 1
+    assert requetes.index(ecritures[0]) > next(i for i, requete in enumerate(requetes) if 'score_grimpeur' in requete.lower())
+    
+    assert version_classement(competition.id) == version + 1
+    ligne = ScoreGrimpeur.query.filter_by(competition_id=competition.id, grimpeur_id=grimpeur.id).one()
+    assert ligne.version == version + 1
+
+def test_versions_en_attente_publiees(competition):
+    # Arrêt entre le commit de l'écriture et la publication : lignes restées en attente
+    lignes = ScoreGrimpeur.query.filter_by(competition_id=competition.id).limit(2).all()
+    for ligne in lignes:
+        ligne.version = VERSION_EN_ATTENTE
+    db.session.commit()
+    version = version_classement(competition.id)
+    
+    assert publier_versions_en_attente() == 1
+    assert version_classement(competition.id) == version + 1
+    assert not ScoreGrimpeur.query.filter_by(version=VERSION_EN_ATTENTE).count()
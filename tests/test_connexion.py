@@ -0,0 +1,31 @@
+# tests/test_connexion.py - Connexion par code : normalisation du code et cache des codes
+import time
+from models import db
+import codes_connexion
+from codes_connexion import cache_codes
+
+def test_code_normalise(client, competition):
+    code = competition.grimpeurs_test[0].code_connexion
+    for envoye in (code, f' {code} ', int(code)):
+        reponse = client.post('/api/login', json={'code': envoye})
+        assert reponse.get_json()['success']
+    assert client.post('/api/login', json={'code': None}).status_code == 400
+    
+    reponse = client.post('/api/login/multiple', json={'codes': [f'{code} ']})
+    assert len(reponse.get_json()['users']) == 1
+
+def test_cache_expire_apres_ecriture_d_un_autre_worker(app, client, competition, monkeypatch):
+    grimpeur = competition.grimpeurs_test[0]
+    code = grimpeur.code_connexion
+    assert client.post('/api/login', json={'code': code}).get_json()['user']['role'] == 'grimpeur'
+    
+    # Écriture par un autre worker : pas d'invalidation locale, le cache sert l'ancien rôle
+    with db.engine.begin() as connexion:
+        connexion.execute(db.text("UPDATE user SET role = 'ouvreur' WHERE id = :id"), {'id': grimpeur.id})
+    assert client.post('/api/login', json={'code': code}).get_json()['user']['role'] == 'grimpeur'
+    
+    # Au-delà de la durée de vie (courte), l'entrée est relue en base
+    assert cache_codes.duree_vie <= 30
+    depart = time.monotonic()
+    monkeypatch.setattr(codes_connexion.time, 'monotonic', lambda: depart + cache_codes.duree_vie + 1)
+    assert client.post('/api/login', json={'code': code}).get_json()['user']['role'] == 'ouvreur'
@@ -0,0 +1,29 @@
+# tests/test_exports.py - Exports du classement : positions départagées du moteur, classement « 1224 »
+import csv
+import io
+from models import db, User
+from moteur_classement import rangs_competition
+from conftest import connecter, ex_aequo
+
+def test_positions_export_egales_au_classement(client, admin, competition):
+    modele_id, copie_id = ex_aequo(competition)
+    connecter(client, admin)
+    complet = client.get(f'/api/competition/{competition.id}/classement').get_json()
+    
+    reponse = client.get(f'/api/competition/{competition.id}/export/classement')
+    assert reponse.status_code == 200
+    lignes = list(csv.reader(io.StringIO(reponse.data.decode('utf-8-sig')), delimiter=';'))[1:]
+    
+    # Même ordre que le classement JSON ; positions denses converties en « 1224 »
+    for nom_categorie, classement in complet.items():
+        exportees = [(ligne[4] + ' ' + ligne[3], int(ligne[2])) for ligne in lignes if ligne[1] == nom_categorie]
+        positions = rangs_competition([ligne['position'] for ligne in classement]).tolist()
+        assert exportees == [(ligne['grimpeur'], position) for ligne, position in zip(classement, positions)]
+    
+    # Ex aequo : même position, la suivante est sautée
+    ex_aequo_noms = {f"{grimpeur.prenom} {grimpeur.nom}" for grimpeur in (db.session.get(User, modele_id), db.session.get(User, copie_id))}
+    positions = [int(ligne[2]) for ligne in lignes if ligne[1] == 'Open']
+    partagees = {int(ligne[2]) for ligne in lignes if ligne[1] == 'Open' and ligne[4] + ' ' + ligne[3] in ex_aequo_noms}
+    assert len(partagees) == 1
+    position = partagees.pop()
+    assert positions.count(position) >= 2 and position + 1 not in positions
@@ -0,0 +1,35 @@
+# tests/test_images.py - Tâche de traitement des images : rejouable après un arrêt
+import os
+import pytest
+from PIL import Image
+from models import db, Voie
+from images import traiter_image_voie, url_original, url_variante
+
+@pytest.fixture
+def config_app(tmp_path):
+    return {'UPLOAD_FOLDER': str(tmp_path / 'uploads')}
+
+def test_traitement_rejouable(app):
+    dossier = app.config['UPLOAD_FOLDER']
+    os.makedirs(dossier)
+    original = 'abc_voie.png'
+    chemin = os.path.join(dossier, original)
+    Image.new('RGB', (64, 48), 'red').save(chemin)
+    voie = Voie(nom='Photo', image_path=url_original(original))
+    db.session.add(voie)
+    db.session.commit()
+    voie_id = voie.id
+    
+    resultat = traiter_image_voie(voie_id, original)
+    voie = db.session.get(Voie, voie_id)
+    assert voie.image_path == url_variante(resultat['image_hash'], 'full', 'jpg')
+    assert not os.path.exists(chemin)
+    
+    # Nouvelle tentative (tâche interrompue avant d'être marquée terminée) : original absent
+    assert traiter_image_voie(voie_id, original) == resultat
+    
+    # Arrêt entre le commit et la suppression : l'original restant est supprimé, la voie inchangée
+    Image.new('RGB', (64, 48), 'blue').save(chemin)
+    assert traiter_image_voie(voie_id, original) == resultat
+    assert not os.path.exists(chemin)
+    assert db.session.get(Voie, voie_id).image_path == url_variante(resultat['image_hash'], 'full', 'jpg')
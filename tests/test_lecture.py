@@ -0,0 +1,60 @@
+# tests/test_lecture.py - Lectures des vues @lecture_seule sur la base de lecture, écritures sur la principale
+import pytest
+from flask import g
+from sqlalchemy import event
+from models import db, Level
+from lecture import BIND_LECTURE
+from conftest import connecter
+
+@pytest.fixture
+def config_app():
+    # Fichier principal rouvert en lecture seule : deux moteurs distincts sur les mêmes données
+    return {'LECTURE_MODE': 'lecture-seule'}
+
+@pytest.fixture
+def requetes_par_moteur(app):
+    """{'lecture': [...], 'principale': [...]} : requêtes exécutées sur chaque moteur"""
+    requetes = {'lecture': [], 'principale': []}
+    moteurs = {'lecture': db.engines[BIND_LECTURE], 'principale': db.engines[None]}
+    ecouteurs = []
+    for nom, moteur in moteurs.items():
+        def ecouter(conn, cursor, statement, parameters, context, executemany, nom=nom):
+            requetes[nom].append(statement)
+        event.listen(moteur, 'before_cursor_execute', ecouter)
+        ecouteurs.append((moteur, ecouter))
+    yield requetes
+    for moteur, ecouter in ecouteurs:
+        event.remove(moteur, 'before_cursor_execute', ecouter)
+
+def _oublier_preparation(requetes):
+    # Rechargements des objets du jeu de données (session du test) : hors de la requête mesurée
+    db.session.remove()
+    for liste in requetes.values():
+        liste.clear()
+
+def test_session_routee(app):
+    with app.test_request_context():
+        g.lecture_seule = True
+        assert db.session.get_bind(clause=db.select(Level)) is db.engines[BIND_LECTURE]
+        assert db.session.get_bind(clause=db.update(Level).values(score=1)) is db.engines[None]
+        
+        g.lecture_seule = False
+        assert db.session.get_bind(clause=db.select(Level)) is db.engines[None]
+
+def test_vues_lecture_seule_sur_la_base_de_lecture(client, admin, competition, requetes_par_moteur):
+    url = f'/api/competition/{competition.id}/classement'
+    connecter(client, admin)
+    _oublier_preparation(requetes_par_moteur)
+    assert client.get(url).status_code == 200
+    assert requetes_par_moteur['lecture']
+    assert requetes_par_moteur['principale'] == []
+
+def test_ecritures_sur_la_principale(client, competition, requetes_par_moteur):
+    grimpeur = competition.grimpeurs_test[7]
+    voie = competition.voies_test[0]
+    donnees = {'circle_id': voie.circles.first().id, 'voie_id': voie.id, 'competition_id': competition.id}
+    connecter(client, grimpeur)
+    _oublier_preparation(requetes_par_moteur)
+    assert client.post('/api/validate', json=donnees).get_json()['success']
+    assert requetes_par_moteur['lecture'] == []
+    assert any(requete.startswith('INSERT INTO validation_grimpeur') for requete in requetes_par_moteur['principale'])
@@ -0,0 +1,141 @@
+# tests/test_moteur_classement.py - Moteur vectorisé et calcul SQL des scores : une seule règle de score
+import time
+import numpy as np
+from models import db, User, Competition, Voie, Circle, Level, CompetitionVoie, ScoreGrimpeur
+from scores import detail_competition
+from instantane import instantanes
+import moteur_classement
+from moteur_classement import DEPARTAGES, MatriceScores, charger_matrice, classer, ecarts_sql, matrices_classement
+from conftest import connecter, validations_particulieres, totaux_par_validation
+
+def test_moteur_identique_au_calcul_sql(app, competition):
+    validations_particulieres(competition)
+    
+    resultat = classer(charger_matrice(competition.id), app.config['CLASSEMENT_DEPARTAGES'])
+    assert ecarts_sql(competition.id, resultat) == []
+    
+    # Classement matérialisé (flux, ?since=, exports, séries) égal au moteur
+    matrice = resultat.matrice
+    for score in ScoreGrimpeur.query.filter_by(competition_id=competition.id):
+        i = matrice.index(score.grimpeur_id)
+        assert abs(score.score_total - resultat.totaux[i]) < 1e-9
+        assert score.nb_voies == resultat.nb_voies[i]
+
+def test_moteur_identique_au_calcul_par_validation(app, competition):
+    validations_particulieres(competition)
+    attendus = totaux_par_validation(competition.id)
+    
+    resultat = classer(charger_matrice(competition.id), app.config['CLASSEMENT_DEPARTAGES'])
+    for i, grimpeur_id in enumerate(resultat.matrice.grimpeurs_ids.tolist()):
+        total, nb_voies = attendus.get(grimpeur_id, (0, 0))
+        assert abs(resultat.totaux[i] - total) < 1e-9
+        assert resultat.nb_voies[i] == nb_voies
+    
+    # Premier au dernier : totaux décroissants, rangs croissants
+    assert (np.diff(resultat.totaux[resultat.ordre]) <= 1e-9).all()
+    assert (np.diff(resultat.rangs[resultat.ordre]) >= 0).all()
+
+def test_classement_2000_grimpeurs_60_voies_sous_50_ms():
+    aleatoire = np.random.default_rng(1)
+    n, m = 2000, 60
+    ordres = aleatoire.integers(0, 5, size=(n, m)).astype(np.int16)
+    niveaux = aleatoire.integers(1, 10, size=m) * 100
+    scores = np.where(ordres > 0, niveaux / np.maximum(ordres, 1), 0.0)
+    derniere = aleatoire.integers(0, 10 ** 6, size=n) + 1_700_000_000_000_000
+    matrice = MatriceScores(np.arange(1, n + 1), np.arange(1, m + 1), scores, ordres, derniere)
+    appartenance = aleatoire.random((n, 3)) < 0.5
+    
+    # Meilleure de plusieurs mesures : insensible à une machine de test momentanément chargée
+    durees = []
+    for _ in range(5):
+        debut = time.perf_counter()
+        classer(matrice, DEPARTAGES).par_categorie(appartenance)
+        durees.append(time.perf_counter() - debut)
+    assert min(durees) < 0.05
+
+def test_classement_complet_et_differentiel_concordent(client, admin, competition):
+    validations_particulieres(competition)
+    connecter(client, admin)
+    
+    complet = client.get(f'/api/competition/{competition.id}/classement').get_json()
+    differentiel = client.get(f'/api/competition/{competition.id}/classement?since=0').get_json()
+    
+    noms = {f"{ligne['prenom']} {ligne['nom']}": ligne for ligne in differentiel['grimpeurs']}
+    for lignes in complet.values():
+        for ligne in lignes:
+            attendu = noms[ligne['grimpeur']]
+            assert abs(ligne['score_total'] - attendu['score_total']) < 1e-9
+            assert ligne['nb_voies'] == attendu['nb_voies']
+            assert len(ligne['voies']) == ligne['nb_voies']
+
+def test_matrice_actualisee_par_difference(app, client, competition, monkeypatch):
+    departages = app.config['CLASSEMENT_DEPARTAGES']
+    version = db.session.get(Competition, competition.id).classement_version
+    matrices_classement.classement(competition.id, version, departages)
+    
+    # Nouvelles validations : seules les lignes de ce grimpeur sont relues
+    chargements = []
+    monkeypatch.setattr(moteur_classement, 'charger_matrice', lambda *args: chargements.append(args))
+    grimpeur = competition.grimpeurs_test[2]
+    connecter(client, grimpeur)
+    for voie in competition.voies_test[:3]:
+        reponse = client.post('/api/validate', json={
+            'circle_id': voie.circles.first().id, 'voie_id': voie.id, 'competition_id': competition.id
+        })
+        assert reponse.get_json()['success']
+    
+    db.session.expire_all()
+    version = db.session.get(Competition, competition.id).classement_version
+    resultat = matrices_classement.classement(competition.id, version, departages)
+    assert chargements == []
+    
+    monkeypatch.undo()
+    attendu = classer(charger_matrice(competition.id), departages)
+    assert (resultat.matrice.scores == attendu.matrice.scores).all()
+    assert (resultat.matrice.derniere == attendu.matrice.derniere).all()
+    assert (resultat.rangs == attendu.rangs).all()
+
+def test_instantane_applique_la_meme_regle(competition):
+    validations_particulieres(competition)
+    attendu = charger_matrice(competition.id)
+    
+    # Compétition ouverte : barème lu dans l'instantané
+    db.session.get(Competition, competition.id).is_open = True
+    db.session.commit()
+    instantane = instantanes.obtenir(competition.id)
+    matrice = charger_matrice(competition.id)
+    assert (matrice.voies_ids == attendu.voies_ids).all()
+    assert (matrice.scores == attendu.scores).all()
+    assert (matrice.ordres == attendu.ordres).all()
+    assert (matrice.derniere == attendu.derniere).all()
+    assert instantane.detail_validations() == detail_competition(competition.id)
+
+def test_sans_validation_departage_apres_les_grimpeurs_qui_ont_valide(client, competition):
+    departages = ('derniere_validation',)
+    niveau = Level(nom='Initiation', score=0)
+    voie = Voie(nom='Voie initiation', level=niveau)
+    db.session.add_all([niveau, voie])
+    db.session.flush()
+    cercle = Circle(x=1, y=1, radius=1, ordre=1, voie_id=voie.id)
+    db.session.add_all([cercle, CompetitionVoie(competition_id=competition.id, voie_id=voie.id)])
+    db.session.commit()
+    voie_id, cercle_id = voie.id, cercle.id
+    version = db.session.get(Competition, competition.id).classement_version
+    matrices_classement.classement(competition.id, version, departages)
+    
+    # Score nul mais une validation : devant les grimpeurs à 0 sans validation, matrice actualisée ou rechargée
+    resultat = classer(charger_matrice(competition.id), departages)
+    sans_validation = [i for i in range(len(resultat.totaux)) if resultat.nb_voies[i] == 0]
+    grimpeur_id = int(resultat.matrice.grimpeurs_ids[sans_validation[0]])
+    connecter(client, db.session.get(User, grimpeur_id))
+    reponse = client.post('/api/validate', json={'circle_id': cercle_id, 'voie_id': voie_id, 'competition_id': competition.id})
+    assert reponse.get_json()['success']
+    
+    db.session.expire_all()
+    version = db.session.get(Competition, competition.id).classement_version
+    for resultat in (matrices_classement.classement(competition.id, version, departages),
+                     classer(charger_matrice(competition.id), departages)):
+        i = resultat.matrice.index(grimpeur_id)
+        assert resultat.totaux[i] == 0
+        autres = [j for j in sans_validation if j != i]
+        assert autres and all(resultat.rangs[i] < resultat.rangs[j] for j in autres)
@@ -0,0 +1,14 @@
+# tests/test_plans_requetes.py - Requêtes fréquentes servies par leurs index (flask check-query-plans)
+from models import db
+from plans_requetes import verifier_plans
+
+def test_plans_utilisent_les_index(competition):
+    echecs = [(nom, plan) for nom, _, plan, conforme in verifier_plans() if not conforme]
+    assert echecs == []
+
+def test_index_supprime_detecte(competition):
+    db.session.execute(db.text('DROP INDEX ix_circle_voie_ordre'))
+    db.session.commit()
+    
+    echecs = [nom for nom, _, _, conforme in verifier_plans() if not conforme]
+    assert echecs == ['circles_voie']
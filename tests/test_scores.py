@@ -0,0 +1,13 @@
+# tests/test_scores.py - Calcul ensembliste des scores : même règle que ValidationGrimpeur.calculate_score
+from scores import totaux_competition
+from conftest import validations_particulieres, totaux_par_validation
+
+def test_totaux_egaux_au_calcul_par_validation(competition):
+    validations_particulieres(competition)
+    attendus = totaux_par_validation(competition.id)
+    
+    totaux = totaux_competition(competition.id)
+    assert totaux.keys() == attendus.keys()
+    for grimpeur_id, (total, nb_voies) in attendus.items():
+        assert abs(totaux[grimpeur_id]['score_total'] - total) < 1e-9
+        assert totaux[grimpeur_id]['nb_voies'] == nb_voies
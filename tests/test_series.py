@@ -0,0 +1,49 @@
+# tests/test_series.py - Classement de saison : places des étapes prises au moteur de classement
+import numpy as np
+from models import db, Competition, Categorie, CompetitionCategorie, ScoreGrimpeur, Serie, SerieCompetition
+from moteur_classement import matrices_classement, rangs_competition
+from series import ResultatsCompetition
+from conftest import connecter, ex_aequo
+
+def test_rangs_competition():
+    assert rangs_competition(np.array([1, 1, 2, 3, 3, 4])).tolist() == [1, 1, 3, 4, 4, 6]
+    assert rangs_competition(np.zeros(0, dtype=np.int64)).tolist() == []
+
+def test_places_des_etapes_du_moteur(app, competition):
+    departages = app.config['CLASSEMENT_DEPARTAGES']
+    modele_id, copie_id = ex_aequo(competition)
+    competition = db.session.get(Competition, competition.id)
+    resultats = ResultatsCompetition(competition.id)
+    resultats.actualiser(competition.classement_version, ScoreGrimpeur.query.filter_by(competition_id=competition.id).count())
+    
+    moteur = matrices_classement.classement(competition.id, competition.classement_version, departages)
+    open_id = db.session.query(Categorie.id).join(CompetitionCategorie)\
+        .filter(CompetitionCategorie.competition_id == competition.id, Categorie.genre == 'mixte').scalar()
+    for categorie_id, (grimpeurs, _, places) in resultats.par_categorie(departages).items():
+        for grimpeur_id, place in zip(grimpeurs.tolist(), places.tolist()):
+            i = moteur.matrice.index(grimpeur_id)
+            if moteur.nb_voies[i] == 0:
+                assert place == 0
+                continue
+            # Place « 1224 » : 1 + nombre de grimpeurs de la catégorie classés strictement devant
+            devant = [moteur.rangs[moteur.matrice.index(autre)] < moteur.rangs[i] for autre in grimpeurs.tolist()]
+            assert place == 1 + sum(devant)
+        if categorie_id == open_id:
+            places = dict(zip(grimpeurs.tolist(), places.tolist()))
+            assert places[modele_id] == places[copie_id] > 0
+            suivantes = sorted(p for p in places.values() if p > places[modele_id])
+            assert not suivantes or suivantes[0] >= places[modele_id] + 2
+
+def test_classement_serie_en_points(client, admin, competition):
+    serie = Serie(nom='Saison', agregation='points')
+    db.session.add(serie)
+    db.session.flush()
+    db.session.add(SerieCompetition(serie_id=serie.id, competition_id=competition.id))
+    db.session.commit()
+    
+    connecter(client, admin)
+    classement = client.get(f'/api/serie/{serie.id}/classement').get_json()
+    bareme = serie.bareme
+    for lignes in classement['classements'].values():
+        for ligne in lignes:
+            assert ligne['total'] in [0] + bareme
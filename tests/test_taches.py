@@ -0,0 +1,99 @@
+# tests/test_taches.py - File de tâches : tentatives comptées à la réservation, reprise au démarrage
+from datetime import datetime, timedelta
+import json
+import os
+import subprocess
+import sys
+import pytest
+from models import db, Tache
+from taches import TRAITEMENTS, file_taches
+
+def _tache(statut, tentatives, type_tache='test'):
+    tache = Tache(type=type_tache, parametres=json.dumps({}), statut=statut, tentatives=tentatives)
+    db.session.add(tache)
+    db.session.commit()
+    tache_id = tache.id
+    # Tâche abandonnée par un worker arrêté : date_maj au-delà du délai de reprise
+    Tache.query.filter_by(id=tache_id).update({'date_maj': datetime.utcnow() - timedelta(hours=1)})
+    db.session.commit()
+    return tache_id
+
+def test_reprise_limitee_aux_tentatives(app, monkeypatch):
+    executions = []
+    monkeypatch.setitem(TRAITEMENTS, 'test', lambda: executions.append(1) or {})
+    interrompue = _tache('en_cours', file_taches.tentatives_max)
+    a_reprendre = _tache('en_cours', 1)
+    
+    assert file_taches.reprendre() == 1
+    file_taches.attendre()
+    
+    db.session.expire_all()
+    assert db.session.get(Tache, interrompue).statut == 'echec'
+    tache = db.session.get(Tache, a_reprendre)
+    assert (tache.statut, tache.tentatives) == ('terminee', 2)
+    assert executions == [1]
+
+def test_echec_apres_tentatives_max(app, monkeypatch):
+    def echouer():
+        raise RuntimeError('boum')
+    monkeypatch.setitem(TRAITEMENTS, 'test', echouer)
+    tache_id = _tache('en_attente', file_taches.tentatives_max - 1)
+    
+    # Dernière tentative : pas de relance
+    file_taches.lancer(tache_id).result()
+    
+    db.session.expire_all()
+    tache = db.session.get(Tache, tache_id)
+    assert (tache.statut, tache.tentatives, tache.erreur) == ('echec', file_taches.tentatives_max, 'boum')
+
+# Worker gevent simulé dans un processus à part : monkey.patch_all() ne peut pas s'appliquer à pytest
+SCRIPT_GEVENT = """
+from gevent import monkey
+monkey.patch_all()
+import sys
+import time
+import gevent
+from app import create_app
+from models import db
+from taches import TRAITEMENTS, creer_tache, file_taches
+
+def calcul():
+    # Traitement CPU en Python pur (pire cas : le GIL n'est rendu qu'à l'intervalle de bascule)
+    fin = time.perf_counter() + 0.5
+    while time.perf_counter() < fin:
+        pass
+    return {}
+TRAITEMENTS['calcul'] = calcul
+
+app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': sys.argv[1], 'TACHES_WORKERS': 1})
+with app.app_context():
+    tache = creer_tache('calcul')
+    db.session.commit()
+    futur = file_taches.lancer(tache.id)
+    
+    ecarts = []
+    def horloge():
+        precedent = time.perf_counter()
+        while not futur.done():
+            gevent.sleep(0.01)
+            maintenant = time.perf_counter()
+            ecarts.append(maintenant - precedent)
+            precedent = maintenant
+    gevent.spawn(horloge).join()
+    futur.result()
+    print(len(ecarts), max(ecarts, default=0.0))
+"""
+
+def test_boucle_gevent_reactive_pendant_une_tache(tmp_path):
+    pytest.importorskip('gevent')
+    racine = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sortie = subprocess.run(
+        [sys.executable, '-c', SCRIPT_GEVENT, f"sqlite:///{tmp_path / 'gevent.db'}"],
+        cwd=racine, capture_output=True, text=True, timeout=60
+    )
+    assert sortie.returncode == 0, sortie.stderr
+    
+    # Tâche dans un thread système : l'horloge continue de tourner pendant la demi-seconde de calcul
+    nb_ecarts, ecart_max = sortie.stdout.split()[-2:]
+    assert int(nb_ecarts) >= 10
+    assert float(ecart_max) < 0.2
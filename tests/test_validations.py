@@ -0,0 +1,62 @@
+# tests/test_validations.py - Validations par le grimpeur et par un ouvreur/admin : mêmes contrôles, même écriture
+import sqlite3
+from sqlalchemy.exc import OperationalError
+from models import db, Competition, ScoreGrimpeur
+import validations
+from instantane import instantanes
+from conftest import connecter
+
+def _ouvrir(competition):
+    db.session.get(Competition, competition.id).is_open = True
+    db.session.commit()
+    return instantanes.obtenir(competition.id)
+
+def test_validation_admin_controle_le_cercle(client, admin, competition):
+    instantane = _ouvrir(competition)
+    grimpeur = competition.grimpeurs_test[5]
+    voie, autre = competition.voies_test[:2]
+    connecter(client, admin)
+    
+    # Cercle d'une autre voie : refusé comme par /api/validate
+    reponse = client.post('/api/admin/validate', json={
+        'grimpeur_id': grimpeur.id, 'voie_id': voie.id, 'competition_id': competition.id,
+        'circle_id': autre.circles.first().id
+    })
+    assert reponse.status_code == 400
+    
+    # Identifiants envoyés en chaînes : convertis avant l'écriture
+    reponse = client.post('/api/admin/validate', json={
+        'grimpeur_id': str(grimpeur.id), 'voie_id': str(voie.id), 'competition_id': str(competition.id),
+        'circle_id': str(voie.circles.first().id)
+    })
+    assert reponse.get_json()['success']
+    assert client.post('/api/admin/validate', json={
+        'grimpeur_id': 'x', 'voie_id': voie.id, 'competition_id': competition.id, 'circle_id': 1
+    }).status_code == 400
+    
+    # Totaux matérialisés égaux au détail calculé dans l'instantané
+    detail = instantane.validations_grimpeur(grimpeur.id)
+    score = ScoreGrimpeur.query.filter_by(competition_id=competition.id, grimpeur_id=grimpeur.id).one()
+    assert abs(score.score_total - sum(v['score'] for v in detail.values())) < 1e-9
+    assert score.nb_voies == len(detail)
+
+def test_validation_admin_rejouee_si_base_occupee(client, admin, competition, monkeypatch):
+    grimpeur = competition.grimpeurs_test[6]
+    voie = competition.voies_test[0]
+    upsert = validations.upsert_validation
+    appels = []
+    
+    def upsert_occupee(*args, **kwargs):
+        appels.append(args)
+        if len(appels) == 1:
+            raise OperationalError('INSERT', {}, sqlite3.OperationalError('database is locked'))
+        return upsert(*args, **kwargs)
+    monkeypatch.setattr(validations, 'upsert_validation', upsert_occupee)
+    
+    connecter(client, admin)
+    reponse = client.post('/api/admin/validate', json={
+        'grimpeur_id': grimpeur.id, 'voie_id': voie.id, 'competition_id': competition.id,
+        'circle_id': voie.circles.first().id, 'idempotency_key': 'cle-1'
+    })
+    assert reponse.get_json()['success']
+    assert len(appels) == 2
@@ -0,0 +1,76 @@
+# validations.py - Écriture idempotente des validations
+import json
+from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, ValidationGrimpeur, CleIdempotence
+from classement import maj_score_grimpeur
+
+_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+def upsert_validation(grimpeur_id, voie_id, competition_id, circle_id, horodatage=None):
+    """Enregistre la validation d'une voie en une instruction INSERT … ON CONFLICT DO UPDATE
+    
+    Une validation plus ancienne que celle déjà enregistrée (renvoi tardif) ne l'écrase pas.
+    """
+    horodatage = horodatage or datetime.utcnow()
+    valeurs = {
+        'grimpeur_id': grimpeur_id,
+        'voie_id': voie_id,
+        'competition_id': competition_id,
+        'circle_id': circle_id,
+        'datetime_creation': horodatage
+    }
+    
+    insert = _INSERTS.get(db.session.get_bind().dialect.name)
+    if insert is None:
+        return _upsert_orm(valeurs)
+    
+    table = ValidationGrimpeur.__table__
+    stmt = insert(table).values(**valeurs)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['grimpeur_id', 'voie_id', 'competition_id'],
+        set_={
+            'circle_id': stmt.excluded.circle_id,
+            'datetime_creation': stmt.excluded.datetime_creation
+        },
+        where=table.c.datetime_creation <= stmt.excluded.datetime_creation
+    )
+    db.session.execute(stmt)
+
+def _upsert_orm(valeurs):
+    """Repli lecture puis écriture pour les bases sans ON CONFLICT (la contrainte unique reste garante)"""
+    existing = ValidationGrimpeur.query.filter_by(
+        grimpeur_id=valeurs['grimpeur_id'],
+        voie_id=valeurs['voie_id'],
+        competition_id=valeurs['competition_id']
+    ).first()
+    
+    if existing is None:
+        db.session.add(ValidationGrimpeur(**valeurs))
+    elif existing.datetime_creation is None or existing.datetime_creation <= valeurs['datetime_creation']:
+        existing.circle_id = valeurs['circle_id']
+        existing.datetime_creation = valeurs['datetime_creation']
+    db.session.flush()
+
+def enregistrer_validation(grimpeur_id, voie_id, competition_id, circle_id, emetteur_id, cle):
+    """Transaction d'une validation unitaire (par le grimpeur ou un ouvreur/admin), pour profil_base.ecrire"""
+    upsert_validation(grimpeur_id, voie_id, competition_id, circle_id)
+    maj_score_grimpeur(competition_id, grimpeur_id)
+    memoriser_resultat(emetteur_id, cle, {'success': True})
+    db.session.commit()
+
+def resultat_idempotent(emetteur_id, cle):
+    """Résultat déjà renvoyé pour cette clé d'idempotence, ou None"""
+    if not cle:
+        return None
+    
+    deja = CleIdempotence.query.filter_by(grimpeur_id=emetteur_id, cle=cle).first()
+    return json.loads(deja.resultat) if deja else None
+
+def memoriser_resultat(emetteur_id, cle, resultat):
+    """Associe un résultat à une clé d'idempotence (dans la transaction de la validation)"""
+    if cle:
+        db.session.add(CleIdempotence(cle=cle, grimpeur_id=emetteur_id, resultat=json.dumps(resultat)))